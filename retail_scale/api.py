@@ -1,15 +1,40 @@
+import gzip
+import hashlib
+import mimetypes
+
 import frappe
 from frappe import _
-from frappe.utils.password import get_decrypted_password
+from werkzeug.wrappers import Response
+
+from retail_scale.metrics import instrument, render_prometheus_metrics
+from retail_scale.removal_key import (
+	has_removal_key,
+	is_assigned_pos_profile,
+	is_removal_throttled,
+	is_valid_removal_key,
+	record_failed_removal_attempt,
+	reset_removal_attempts,
+)
+from retail_scale.scale_formats import get_enabled_scale_formats
+from retail_scale.utils import (
+	flush_plu_export,
+	get_plu_export_targets,
+	get_plu_manifest_path,
+	get_scale_export_path,
+	read_plu_manifest,
+)
 
 
 @frappe.whitelist()
-def validate_pos_removal_password(entered_password):
+@instrument("removal_key_check")
+def validate_pos_removal_password(entered_password, pos_profile=None):
 	"""
 	Validate the password entered by user for POS item removal.
-	Compares the entered password with the pos_key field from Retail Settings singleton doctype.
+	Compares the entered password with the enabled POS Keys and the pos_key field
+	from Retail Settings, using cached salted hashes.
 	
 	:param entered_password: The password entered by the user
+	:param pos_profile: POS Profile of the terminal, failed attempts are throttled per terminal
 	:return: dict with 'success' (bool) and 'message' (str) keys
 	"""
 	if not entered_password:
@@ -18,29 +43,37 @@ def validate_pos_removal_password(entered_password):
 			"message": _("Password is required")
 		}
 	
+	# The terminal comes from the client, an unknown one would start a fresh attempt count
+	if pos_profile and not is_assigned_pos_profile(pos_profile):
+		return {
+			"success": False,
+			"message": _("POS Profile {0} is not assigned to you").format(pos_profile)
+		}
+	
+	terminal = pos_profile or frappe.local.request_ip
+	
 	try:
-		# Get the stored password from Retail Settings singleton doctype
-		# Password fields are stored encrypted in __Auth table
-		stored_password = get_decrypted_password(
-			doctype="Retail Settings",
-			name="Retail Settings",
-			fieldname="pos_key",
-			raise_exception=False
-		)
+		if is_removal_throttled(terminal):
+			return {
+				"success": False,
+				"message": _("Too many incorrect attempts. Please wait a few minutes and try again.")
+			}
 		
-		if not stored_password:
+		if not has_removal_key():
 			return {
 				"success": False,
 				"message": _("POS removal password is not configured. Please contact administrator.")
 			}
 		
 		# Compare passwords (case-sensitive)
-		if entered_password == stored_password:
+		if is_valid_removal_key(entered_password):
+			reset_removal_attempts(terminal)
 			return {
 				"success": True,
 				"message": _("Password verified successfully")
 			}
 		else:
+			record_failed_removal_attempt(terminal)
 			return {
 				"success": False,
 				"message": _("Incorrect password. Please try again.")
@@ -56,3 +89,132 @@ def validate_pos_removal_password(entered_password):
 			"message": _("An error occurred while validating password. Please try again.")
 		}
 
+
+
+@frappe.whitelist()
+def force_plu_export():
+	"""
+	Export PLU.txt now instead of waiting for the queued background export.
+
+	:return: dict with 'success' (bool) and 'message' (str) keys
+	"""
+	frappe.only_for("System Manager")
+
+	if flush_plu_export():
+		return {
+			"success": True,
+			"message": _("PLU export completed")
+		}
+
+	return {
+		"success": False,
+		"message": _("A PLU export is already running and will include pending changes")
+	}
+
+
+@frappe.whitelist()
+def get_scan_cache_stats():
+	"""
+	Get the hit/miss counters of the scale label item cache.
+
+	:return: dict with 'worker' (this worker) and 'site' (all workers) counters
+	"""
+	from retail_scale.scale_barcode import get_scale_item_cache_stats
+
+	frappe.only_for("System Manager")
+	return get_scale_item_cache_stats()
+
+
+@frappe.whitelist()
+@instrument("plu_catalog")
+def get_plu_catalog(since=None):
+	"""
+	Get the PLU catalog for offline scale label resolution in the POS.
+
+	:param since: Version token of the catalog the till already has, to get only the changes
+	:return: dict with 'version', 'full', 'fields', 'rows', 'removed', 'price_list' and 'rules' keys
+	"""
+	from retail_scale.plu_catalog import get_plu_catalog
+
+	return get_plu_catalog(since)
+
+
+@frappe.whitelist()
+def get_metrics():
+	"""
+	Get the latency histograms, SQL query counts, cache lookups and export sizes of the
+	site in the Prometheus text exposition format.
+
+	:return: text/plain response for a Prometheus scrape
+	"""
+	frappe.only_for("System Manager")
+	return Response(render_prometheus_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@frappe.whitelist(allow_guest=True, methods=["GET"])
+@instrument("plu_manifest")
+def get_plu_manifest(output_folder=None):
+	"""
+	Get the manifest of the PLU files of an export target, for polling scale management PCs.
+
+	:param output_folder: Output Folder of the export target, empty for the site-wide files
+	:return: dict with 'version', 'rows', 'generated_at' and 'files' keys
+	"""
+	return read_plu_manifest(get_plu_manifest_path(get_plu_export_folder(output_folder)))
+
+
+@frappe.whitelist(allow_guest=True, methods=["GET"])
+@instrument("plu_download")
+def download_plu_file(file_name=None, output_folder=None):
+	"""
+	Download a PLU file of an export target.
+
+	The ETag is the SHA-256 of the file from the manifest, so a client sending it back in
+	If-None-Match gets 304 Not Modified without the file being read. The file is gzip
+	compressed when the client accepts it.
+
+	:param file_name: File of an enabled scale format, the first format's file by default
+	:param output_folder: Output Folder of the export target, empty for the site-wide files
+	:return: the file, or an empty 304 response
+	"""
+	output_folder = get_plu_export_folder(output_folder)
+	file_names = [scale_format.file_name for scale_format in get_enabled_scale_formats()]
+	file_name = file_name or file_names[0]
+	if file_name not in file_names:
+		frappe.throw(_("PLU file {0} is not exported").format(file_name), frappe.DoesNotExistError)
+
+	info = (read_plu_manifest(get_plu_manifest_path(output_folder)).get("files") or {}).get(file_name)
+	if not info:
+		frappe.throw(_("PLU file {0} has not been exported yet").format(file_name), frappe.DoesNotExistError)
+
+	# The compressed body is another representation of the file, with its own ETag
+	use_gzip = "gzip" in frappe.request.accept_encodings
+	suffix = "-gzip" if use_gzip else ""
+	response = Response(
+		mimetype=mimetypes.guess_type(file_name)[0] or "text/plain",
+		headers={"Cache-Control": "no-cache", "Vary": "Accept-Encoding"},
+	)
+
+	if frappe.request.if_none_match.contains(info["sha256"] + suffix):
+		response.set_etag(info["sha256"] + suffix)
+		response.status_code = 304
+		return response
+
+	with open(get_scale_export_path(file_name, output_folder), "rb") as plu_file:
+		data = plu_file.read()
+
+	# Hash what is sent, the file may have been replaced after the manifest was read
+	response.set_etag(hashlib.sha256(data).hexdigest() + suffix)
+	if use_gzip:
+		data = gzip.compress(data)
+		response.headers["Content-Encoding"] = "gzip"
+	response.set_data(data)
+	return response
+
+
+def get_plu_export_folder(output_folder=None):
+	"""Check that `output_folder` belongs to an export target, only those can be downloaded"""
+	output_folder = (output_folder or "").strip("/")
+	if output_folder not in {target.output_folder for target in get_plu_export_targets()}:
+		frappe.throw(_("Unknown PLU export target {0}").format(output_folder), frappe.DoesNotExistError)
+	return output_folder
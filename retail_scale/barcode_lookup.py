@@ -0,0 +1,266 @@
+"""
+Barcode Lookup: every scannable code that is not a scale label, with what it resolves to.
+
+erpnext's scan_barcode tries Item Barcode, Serial No and Batch one after the other,
+so an unknown code costs three queries. The Barcode Lookup table has one row per
+code, maintained by the hooks of those doctypes with the same precedence, so a scan
+costs one primary key lookup. Codes that match nothing are remembered in Redis for
+BARCODE_MISS_TTL seconds and cost no query at all.
+"""
+
+from typing import NamedTuple
+
+import frappe
+from frappe import _
+from frappe.query_builder import DocType
+from frappe.utils import now
+
+# In the order erpnext's scan_barcode tries them, the first kind that knows a code wins
+BARCODE_KINDS = ("Item Barcode", "Serial No", "Batch")
+BARCODE_LOOKUP_FIELDS = ["kind", "item_code", "batch_no", "serial_no", "uom"]
+
+# One expiring key per code that matched nothing. Codes created without hooks (data
+# import, bulk inserts) are found again once the key has expired.
+BARCODE_MISS_KEY = "retail_scale:barcode_miss"
+BARCODE_MISS_TTL = 300  # seconds
+
+
+class BarcodeEntry(NamedTuple):
+	kind: str
+	item_code: str
+	batch_no: str | None = None
+	serial_no: str | None = None
+	uom: str | None = None
+
+
+def resolve_barcode(search_value, ctx=None):
+	"""
+	Resolve a barcode from the Barcode Lookup table, the way erpnext's scan_barcode does.
+
+	Returns the scan result, an empty dict for a code that recently matched nothing,
+	or None if the table does not know the code and the standard lookup has to run.
+	"""
+	if frappe.cache.get_value(get_barcode_miss_key(search_value), expires=True):
+		return {}
+
+	entry = frappe.db.get_value("Barcode Lookup", search_value, BARCODE_LOOKUP_FIELDS, as_dict=True)
+	if not entry:
+		return None
+
+	if entry.kind == "Item Barcode":
+		result = frappe._dict(barcode=search_value, item_code=entry.item_code, uom=entry.uom)
+	elif entry.kind == "Serial No":
+		result = frappe._dict(serial_no=entry.serial_no, item_code=entry.item_code, batch_no=entry.batch_no)
+	else:
+		if frappe.get_cached_value("Item", entry.item_code, "has_serial_no"):
+			frappe.throw(
+				_(
+					"Batch No {0} is linked with Item {1} which has serial no. Please scan serial no instead."
+				).format(entry.batch_no, entry.item_code)
+			)
+		result = frappe._dict(batch_no=entry.batch_no, item_code=entry.item_code)
+
+	from erpnext.stock.utils import _update_item_info
+
+	_update_item_info(result, frappe.parse_json(ctx) if ctx else None)
+	return result
+
+
+def get_barcode_miss_key(barcode):
+	return f"{BARCODE_MISS_KEY}:{barcode}"
+
+
+def record_barcode_scan(search_value, result):
+	"""
+	Learn from a scan the Barcode Lookup table could not answer.
+
+	A code that matched nothing is cached as a miss. A code the standard lookup found
+	was created without hooks, its row is added by a background job so the scan
+	itself does not write.
+	"""
+	if not search_value:
+		return
+
+	if not result or not result.get("item_code"):
+		frappe.cache.set_value(get_barcode_miss_key(search_value), 1, expires_in_sec=BARCODE_MISS_TTL)
+		return
+
+	frappe.enqueue(
+		"retail_scale.barcode_lookup.refresh_barcode_lookup",
+		barcodes=[search_value],
+		job_id=f"retail_scale:barcode_lookup:{search_value}",
+		deduplicate=True,
+	)
+
+
+def find_barcode_source(barcode, exclude_kind=None):
+	"""
+	Find what a code resolves to in the source doctypes, with erpnext's precedence.
+
+	`exclude_kind` skips one kind, for the document that is being deleted. Returns a
+	BarcodeEntry or None.
+	"""
+	if exclude_kind != "Item Barcode":
+		item_barcode = frappe.db.get_value(
+			"Item Barcode",
+			{"barcode": barcode, "parenttype": "Item"},
+			["parent", "uom"],
+			as_dict=True,
+		)
+		if item_barcode:
+			return BarcodeEntry("Item Barcode", item_barcode.parent, uom=item_barcode.uom)
+
+	if exclude_kind != "Serial No":
+		serial_no = frappe.db.get_value("Serial No", barcode, ["item_code", "batch_no"], as_dict=True)
+		if serial_no:
+			return BarcodeEntry(
+				"Serial No", serial_no.item_code, batch_no=serial_no.batch_no, serial_no=barcode
+			)
+
+	if exclude_kind != "Batch":
+		item_code = frappe.db.get_value("Batch", barcode, "item")
+		if item_code:
+			return BarcodeEntry("Batch", item_code, batch_no=barcode)
+
+	return None
+
+
+def set_barcode_lookup(barcode, entry, force=False):
+	"""
+	Point a code at `entry`, unless a kind with precedence already owns it.
+
+	`force` overwrites any row, for entries found with find_barcode_source.
+	"""
+	current = frappe.db.get_value("Barcode Lookup", barcode, BARCODE_LOOKUP_FIELDS, as_dict=True)
+	if current:
+		if BarcodeEntry(**current) == entry:
+			return
+		if not force and BARCODE_KINDS.index(current.kind) < BARCODE_KINDS.index(entry.kind):
+			return
+		frappe.db.set_value("Barcode Lookup", barcode, entry._asdict())
+	else:
+		frappe.get_doc({"doctype": "Barcode Lookup", "barcode": barcode, **entry._asdict()}).db_insert()
+
+	# The code may have been scanned before it existed
+	frappe.db.after_commit.add(lambda: frappe.cache.delete_value(get_barcode_miss_key(barcode)))
+
+
+def refresh_barcode_lookup(barcodes, exclude_kind=None):
+	"""Resolve some codes from the source doctypes again and update or delete their rows"""
+	for barcode in barcodes:
+		if entry := find_barcode_source(barcode, exclude_kind):
+			set_barcode_lookup(barcode, entry, force=True)
+		else:
+			frappe.db.delete("Barcode Lookup", {"name": barcode})
+
+
+def update_item_barcodes(doc, method=None):
+	"""Item on_update: sync the rows of the item's barcodes table"""
+	barcodes = {row.barcode: row.uom for row in doc.get("barcodes") or [] if row.barcode}
+
+	previous = doc.get_doc_before_save()
+	if previous and barcodes == {
+		row.barcode: row.uom for row in previous.get("barcodes") or [] if row.barcode
+	}:
+		return
+
+	existing = frappe.get_all(
+		"Barcode Lookup",
+		filters={"item_code": doc.name, "kind": "Item Barcode"},
+		pluck="name",
+	)
+	# Removed barcodes may still be a Serial No or Batch
+	if removed := set(existing) - barcodes.keys():
+		refresh_barcode_lookup(removed)
+
+	for barcode, uom in barcodes.items():
+		set_barcode_lookup(barcode, BarcodeEntry("Item Barcode", doc.name, uom=uom))
+
+
+def remove_item_barcodes(doc, method=None):
+	"""Item on_trash: its barcodes go, unless a Serial No or Batch has the same code"""
+	refresh_barcode_lookup(
+		[row.barcode for row in doc.get("barcodes") or [] if row.barcode], exclude_kind="Item Barcode"
+	)
+
+
+def update_serial_no_barcode(doc, method=None):
+	"""Serial No on_update"""
+	set_barcode_lookup(
+		doc.name, BarcodeEntry("Serial No", doc.item_code, batch_no=doc.batch_no, serial_no=doc.name)
+	)
+
+
+def update_batch_barcode(doc, method=None):
+	"""Batch on_update"""
+	set_barcode_lookup(doc.name, BarcodeEntry("Batch", doc.item, batch_no=doc.name))
+
+
+def remove_barcode(doc, method=None):
+	"""Serial No and Batch on_trash"""
+	refresh_barcode_lookup([doc.name], exclude_kind=doc.doctype)
+
+
+def rename_barcode(doc, method=None, old_name=None, new_name=None, merge=False):
+	"""Serial No and Batch after_rename: the code is the name"""
+	refresh_barcode_lookup([old_name, new_name])
+
+
+def rebuild_barcode_lookup():
+	"""
+	Rebuild the Barcode Lookup table from Item Barcode, Serial No and Batch, for
+	backfill or repair.
+
+	Returns the number of rows in the table.
+	"""
+	frappe.db.delete("Barcode Lookup")
+
+	item_barcode = DocType("Item Barcode")
+	serial_no = DocType("Serial No")
+	batch = DocType("Batch")
+
+	# In precedence order, a code already written by a previous kind is skipped
+	sources = (
+		(
+			(row.barcode, BarcodeEntry("Item Barcode", row.parent, uom=row.uom))
+			for row in frappe.qb.from_(item_barcode)
+			.select(item_barcode.barcode, item_barcode.parent, item_barcode.uom)
+			.where((item_barcode.parenttype == "Item") & (item_barcode.barcode != ""))
+			.run(as_dict=True)
+		),
+		(
+			(row.name, BarcodeEntry("Serial No", row.item_code, batch_no=row.batch_no, serial_no=row.name))
+			for row in frappe.qb.from_(serial_no)
+			.select(serial_no.name, serial_no.item_code, serial_no.batch_no)
+			.run(as_dict=True)
+		),
+		(
+			(row.name, BarcodeEntry("Batch", row.item, batch_no=row.name))
+			for row in frappe.qb.from_(batch).select(batch.name, batch.item).run(as_dict=True)
+		),
+	)
+
+	timestamp = now()
+	user = frappe.session.user
+	for source in sources:
+		frappe.db.bulk_insert(
+			"Barcode Lookup",
+			fields=[
+				"name",
+				"barcode",
+				*BARCODE_LOOKUP_FIELDS,
+				"creation",
+				"modified",
+				"owner",
+				"modified_by",
+			],
+			values=[
+				(barcode, barcode, *entry, timestamp, timestamp, user, user)
+				for barcode, entry in source
+				if entry.item_code
+			],
+			ignore_duplicates=True,
+		)
+
+	frappe.cache.delete_keys(BARCODE_MISS_KEY)
+	return frappe.db.count("Barcode Lookup")
@@ -0,0 +1,348 @@
+"""
+Synthetic retail catalog for the benchmarks.
+
+Everything is inserted in the current transaction, the runner rolls it back when the
+benchmarks are done. Items, prices and invoices are bulk inserted with the fields the
+measured code reads, without running their controllers.
+"""
+
+import random
+
+import frappe
+from frappe.utils import add_days, flt, now, nowdate
+
+from retail_scale.return_ledger import rebuild_return_ledger
+from retail_scale.scale_barcode import clear_scale_barcode_rules
+from retail_scale.utils import PLU_PRICE_LIST
+
+FIXTURE_PREFIX = "RSB"
+# Weighed labels of the fixture: 29-PPPPP-WWWWW (prefix=29, PLU code, weight in grams)
+SCALE_RULE = {
+	"prefix": "29",
+	"barcode_length": 12,
+	"label_type": "Weight",
+	"item_code_source": "PLU Code",
+	"item_code_offset": 2,
+	"item_code_length": 5,
+	"value_offset": 7,
+	"value_length": 5,
+	"divisor": 1000,
+}
+
+
+def make_fixture(
+	items=1000,
+	group_depth=3,
+	group_width=3,
+	prices_per_item=3,
+	invoices=50,
+	rows_per_invoice=20,
+	returns_per_invoice=3,
+	seed=0,
+):
+	"""
+	Insert a synthetic catalog and configure Retail Settings to use it.
+
+	Returns a dict with the root PLU group, the item codes, one weighed label per item
+	and the names of the original POS Invoices.
+	"""
+	rng = random.Random(seed)
+
+	root_group, leaf_groups = make_item_groups(group_depth, group_width)
+	item_codes = make_items(items, leaf_groups, rng)
+	make_item_prices(item_codes, prices_per_item, rng)
+	configure_retail_settings(root_group)
+
+	barcodes = [make_label(plu_code, rng.randint(50, 5000)) for plu_code in range(1, len(item_codes) + 1)]
+	invoice_names = make_pos_invoices(invoices, rows_per_invoice, returns_per_invoice, item_codes, rng)
+
+	return frappe._dict(
+		root_group=root_group,
+		item_codes=item_codes,
+		barcodes=barcodes,
+		invoices=invoice_names,
+	)
+
+
+def make_label(plu_code, grams):
+	return f"{SCALE_RULE['prefix']}{plu_code:05d}{grams:05d}"
+
+
+def make_item_groups(depth, width):
+	"""Build a tree of `depth` levels with `width` children per group, returns (root, leaves)"""
+	root = insert_item_group(f"{FIXTURE_PREFIX} Catalog", "All Item Groups", is_group=depth > 0)
+	level = [root]
+	for depth_index in range(depth):
+		is_group = depth_index < depth - 1
+		level = [
+			insert_item_group(f"{parent} {child_index}", parent, is_group)
+			for parent in level
+			for child_index in range(width)
+		]
+
+	return root, level
+
+
+def insert_item_group(name, parent, is_group):
+	return (
+		frappe.get_doc(
+			{
+				"doctype": "Item Group",
+				"item_group_name": name,
+				"parent_item_group": parent,
+				"is_group": int(is_group),
+			}
+		)
+		.insert(ignore_permissions=True)
+		.name
+	)
+
+
+def make_items(count, groups, rng):
+	timestamp = now()
+	user = frappe.session.user
+	item_codes = [f"{FIXTURE_PREFIX}-{index:06d}" for index in range(1, count + 1)]
+
+	frappe.db.bulk_insert(
+		"Item",
+		fields=[
+			"name",
+			"item_code",
+			"item_name",
+			"item_group",
+			"stock_uom",
+			"is_stock_item",
+			"disabled",
+			"standard_rate",
+			"custom_plu_code",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+		],
+		values=[
+			(
+				item_code,
+				item_code,
+				f"Loose Item {plu_code}",
+				groups[plu_code % len(groups)],
+				"Kg",
+				0,
+				0,
+				flt(rng.uniform(1, 50), 2),
+				plu_code,
+				timestamp,
+				timestamp,
+				user,
+				user,
+			)
+			for plu_code, item_code in enumerate(item_codes, start=1)
+		],
+	)
+
+	return item_codes
+
+
+def make_item_prices(item_codes, prices_per_item, rng):
+	"""
+	Layer `prices_per_item` consecutive 30-day validity windows per item, ending with an
+	open-ended current price, plus one price that only starts tomorrow.
+	"""
+	timestamp = now()
+	user = frappe.session.user
+	today = nowdate()
+	currency = frappe.db.get_value("Price List", PLU_PRICE_LIST, "currency")
+
+	values = []
+	for item_code in item_codes:
+		windows = [
+			(add_days(today, -30 * (layer + 1)), add_days(today, -30 * layer - 1) if layer else None)
+			for layer in range(prices_per_item)
+		]
+		windows.append((add_days(today, 1), None))
+		for valid_from, valid_upto in windows:
+			values.append(
+				(
+					frappe.generate_hash(length=10),
+					item_code,
+					PLU_PRICE_LIST,
+					1,
+					currency,
+					flt(rng.uniform(1, 50), 2),
+					valid_from,
+					valid_upto,
+					timestamp,
+					timestamp,
+					user,
+					user,
+				)
+			)
+
+	frappe.db.bulk_insert(
+		"Item Price",
+		fields=[
+			"name",
+			"item_code",
+			"price_list",
+			"selling",
+			"currency",
+			"price_list_rate",
+			"valid_from",
+			"valid_upto",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+		],
+		values=values,
+	)
+
+
+def configure_retail_settings(root_group):
+	"""Point the PLU group at the fixture and put its scale rule before any configured one"""
+	frappe.db.set_single_value("Retail Settings", "plu_group", root_group)
+	frappe.db.bulk_insert(
+		"Scale Barcode Rule",
+		fields=["name", "parent", "parenttype", "parentfield", "idx", "enabled", *SCALE_RULE],
+		values=[
+			(
+				frappe.generate_hash(length=10),
+				"Retail Settings",
+				"Retail Settings",
+				"scale_barcode_rules",
+				0,
+				1,
+				*SCALE_RULE.values(),
+			)
+		],
+	)
+	# The rules are compiled once per site, drop the ones compiled without the fixture rule
+	clear_scale_barcode_rules()
+
+
+def make_pos_invoices(count, rows_per_invoice, returns_per_invoice, item_codes, rng):
+	"""
+	Insert submitted POS Invoices and partial returns against them.
+
+	Each return takes back a third of the quantity of every `returns_per_invoice`-th row,
+	starting from a different row, and the return ledger is rebuilt for every invoice.
+	"""
+	timestamp = now()
+	user = frappe.session.user
+	today = nowdate()
+	customer = f"{FIXTURE_PREFIX} Customer"
+
+	invoice_values = []
+	item_values = []
+
+	def add_invoice(name, return_against=None):
+		invoice_values.append(
+			(
+				name,
+				customer,
+				today,
+				1,
+				int(bool(return_against)),
+				return_against,
+				timestamp,
+				timestamp,
+				user,
+				user,
+			)
+		)
+
+	def add_item(parent, idx, item_code, barcode, qty, rate, pos_invoice_item=None):
+		item_values.append(
+			(
+				f"{parent}-{idx:03d}",
+				parent,
+				"POS Invoice",
+				"items",
+				idx,
+				1,
+				item_code,
+				barcode,
+				qty,
+				qty,
+				"Kg",
+				"Kg",
+				1,
+				rate,
+				flt(qty * rate, 2),
+				pos_invoice_item,
+				timestamp,
+				timestamp,
+				user,
+				user,
+			)
+		)
+
+	invoice_names = []
+	for invoice_index in range(1, count + 1):
+		invoice = f"{FIXTURE_PREFIX}-POS-{invoice_index:05d}"
+		invoice_names.append(invoice)
+		add_invoice(invoice)
+
+		rows = []
+		for idx in range(1, rows_per_invoice + 1):
+			plu_code = rng.randint(1, len(item_codes))
+			grams = rng.randint(50, 5000)
+			rate = flt(rng.uniform(1, 50), 2)
+			add_item(invoice, idx, item_codes[plu_code - 1], make_label(plu_code, grams), grams / 1000, rate)
+			rows.append((f"{invoice}-{idx:03d}", item_codes[plu_code - 1], grams / 1000, rate))
+
+		for return_index in range(returns_per_invoice):
+			return_invoice = f"{invoice}-R{return_index}"
+			add_invoice(return_invoice, invoice)
+			for idx, (row_name, item_code, qty, rate) in enumerate(
+				rows[return_index::returns_per_invoice], 1
+			):
+				add_item(return_invoice, idx, item_code, "", -flt(qty / 3, 3), rate, row_name)
+
+	frappe.db.bulk_insert(
+		"POS Invoice",
+		fields=[
+			"name",
+			"customer",
+			"posting_date",
+			"docstatus",
+			"is_return",
+			"return_against",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+		],
+		values=invoice_values,
+	)
+	frappe.db.bulk_insert(
+		"POS Invoice Item",
+		fields=[
+			"name",
+			"parent",
+			"parenttype",
+			"parentfield",
+			"idx",
+			"docstatus",
+			"item_code",
+			"barcode",
+			"qty",
+			"stock_qty",
+			"uom",
+			"stock_uom",
+			"conversion_factor",
+			"rate",
+			"amount",
+			"pos_invoice_item",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+		],
+		values=item_values,
+	)
+
+	for invoice in invoice_names:
+		rebuild_return_ledger(invoice)
+
+	return invoice_names
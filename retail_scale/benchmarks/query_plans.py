@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+
+import frappe
+from frappe import _
+from frappe.utils import getdate
+
+from retail_scale import utils
+from retail_scale.benchmarks.fixture import make_fixture
+from retail_scale.benchmarks.runner import clear_caches
+from retail_scale.overrides.pos_return_utils import get_return_against_items
+from retail_scale.return_ledger import (
+	get_ledger_returned_qty_map,
+	get_returned_qty_map,
+	rebuild_return_ledger,
+)
+from retail_scale.scale_barcode import clear_scale_item_cache, get_scale_item, parse_scale_barcode
+
+# Tables that grow with the catalog and the sales, a full scan of these fails the check.
+# Aliased tables show up under their alias.
+WATCHED_TABLES = {
+	"tabItem",
+	"tabItem Price",
+	"tabPOS Invoice",
+	"tabPOS Invoice Item",
+	"tabPOS Return Ledger",
+	"original_invoice",
+}
+
+
+@contextmanager
+def capture_queries():
+	"""Collect the (query, values) of the SELECT queries run through frappe.db.sql in the block"""
+	queries = []
+	sql = frappe.db.sql
+
+	def capturing_sql(query, values=(), *args, **kwargs):
+		if str(query).lstrip().lower().startswith("select"):
+			queries.append((str(query), values))
+		return sql(query, values, *args, **kwargs)
+
+	frappe.db.sql = capturing_sql
+	try:
+		yield queries
+	finally:
+		frappe.db.sql = sql
+
+
+def get_query_plan_cases(fixture):
+	"""Get the hot paths as a dict of name -> (func, setup)"""
+	plu_item_groups = utils.get_plu_item_groups()
+	invoice = fixture.invoices[0]
+	customer = frappe.db.get_value("POS Invoice", invoice, "customer")
+	label = parse_scale_barcode(fixture.barcodes[0])
+	today = getdate()
+
+	return {
+		"PLU export (full)": (lambda: list(utils.iter_plu_items(plu_item_groups)), None),
+		"PLU export (changed items)": (
+			lambda: list(utils.iter_plu_items(plu_item_groups, fixture.item_codes[:50])),
+			None,
+		),
+		"effective prices": (lambda: utils.get_effective_prices(fixture.item_codes[:1000]), None),
+		"next price change": (utils.get_next_price_change, None),
+		"price rollover items": (lambda: utils.get_price_changed_items(today, today), None),
+		"PLU reconciliation": (lambda: utils.get_modified_plu_item_codes(today), None),
+		"PLU code uniqueness": (
+			lambda: utils.validate_plu_code(frappe.get_doc("Item", fixture.item_codes[0])),
+			None,
+		),
+		"scale label lookup": (lambda: get_scale_item(label), clear_scale_item_cache),
+		"returned quantities": (lambda: get_returned_qty_map(invoice, customer), None),
+		"return ledger": (lambda: get_ledger_returned_qty_map(invoice), None),
+		"return ledger rebuild": (lambda: rebuild_return_ledger(invoice), None),
+		"get_return_against_items": (lambda: get_return_against_items(invoice), None),
+	}
+
+
+def find_full_scans(query, values):
+	"""EXPLAIN a query and return the watched tables it reads with a full table scan"""
+	plan = frappe.db.sql(f"EXPLAIN {query}", values, as_dict=True)
+	return sorted({row.table for row in plan if row.type == "ALL" and row.table in WATCHED_TABLES})
+
+
+def check_query_plans(**sizes):
+	"""
+	Build the synthetic fixture, EXPLAIN every query of the hot paths and roll back.
+
+	The fixture must be large enough for the optimizer to prefer the indexes, the
+	defaults of make_fixture are. Returns a list of messages, one per query that
+	scans a watched table in full; empty when every query uses an index.
+	"""
+	if frappe.db.db_type != "mariadb":
+		frappe.throw(_("Query plans can only be checked on MariaDB"))
+
+	failures = []
+	try:
+		fixture = make_fixture(**sizes)
+		clear_caches()
+
+		for name, (func, setup) in get_query_plan_cases(fixture).items():
+			if setup:
+				setup()
+			with capture_queries() as queries:
+				func()
+
+			for query, values in queries:
+				if tables := find_full_scans(query, values):
+					failures.append(f"{name}: full scan of {', '.join(tables)} in {' '.join(query.split())}")
+	finally:
+		frappe.db.rollback()
+		clear_caches()
+
+	return failures
@@ -0,0 +1,186 @@
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import frappe
+from frappe.utils import now
+
+from retail_scale import utils
+from retail_scale.benchmarks.fixture import make_fixture
+from retail_scale.metrics import count_queries
+from retail_scale.overrides.barcode_utils import custom_scan_barcode, custom_search_by_term
+from retail_scale.overrides.pos_return_utils import get_return_against_items
+from retail_scale.scale_barcode import clear_scale_barcode_rules, clear_scale_item_cache
+
+# Relative wall time increase over the baseline reported as a regression
+DEFAULT_THRESHOLD = 0.2
+
+
+def measure(func, repeat=5, setup=None):
+	"""
+	Measure a benchmark case.
+
+	Runs `func` `repeat` times for the wall time and query count, then once more under
+	tracemalloc for the peak memory, so tracing does not skew the timings. `setup` runs
+	before every call, outside the measurement.
+	"""
+	timings = []
+	queries = []
+	for _ in range(repeat):
+		if setup:
+			setup()
+		with count_queries() as counter:
+			start = time.perf_counter()
+			func()
+			timings.append(time.perf_counter() - start)
+		queries.append(counter.count)
+
+	if setup:
+		setup()
+	tracemalloc.start()
+	try:
+		func()
+		peak_memory = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+	return {
+		"wall_time": statistics.median(timings),
+		"min_wall_time": min(timings),
+		"queries": max(queries),
+		"peak_memory": peak_memory,
+	}
+
+
+def get_benchmark_cases(fixture):
+	"""Get the benchmark cases as a dict of name -> (func, setup)"""
+	barcodes = iter(fixture.barcodes * 1000)
+	invoices = iter(fixture.invoices * 1000)
+	changed_items = set(fixture.item_codes[:: max(len(fixture.item_codes) // 10, 1)])
+	warehouse = frappe.db.get_value("Warehouse", {"is_group": 0}, "name")
+
+	def export_full():
+		# Without an index every target is rebuilt from the full catalog
+		for target in utils.get_plu_export_targets():
+			path = utils.get_plu_index_path(target.output_folder)
+			if os.path.exists(path):
+				os.remove(path)
+
+	def run_export(item_codes=None):
+		if not utils.export_loose_items_to_plu(item_codes):
+			raise frappe.ValidationError("PLU export failed, see the Error Log")
+
+	return {
+		"export_loose_items_to_plu (full)": (run_export, export_full),
+		"export_loose_items_to_plu (10% changed)": (lambda: run_export(changed_items), None),
+		"custom_scan_barcode (cold cache)": (
+			lambda: custom_scan_barcode(next(barcodes)),
+			clear_scale_item_cache,
+		),
+		# The same label again and again, answered from the worker's own cache
+		"custom_scan_barcode (warm cache)": (lambda: custom_scan_barcode(fixture.barcodes[0]), None),
+		"custom_search_by_term": (
+			lambda: custom_search_by_term(next(barcodes), warehouse, utils.PLU_PRICE_LIST),
+			None,
+		),
+		"get_return_against_items": (lambda: get_return_against_items(next(invoices)), None),
+	}
+
+
+def clear_caches():
+	utils.plu_group_cache.clear()
+	clear_scale_barcode_rules()
+	clear_scale_item_cache()
+
+
+def run_benchmarks(repeat=5, **sizes):
+	"""
+	Build the synthetic fixture, run every benchmark case and roll the fixture back.
+
+	PLU.txt and its index are written to a temporary directory. Returns the results as
+	a dict ready to be saved as JSON.
+	"""
+	results = {}
+	with tempfile.TemporaryDirectory() as output_dir:
+		try:
+			fixture_start = time.perf_counter()
+			fixture = make_fixture(**sizes)
+			fixture_time = time.perf_counter() - fixture_start
+			clear_caches()
+
+			with (
+				patch.object(
+					utils,
+					"get_scale_export_path",
+					lambda file_name, output_folder=None: os.path.join(
+						output_dir, output_folder or "", file_name
+					),
+				),
+				patch.object(
+					utils,
+					"get_plu_index_path",
+					lambda output_folder=None: os.path.join(
+						output_dir, f"PLU.{output_folder or 'site'}.index"
+					),
+				),
+			):
+				for name, (func, setup) in get_benchmark_cases(fixture).items():
+					results[name] = measure(func, repeat, setup)
+		finally:
+			frappe.db.rollback()
+			# Cached groups, rules and items of the fixture must not outlive it
+			clear_caches()
+
+	return {
+		"meta": {
+			"created": now(),
+			"site": frappe.local.site,
+			"python": platform.python_version(),
+			"versions": {
+				app: frappe.get_attr(f"{app}.__version__") for app in ("frappe", "erpnext", "retail_scale")
+			},
+			"sizes": sizes,
+			"repeat": repeat,
+			"fixture_time": fixture_time,
+		},
+		"results": results,
+	}
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+	"""
+	Compare a run against a baseline run.
+
+	Returns a list of messages, one per case that got slower than the threshold allows
+	or runs more queries than in the baseline.
+	"""
+	regressions = []
+	for name, result in results["results"].items():
+		base = baseline["results"].get(name)
+		if not base:
+			continue
+
+		if result["wall_time"] > base["wall_time"] * (1 + threshold):
+			regressions.append(
+				f"{name}: wall time {result['wall_time']:.4f}s vs {base['wall_time']:.4f}s "
+				f"(+{result['wall_time'] / base['wall_time'] - 1:.0%})"
+			)
+		if result["queries"] > base["queries"]:
+			regressions.append(f"{name}: {result['queries']} queries vs {base['queries']}")
+
+	return regressions
+
+
+def save_results(results, path):
+	with open(path, "w") as f:
+		json.dump(results, f, indent=1)
+
+
+def load_results(path):
+	with open(path) as f:
+		return json.load(f)
@@ -0,0 +1,223 @@
+import pickle
+from collections import Counter, OrderedDict
+
+import frappe
+
+# Lookups counted on a worker before its hit/miss counters are added to the site totals
+STATS_FLUSH_INTERVAL = 100
+# Deleted keys logged for the other workers before a delete clears the whole cache instead
+MAX_DELETED_KEYS = 10000
+
+
+class WorkerCache:
+	"""
+	Per-worker cache in front of a Redis hash, kept per site.
+
+	Values are read from the worker's own copy first, then from the Redis hash and
+	finally from the generator. Clearing the cache stores a new generation token in
+	Redis, deleting keys appends them to a log of deleted keys. Each worker reads the
+	token and the length of the log once per request and drops its copy, or only the
+	keys deleted since its last request, so an invalidation on one worker reaches all
+	others on their next request.
+
+	Lookups are counted as local hits, Redis hits or misses per worker and added to
+	per-site totals in Redis every STATS_FLUSH_INTERVAL lookups.
+	"""
+
+	def __init__(self, name, maxsize=None):
+		self.name = name
+		self.maxsize = maxsize
+		self.generation_key = f"{name}:generation"
+		self.deleted_key = f"{name}:deleted"
+		self.stats_key = f"{name}:stats"
+		self._sites = {}
+		self._stats = {}
+		self._unflushed_stats = {}
+
+	def get(self, key, generator=None):
+		local = self._get_local()
+		if key in local:
+			if self.maxsize:
+				local.move_to_end(key)
+			self._count("local_hits")
+			return local[key]
+
+		value = frappe.cache.hget(self.name, key)
+		if value is not None:
+			self._count("redis_hits")
+		else:
+			self._count("misses")
+			if generator:
+				value = generator()
+				if value is not None:
+					frappe.cache.hset(self.name, key, value)
+
+		if value is not None:
+			self._set_local(local, key, value)
+
+		return value
+
+	def get_many(self, keys):
+		"""Return a dict of the cached values for `keys`, leaving out the ones not cached"""
+		local = self._get_local()
+		values = {}
+		for key in keys:
+			if key in local:
+				values[key] = local[key]
+				self._count("local_hits")
+
+		missing = [key for key in keys if key not in values]
+		if not missing:
+			return values
+
+		# One HMGET for all the keys missing locally. The pipeline talks to Redis directly,
+		# so values are unpickled the way RedisWrapper.hget does
+		pipeline = frappe.cache.pipeline()
+		pipeline.hmget(frappe.cache.make_key(self.name), missing)
+		(cached,) = pipeline.execute()
+		for key, value in zip(missing, cached, strict=True):
+			if value is not None:
+				values[key] = pickle.loads(value)
+				self._set_local(local, key, values[key])
+				self._count("redis_hits")
+			else:
+				self._count("misses")
+
+		return values
+
+	def set(self, key, value):
+		frappe.cache.hset(self.name, key, value)
+		self._set_local(self._get_local(), key, value)
+
+	def set_many(self, mapping):
+		"""Store many values in the Redis hash with one round trip"""
+		if not mapping:
+			return
+
+		# The pipeline talks to Redis directly, so values are pickled the way
+		# RedisWrapper.hset stores them
+		name = frappe.cache.make_key(self.name)
+		pipeline = frappe.cache.pipeline()
+		pipeline.hset(name, mapping={key: pickle.dumps(value) for key, value in mapping.items()})
+		pipeline.execute()
+		frappe.local.cache.pop(name, None)
+
+	def delete(self, *keys):
+		"""
+		Drop some keys on every worker of the current site.
+
+		Keys that are not in the Redis hash are not cached by any worker, deleting them
+		costs one round trip and is not broadcast.
+		"""
+		keys = [key for key in keys if key is not None]
+		if not keys:
+			return
+
+		local = self._get_local()
+		for key in keys:
+			local.pop(key, None)
+
+		name = frappe.cache.make_key(self.name)
+		pipeline = frappe.cache.pipeline()
+		pipeline.hdel(name, *keys)
+		(removed,) = pipeline.execute()
+		frappe.local.cache.pop(name, None)
+		if not removed:
+			return
+
+		pipeline.rpush(frappe.cache.make_key(self.deleted_key), *keys)
+		(deleted,) = pipeline.execute()
+		if deleted > MAX_DELETED_KEYS:
+			self.clear()
+
+	def clear(self):
+		"""Drop the cached values on every worker of the current site"""
+		frappe.cache.delete_value([self.name, self.deleted_key])
+		self._new_generation()
+		self._sites.pop(frappe.local.site, None)
+
+	def get_stats(self):
+		"""Get the hit/miss counters of this worker and the totals of the site"""
+		self.flush_stats()
+		fields = ("local_hits", "redis_hits", "misses")
+		pipeline = frappe.cache.pipeline()
+		pipeline.hmget(frappe.cache.make_key(self.stats_key), fields)
+		(totals,) = pipeline.execute()
+		return {
+			"worker": {field: self._stats.get(frappe.local.site, Counter())[field] for field in fields},
+			"site": {field: int(total or 0) for field, total in zip(fields, totals, strict=True)},
+		}
+
+	def flush_stats(self):
+		"""Add the counters of this worker to the site totals in Redis"""
+		pending = self._unflushed_stats.pop(frappe.local.site, None)
+		if not pending:
+			return
+
+		key = frappe.cache.make_key(self.stats_key)
+		pipeline = frappe.cache.pipeline()
+		for field, count in pending.items():
+			pipeline.hincrby(key, field, count)
+		pipeline.execute()
+
+	def _count(self, field):
+		site = frappe.local.site
+		self._stats.setdefault(site, Counter())[field] += 1
+		pending = self._unflushed_stats.setdefault(site, Counter())
+		pending[field] += 1
+		if pending.total() >= STATS_FLUSH_INTERVAL:
+			self.flush_stats()
+
+	def _get_local(self):
+		generation, deleted = self._get_state()
+
+		local = self._sites.get(frappe.local.site)
+		if local is None or local.generation != generation or local.deleted > deleted:
+			local = self._sites[frappe.local.site] = LocalCopy(generation, deleted)
+		elif local.deleted < deleted:
+			# Drop the keys deleted by other workers since the last request
+			pipeline = frappe.cache.pipeline()
+			pipeline.lrange(frappe.cache.make_key(self.deleted_key), local.deleted, deleted - 1)
+			(keys,) = pipeline.execute()
+			for key in keys:
+				local.values.pop(key.decode(), None)
+			local.deleted = deleted
+
+		return local.values
+
+	def _get_state(self):
+		"""Get the generation and the length of the deleted keys log, read once per request"""
+		state_key = frappe.cache.make_key(f"{self.name}:state")
+		if state := frappe.local.cache.get(state_key):
+			return state
+
+		pipeline = frappe.cache.pipeline(transaction=True)
+		pipeline.get(frappe.cache.make_key(self.generation_key))
+		pipeline.llen(frappe.cache.make_key(self.deleted_key))
+		generation, deleted = pipeline.execute()
+		generation = pickle.loads(generation) if generation is not None else self._new_generation()
+
+		frappe.local.cache[state_key] = (generation, deleted)
+		return generation, deleted
+
+	def _set_local(self, local, key, value):
+		local[key] = value
+		if self.maxsize and len(local) > self.maxsize:
+			local.popitem(last=False)
+
+	def _new_generation(self):
+		generation = frappe.generate_hash(length=10)
+		frappe.cache.set_value(self.generation_key, generation)
+		frappe.local.cache.pop(frappe.cache.make_key(f"{self.name}:state"), None)
+		return generation
+
+
+class LocalCopy:
+	"""A worker's copy of a WorkerCache, with the generation and deleted keys it has seen"""
+
+	__slots__ = ("deleted", "generation", "values")
+
+	def __init__(self, generation, deleted):
+		self.generation = generation
+		self.deleted = deleted
+		self.values = OrderedDict()
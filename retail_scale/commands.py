@@ -0,0 +1,157 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-pos-return-ledger")
+@click.option("--invoice", help="Rebuild the rows of one original POS Invoice only")
+@pass_context
+def rebuild_pos_return_ledger(context, invoice=None):
+	"""Rebuild the POS Return Ledger from the submitted return POS Invoices"""
+	import frappe
+
+	from retail_scale.return_ledger import rebuild_return_ledger
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		count = rebuild_return_ledger(invoice)
+		frappe.db.commit()
+	finally:
+		frappe.destroy()
+
+	click.echo(f"Rebuilt {count} POS Return Ledger rows")
+
+
+@click.command("rebuild-barcode-lookup")
+@pass_context
+def rebuild_barcode_lookup(context):
+	"""Rebuild the Barcode Lookup table from Item Barcodes, Serial Nos and Batches"""
+	import frappe
+
+	from retail_scale.barcode_lookup import rebuild_barcode_lookup
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		count = rebuild_barcode_lookup()
+		frappe.db.commit()
+	finally:
+		frappe.destroy()
+
+	click.echo(f"Rebuilt {count} Barcode Lookup rows")
+
+
+@click.command("run-retail-scale-benchmarks")
+@click.option("--items", default=1000, help="Number of PLU items")
+@click.option("--group-depth", default=3, help="Levels of Item Groups below the PLU group")
+@click.option("--group-width", default=3, help="Child groups per Item Group")
+@click.option("--prices-per-item", default=3, help="Layered Item Price validity windows per item")
+@click.option("--invoices", default=50, help="Number of original POS Invoices")
+@click.option("--rows-per-invoice", default=20, help="Item rows per POS Invoice")
+@click.option("--returns-per-invoice", default=3, help="Partial returns per POS Invoice")
+@click.option("--repeat", default=5, help="Measured runs per benchmark")
+@click.option("--output", help="Save the results to this JSON file")
+@click.option("--baseline", help="Compare with the results saved in this JSON file")
+@click.option("--threshold", default=0.2, help="Allowed relative wall time increase over the baseline")
+@pass_context
+def run_retail_scale_benchmarks(context, output=None, baseline=None, threshold=0.2, repeat=5, **sizes):
+	"""Benchmark PLU export, scale label scans and return lookups on a synthetic catalog.
+
+	The catalog is inserted in a transaction that is rolled back afterwards, run it on a
+	development site.
+	"""
+	import frappe
+
+	from retail_scale.benchmarks.runner import compare_results, load_results, run_benchmarks, save_results
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		results = run_benchmarks(repeat=repeat, **sizes)
+	finally:
+		frappe.destroy()
+
+	for name, result in results["results"].items():
+		click.echo(
+			f"{name:<45} {result['wall_time'] * 1000:>10.2f} ms {result['queries']:>6} queries "
+			f"{result['peak_memory'] / 1024:>10.0f} KiB"
+		)
+
+	if output:
+		save_results(results, output)
+
+	if baseline:
+		regressions = compare_results(results, load_results(baseline), threshold)
+		if regressions:
+			click.echo("\n".join(["Regressions against the baseline:", *regressions]))
+			raise SystemExit(1)
+
+
+@click.command("check-retail-scale-query-plans")
+@click.option("--items", default=1000, help="Number of PLU items")
+@click.option("--invoices", default=50, help="Number of original POS Invoices")
+@pass_context
+def check_retail_scale_query_plans(context, **sizes):
+	"""Fail if a query of the PLU export, price or return lookups scans a large table in full.
+
+	The queries run on a synthetic catalog that is rolled back afterwards, run it on a
+	development site after `bench migrate`.
+	"""
+	import frappe
+
+	from retail_scale.benchmarks.query_plans import check_query_plans
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		failures = check_query_plans(**sizes)
+	finally:
+		frappe.destroy()
+
+	if failures:
+		click.echo("\n".join(["Queries without a usable index:", *failures]))
+		raise SystemExit(1)
+
+	click.echo("Every checked query uses an index")
+
+
+@click.command("push-plu-to-scales")
+@click.option("--full", is_flag=True, help="Send every scale its full PLU table")
+@pass_context
+def push_plu_to_scales(context, full=False):
+	"""Push the exported PLU tables to the Scale Devices in Retail Settings"""
+	import frappe
+
+	from retail_scale.scale_push import push_plu_to_scales
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		results = push_plu_to_scales(full=full)
+		frappe.db.commit()
+	finally:
+		frappe.destroy()
+
+	for result in results:
+		status = "ok" if result.success else f"failed: {result.error}"
+		click.echo(
+			f"{result.device.scale_name:<30} {result.device.key:<21} {result.records:>7} records "
+			f"{result.attempts:>2} attempts  {status}"
+		)
+
+	if any(not result.success for result in results):
+		raise SystemExit(1)
+
+
+commands = [
+	rebuild_pos_return_ledger,
+	rebuild_barcode_lookup,
+	run_retail_scale_benchmarks,
+	check_retail_scale_query_plans,
+	push_plu_to_scales,
+]
@@ -0,0 +1,148 @@
+"""
+Fake scales speaking the push protocol of retail_scale.scale_push, for throughput and
+failure tests on one machine. Does not need a site:
+
+	python -m retail_scale.fake_scale --scales 40 --port 9100 --failure-rate 0.1
+
+starts 40 scales on 127.0.0.1:9100-9139. Point Scale Devices at them and run
+`bench --site <site> push-plu-to-scales`.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+
+class FakeScale:
+	"""
+	One scale: keeps its PLU table in memory and applies FULL and DELTA sessions.
+
+	`failure_rate` of the sessions fail at random, either by dropping the connection,
+	answering ERR or stalling for `stall` seconds, so retries and timeouts of the
+	pushing side can be exercised. `record_delay` simulates a slow scale.
+	"""
+
+	def __init__(self, port, failure_rate=0.0, record_delay=0.0, stall=30.0):
+		self.port = port
+		self.failure_rate = failure_rate
+		self.record_delay = record_delay
+		self.stall = stall
+		self.plu_table = {}
+		self.stats = Counter()
+
+	async def handle(self, reader, writer):
+		try:
+			reply = await self.receive(reader)
+			if reply:
+				writer.write(f"{reply}\n".encode())
+				await writer.drain()
+		except (ConnectionError, asyncio.IncompleteReadError):
+			self.stats["broken"] += 1
+		finally:
+			writer.close()
+
+	async def receive(self, reader):
+		header = (await reader.readline()).decode().split()
+		if (
+			len(header) != 3
+			or header[0] != "BEGIN"
+			or header[1] not in ("FULL", "DELTA")
+			or not header[2].isdigit()
+		):
+			self.stats["invalid"] += 1
+			return "ERR invalid header"
+
+		kind, count = header[1], int(header[2])
+		records = [(await reader.readline()).decode().rstrip("\n") for _record in range(count)]
+		if (await reader.readline()).decode().strip() != "COMMIT":
+			self.stats["invalid"] += 1
+			return "ERR missing COMMIT"
+
+		if random.random() < self.failure_rate:
+			return await self.fail()
+
+		if self.record_delay:
+			await asyncio.sleep(self.record_delay * count)
+
+		table = {} if kind == "FULL" else dict(self.plu_table)
+		for record in records:
+			action, _separator, record_data = record.partition(" ")
+			plu_code, _separator, line = record_data.partition(" ")
+			if not plu_code.isdigit():
+				action = None
+			if action == "U" and line:
+				table[int(plu_code)] = line
+			elif action == "D":
+				table.pop(int(plu_code), None)
+			else:
+				self.stats["invalid"] += 1
+				return f"ERR invalid record {record!r}"
+
+		# Applied all at once, like a scale committing its table
+		self.plu_table = table
+		self.stats[kind.lower()] += 1
+		self.stats["records"] += count
+		return f"OK {count}"
+
+	async def fail(self):
+		failure = random.choice(("drop", "error", "stall"))
+		self.stats[failure] += 1
+		if failure == "error":
+			return "ERR busy"
+		if failure == "stall":
+			await asyncio.sleep(self.stall)
+		return None
+
+
+async def serve(host, port, scales, failure_rate, record_delay, stall, report_interval):
+	fake_scales = [FakeScale(port + i, failure_rate, record_delay, stall) for i in range(scales)]
+	servers = [await asyncio.start_server(scale.handle, host, scale.port) for scale in fake_scales]
+	print(f"{scales} fake scales listening on {host}:{port}-{port + scales - 1}")
+
+	started = time.monotonic()
+	try:
+		while True:
+			await asyncio.sleep(report_interval)
+			totals = sum((scale.stats for scale in fake_scales), Counter())
+			rows = sorted({len(scale.plu_table) for scale in fake_scales})
+			print(
+				f"{time.monotonic() - started:>8.0f}s  sessions {totals['full']} full / {totals['delta']} delta, "
+				f"{totals['records']} records, failed {totals['drop']} dropped / {totals['error']} errors / "
+				f"{totals['stall']} stalled, PLU rows per scale {rows}"
+			)
+	finally:
+		for server in servers:
+			server.close()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Run fake scales for the retail_scale push service")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=9100, help="Port of the first scale")
+	parser.add_argument("--scales", type=int, default=40, help="Number of scales, on consecutive ports")
+	parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of sessions that fail, 0 to 1")
+	parser.add_argument("--record-delay", type=float, default=0.0, help="Seconds a scale takes per record")
+	parser.add_argument("--stall", type=float, default=30.0, help="Seconds a stalled session hangs")
+	parser.add_argument("--report-interval", type=float, default=5.0, help="Seconds between statistics")
+	args = parser.parse_args()
+
+	try:
+		asyncio.run(
+			serve(
+				args.host,
+				args.port,
+				args.scales,
+				args.failure_rate,
+				args.record_delay,
+				args.stall,
+				args.report_interval,
+			)
+		)
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
@@ -83,7 +83,7 @@ page_js = {"point-of-sale": "public/js/pos_custom.js"}
 # ------------
 
 # before_install = "retail_scale.install.before_install"
-# after_install = "retail_scale.install.after_install"
+after_install = "retail_scale.install.after_install"
 
 # Uninstallation
 # ------------
@@ -147,35 +147,91 @@ page_js = {"point-of-sale": "public/js/pos_custom.js"}
 
 doc_events = {
     "Item": {
-        "on_update": "retail_scale.utils.export_to_jhma",
-        "after_insert": "retail_scale.utils.export_to_jhma"
+        "validate": "retail_scale.utils.validate_plu_code",
+        "on_update": [
+            "retail_scale.utils.export_to_jhma",
+            "retail_scale.scale_barcode.invalidate_scale_item",
+            "retail_scale.barcode_lookup.update_item_barcodes"
+        ],
+        "after_rename": [
+            "retail_scale.utils.export_to_jhma",
+            "retail_scale.scale_barcode.invalidate_scale_item"
+        ],
+        "on_trash": [
+            "retail_scale.utils.export_to_jhma",
+            "retail_scale.scale_barcode.invalidate_scale_item",
+            "retail_scale.barcode_lookup.remove_item_barcodes"
+        ]
+    },
+    "Serial No": {
+        "on_update": "retail_scale.barcode_lookup.update_serial_no_barcode",
+        "after_rename": "retail_scale.barcode_lookup.rename_barcode",
+        "on_trash": "retail_scale.barcode_lookup.remove_barcode"
+    },
+    "Batch": {
+        "on_update": "retail_scale.barcode_lookup.update_batch_barcode",
+        "after_rename": "retail_scale.barcode_lookup.rename_barcode",
+        "on_trash": "retail_scale.barcode_lookup.remove_barcode"
     },
     "Item Price": {
         "on_update": "retail_scale.utils.export_to_jhma",
-        "after_insert": "retail_scale.utils.export_to_jhma"
+        "on_trash": "retail_scale.utils.export_to_jhma"
+    },
+    "Item Group": {
+        "after_insert": "retail_scale.utils.clear_plu_group_cache",
+        "on_update": [
+            "retail_scale.utils.clear_plu_group_cache",
+            "retail_scale.scale_barcode.clear_scale_item_cache"
+        ],
+        "after_rename": [
+            "retail_scale.utils.clear_plu_group_cache",
+            "retail_scale.scale_barcode.clear_scale_item_cache"
+        ],
+        "on_trash": [
+            "retail_scale.utils.clear_plu_group_cache",
+            "retail_scale.scale_barcode.clear_scale_item_cache"
+        ]
+    },
+    "Retail Settings": {
+        "validate": [
+            "retail_scale.utils.validate_plu_export_targets",
+            "retail_scale.scale_push.validate_scale_devices"
+        ],
+        "on_update": [
+            "retail_scale.utils.clear_plu_group_cache",
+            "retail_scale.utils.clear_plu_export_targets",
+            "retail_scale.scale_barcode.clear_scale_barcode_rules",
+            "retail_scale.scale_barcode.clear_scale_item_cache",
+            "retail_scale.removal_key.clear_removal_key_cache"
+        ]
+    },
+    "POS Profile": {
+        "on_update": "retail_scale.utils.clear_plu_export_targets"
+    },
+    "POS Key": {
+        "on_update": "retail_scale.removal_key.clear_removal_key_cache",
+        "after_rename": "retail_scale.removal_key.clear_removal_key_cache",
+        "on_trash": "retail_scale.removal_key.clear_removal_key_cache"
+    },
+    "POS Invoice": {
+        "on_submit": "retail_scale.return_ledger.update_return_ledger",
+        "on_cancel": "retail_scale.return_ledger.update_return_ledger"
     }
 }
 
 # Scheduled Tasks
 # ---------------
 
-# scheduler_events = {
-# 	"all": [
-# 		"retail_scale.tasks.all"
-# 	],
-# 	"daily": [
-# 		"retail_scale.tasks.daily"
-# 	],
-# 	"hourly": [
-# 		"retail_scale.tasks.hourly"
-# 	],
-# 	"weekly": [
-# 		"retail_scale.tasks.weekly"
-# 	],
-# 	"monthly": [
-# 		"retail_scale.tasks.monthly"
-# 	],
-# }
+scheduler_events = {
+	"all": [
+		"retail_scale.utils.enqueue_dirty_plu_export",
+		"retail_scale.scale_push.enqueue_dirty_scale_push"
+	],
+	"hourly": [
+		"retail_scale.utils.roll_over_plu_prices",
+		"retail_scale.utils.reconcile_plu_items"
+	],
+}
 
 # Testing
 # -------
@@ -205,6 +261,8 @@ override_whitelisted_methods = {
 # -----------------------------------------------------------
 
 # ignore_links_on_delete = ["Communication", "ToDo"]
+# Barcode Lookup rows are maintained by the on_trash hooks of what they point to
+ignore_links_on_delete = ["Barcode Lookup"]
 
 # Request Events
 # ----------------
@@ -259,4 +317,4 @@ before_request = ["retail_scale.overrides.barcode_utils.patch_scan_barcode_impor
 # List of apps whose translatable strings should be excluded from this app's translations.
 # ignore_translatable_strings_from = []
 
-fixtures = [{"dt": "DocType", "filters": [["name", "=", "Retail Settings"]]}]
\ No newline at end of file
+fixtures = [{"dt": "DocType", "filters": [["name", "=", "Retail Settings"]]}]
@@ -0,0 +1,11 @@
+from retail_scale.barcode_lookup import rebuild_barcode_lookup
+from retail_scale.patches.v1_0.add_plu_and_return_indexes import add_indexes
+from retail_scale.return_ledger import rebuild_return_ledger
+
+
+def after_install():
+	# Patches are marked as done on install without running, add what they would have
+	add_indexes()
+	# The app can be installed on a site that already has returns and barcodes
+	rebuild_return_ledger()
+	rebuild_barcode_lookup()
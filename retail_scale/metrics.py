@@ -0,0 +1,184 @@
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+import frappe
+
+# Latency histogram buckets in seconds, Prometheus style
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Seconds a worker aggregates observations before adding them to the site totals in Redis
+METRICS_FLUSH_INTERVAL = 10
+METRICS_KEY = "retail_scale:metrics"
+METRICS_GAUGES_KEY = "retail_scale:metrics:gauges"
+
+# Per worker and site: pending counters and the time of the last flush
+_pending = {}
+_last_flush = {}
+
+
+class QueryCounter:
+	def __init__(self):
+		self.count = 0
+
+
+@contextmanager
+def count_queries():
+	"""Count the SQL queries run through frappe.db.sql in the block"""
+	counter = QueryCounter()
+	sql = frappe.db.sql
+
+	def counted_sql(*args, **kwargs):
+		counter.count += 1
+		return sql(*args, **kwargs)
+
+	frappe.db.sql = counted_sql
+	try:
+		yield counter
+	finally:
+		frappe.db.sql = sql
+
+
+def instrument(endpoint):
+	"""
+	Record the latency, SQL query count and errors of every call of a function.
+
+	Apply below @frappe.whitelist() so the whitelisted method is the instrumented one.
+	"""
+
+	def decorator(func):
+		@wraps(func)
+		def wrapper(*args, **kwargs):
+			start = time.perf_counter()
+			failed = True
+			with count_queries() as counter:
+				try:
+					result = func(*args, **kwargs)
+					failed = False
+					return result
+				finally:
+					observe(endpoint, time.perf_counter() - start, counter.count, failed)
+
+		return wrapper
+
+	return decorator
+
+
+def observe(endpoint, duration, queries=0, failed=False):
+	pending = _pending.setdefault(frappe.local.site, Counter())
+	bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if duration <= bound), len(LATENCY_BUCKETS))
+	pending[f"{endpoint}|bucket|{bucket}"] += 1
+	pending[f"{endpoint}|sum"] += duration
+	pending[f"{endpoint}|count"] += 1
+	pending[f"{endpoint}|queries"] += queries
+	if failed:
+		pending[f"{endpoint}|errors"] += 1
+
+	if time.monotonic() - _last_flush.get(frappe.local.site, 0) >= METRICS_FLUSH_INTERVAL:
+		flush_metrics()
+
+
+def flush_metrics():
+	"""Add the observations of this worker to the site totals in Redis"""
+	_last_flush[frappe.local.site] = time.monotonic()
+	pending = _pending.pop(frappe.local.site, None)
+	if not pending:
+		return
+
+	key = frappe.cache.make_key(METRICS_KEY)
+	pipeline = frappe.cache.pipeline()
+	for field, value in pending.items():
+		pipeline.hincrbyfloat(key, field, value)
+	pipeline.execute()
+
+
+def set_gauge(name, value):
+	"""Store the latest value of a gauge for the site, like the size of the last export"""
+	frappe.cache.hset(METRICS_GAUGES_KEY, name, value)
+
+
+def is_log_sampled():
+	"""Whether to log this call, as configured by the log sample rate in Retail Settings"""
+	rate = frappe.get_cached_doc("Retail Settings").log_sample_rate
+	return bool(rate) and random.random() * 100 < rate
+
+
+def log_sampled(message, *args):
+	"""Log an info message for the configured sample of calls, formatted only when logged"""
+	if is_log_sampled():
+		frappe.logger("retail_scale").info(message, *args)
+
+
+def get_worker_caches():
+	from retail_scale.removal_key import removal_key_cache
+	from retail_scale.scale_barcode import rule_cache, scale_item_cache
+	from retail_scale.utils import plu_group_cache
+
+	return {
+		"plu_item_groups": plu_group_cache,
+		"scale_barcode_rules": rule_cache,
+		"scale_items": scale_item_cache,
+		"pos_removal_keys": removal_key_cache,
+	}
+
+
+def render_prometheus_metrics():
+	"""Render the site totals in the Prometheus text exposition format"""
+	flush_metrics()
+
+	# Counters are incremented natively in Redis, read them with the raw client
+	pipeline = frappe.cache.pipeline()
+	pipeline.hgetall(frappe.cache.make_key(METRICS_KEY))
+	(counters,) = pipeline.execute()
+
+	totals = {}
+	for field, value in counters.items():
+		endpoint, _, name = frappe.safe_decode(field).partition("|")
+		totals.setdefault(endpoint, {})[name] = float(value)
+
+	lines = [
+		"# HELP retail_scale_duration_seconds Latency of the instrumented entry points",
+		"# TYPE retail_scale_duration_seconds histogram",
+	]
+	for endpoint, values in sorted(totals.items()):
+		cumulative = 0
+		for i, bound in enumerate(LATENCY_BUCKETS):
+			cumulative += values.get(f"bucket|{i}", 0)
+			lines.append(
+				f'retail_scale_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative:g}'
+			)
+		lines.append(
+			f'retail_scale_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {values.get("count", 0):g}'
+		)
+		lines.append(f'retail_scale_duration_seconds_sum{{endpoint="{endpoint}"}} {values.get("sum", 0)}')
+		lines.append(
+			f'retail_scale_duration_seconds_count{{endpoint="{endpoint}"}} {values.get("count", 0):g}'
+		)
+
+	lines += [
+		"# HELP retail_scale_sql_queries_total SQL queries run by the instrumented entry points",
+		"# TYPE retail_scale_sql_queries_total counter",
+		*(
+			f'retail_scale_sql_queries_total{{endpoint="{endpoint}"}} {values.get("queries", 0):g}'
+			for endpoint, values in sorted(totals.items())
+		),
+		"# HELP retail_scale_errors_total Calls of the instrumented entry points that raised",
+		"# TYPE retail_scale_errors_total counter",
+		*(
+			f'retail_scale_errors_total{{endpoint="{endpoint}"}} {values.get("errors", 0):g}'
+			for endpoint, values in sorted(totals.items())
+		),
+		"# HELP retail_scale_cache_lookups_total Worker cache lookups by result",
+		"# TYPE retail_scale_cache_lookups_total counter",
+	]
+	for name, cache in get_worker_caches().items():
+		for result, count in cache.get_stats()["site"].items():
+			lines.append(f'retail_scale_cache_lookups_total{{cache="{name}",result="{result}"}} {count}')
+
+	gauges = frappe.cache.hgetall(METRICS_GAUGES_KEY) or {}
+	for name, value in sorted(gauges.items()):
+		name = frappe.safe_decode(name)
+		lines += [f"# TYPE retail_scale_{name} gauge", f"retail_scale_{name} {value}"]
+
+	return "\n".join(lines) + "\n"
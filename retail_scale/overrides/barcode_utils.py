@@ -1,15 +1,24 @@
 import frappe
+from frappe import _
+from frappe.utils import flt
 from erpnext.stock.utils import scan_barcode as original_scan_barcode
 from erpnext.selling.page.point_of_sale.point_of_sale import search_by_term as _original_search_by_term
 
+from retail_scale.barcode_lookup import record_barcode_scan, resolve_barcode
+from retail_scale.metrics import instrument
+from retail_scale.scale_barcode import get_scale_item, get_scale_items, parse_scale_barcode
+from retail_scale.utils import PLU_PRICE_LIST, get_effective_prices
+
 # frappe.utils.logger.set_log_level("DEBUG")
 # logger = frappe.logger("retail_scale.overrides.barcode_utils", allow_site=True, file_count=50)
 
 @frappe.whitelist()
+@instrument("scan")
 def custom_scan_barcode(search_value: str, ctx: dict | str | None = None):
     """
-    Custom barcode scanner that handles dynamic barcodes with embedded weight
-    Format: [PREFIX][ITEM_CODE][WEIGHT]
+    Custom barcode scanner that handles dynamic barcodes with embedded weight or price
+    Format: [PREFIX][ITEM_CODE][WEIGHT or PRICE][CHECK DIGIT], as configured in the
+    Scale Barcode Rules of Retail Settings
     Example: 21-12345-00500 (prefix=21, item_code=12345, weight=500g)
     """
     
@@ -17,48 +26,38 @@ def custom_scan_barcode(search_value: str, ctx: dict | str | None = None):
     # logger.debug(f"🔍 Custom Barcode Scanner - Received: {search_value}")
     # logger.debug(f"🔍 Barcode length: {len(search_value)}, Starts with 21: {search_value.startswith('21')}")
     
-    # Check if this is a dynamic barcode with your prefix
-    if search_value.startswith("21") and len(search_value) == 12:
+    # Check if this is a dynamic barcode matching one of the scale barcode rules
+    label = parse_scale_barcode(search_value)
+    if label:
         # logger.debug(f"✅ Dynamic barcode detected! Processing...")
         
         try:
-            prefix = search_value[0:2]  # "21"
-            item_code = search_value[2:7]  # 5 digits
-            weight_str = search_value[7:12]  # 5 digits
-            
-            # logger.debug(f"📊 Parsed - Prefix: {prefix}, Item Code: {item_code}, Weight String: {weight_str}")
-            
-            # Convert weight (assuming it's in grams, last 5 digits)
-            weight_kg = float(weight_str) / 1000  # Convert grams to kg
-            # logger.debug(f"⚖️  Weight converted: {weight_str}g = {weight_kg}kg")
-            
-            # Store qty in thread-local for use by search_by_term
-            frappe.local.dynamic_barcode_qty = weight_kg
+            # logger.debug(f"📊 Parsed - Code: {label.code}, Value: {label.value}, Rule: {label.rule}")
             
-            # Lookup the item by the embedded item code
-            # You might need to pad or format the item_code based on your naming
-            # For example, if your items are named "ITEM-00001", adjust accordingly
-            item_exists = frappe.db.exists("Item", item_code)
-            # logger.debug(f"🔎 Item lookup - Code: {item_code}, Exists: {item_exists}")
-
-            if item_exists:
-                # Return the item with the scanned weight as quantity
-                result = {
-                    "item_code": item_code,
-                    "qty": weight_kg,  # Set quantity to the scanned weight
-                    "barcode": search_value,  # Keep original barcode for reference
-                }
+            # Lookup the item by the embedded item code or PLU code
+            item = get_scale_item(label)
+            # logger.debug(f"🔎 Item lookup - Code: {label.code}, Found: {item}")
+
+            if item:
+                ctx = frappe.parse_json(ctx) if ctx else None
+                rate = get_price_label_rates([item["item_code"]], ctx)[item["item_code"]] if label.is_price else None
+                
+                # Return the item with the scanned weight (or the quantity derived from
+                # the printed price) as quantity
+                result = get_scale_scan_result(label, item, search_value, rate)
                 
                 # logger.debug(f"✅ Returning result: {result}")
                 
-                # Get item debug (batch/serial flags)
-                from erpnext.stock.utils import _update_item_info
-                _update_item_info(result, frappe.parse_json(ctx) if ctx else None)
+                # Item debug (batch/serial flags) comes from the scale item cache, only
+                # context-dependent details need erpnext's lookup
+                if ctx:
+                    from erpnext.stock.utils import _update_item_info
+                    _update_item_info(result, ctx)
                 
                 # logger.debug(f"✅ Final result after _update_item_info: {result}")
                 return result
             # else:
-            #     logger.warning(f"⚠️  Item not found: {item_code}. Falling back to standard lookup.")
+            #     logger.warning(f"⚠️  Item not found: {label.code}. Falling back to standard lookup.")
                 
         except (ValueError, IndexError) as e:
             # If parsing fails, fall back to standard barcode lookup
@@ -67,35 +66,180 @@ def custom_scan_barcode(search_value: str, ctx: dict | str | None = None):
     # else:
     #     logger.debug(f"ℹ️  Not a dynamic barcode. Falling back to standard scan_barcode.")
     
-    # Clear any stored qty for standard barcodes
-    frappe.local.dynamic_barcode_qty = None
-    
-    # Fall back to the original scan_barcode function for standard barcodes
-    result = original_scan_barcode(search_value, ctx)
+    # Fall back to the Barcode Lookup table and the standard lookup for standard barcodes
+    result = scan_standard_barcode(search_value, ctx)
     # logger.debug(f"🔙 Standard barcode result: {result}")
     return result
 
 
-def custom_search_by_term(search_term, warehouse, price_list):
-    """Wrapper that preserves qty from dynamic barcode scanning"""
-    # Call the ORIGINAL saved function (not the patched one - avoids recursion)
-    result = _original_search_by_term(search_term, warehouse, price_list)
+@frappe.whitelist()
+@instrument("scan_batch")
+def custom_scan_barcodes(barcodes: list | str, ctx: dict | str | None = None, price_list: str | None = None):
+    """
+    Scan several barcodes in one request, e.g. a basket of weighed packs.
+    
+    Scale labels are parsed in one pass and their items are resolved together, with
+    at most one query per item code source for the codes that are not cached yet.
+    Other barcodes go through the standard lookup one by one.
+    
+    Price-embedded labels are split into qty and rate with the rates of `price_list`,
+    the POS Profile's selling price list, or of the price list in `ctx`. Every other
+    item comes back with its rate in that price list too, so the cart can check and
+    add the whole basket without asking for each item.
+    
+    Returns one entry per barcode, in the input order. Barcodes that cannot be
+    resolved come back as {"barcode": ..., "error": ...}.
+    """
+    barcodes = frappe.parse_json(barcodes) if isinstance(barcodes, str) else barcodes
+    ctx = frappe.parse_json(ctx) if ctx else None
+    
+    labels = {barcode: parse_scale_barcode(barcode) for barcode in barcodes}
+    items = get_scale_items([label for label in labels.values() if label])
     
-    # Check if we have a dynamic barcode qty stored
-    qty = getattr(frappe.local, 'dynamic_barcode_qty', None)
+    scale_item_codes = {items[label]["item_code"] for label in labels.values() if label and items.get(label)}
+    price_ctx = {**(ctx or {}), "price_list": price_list} if price_list else ctx
+    rates = get_price_label_rates(scale_item_codes, price_ctx) if scale_item_codes else {}
     
-    if qty and result and result.get("items"):
-        # Add qty field to each item
-        for item in result["items"]:
-            item["qty"] = qty
-        # logger.debug(f"✅ Added qty={qty} to item in search result")
+    results = []
+    for barcode in barcodes:
+        label = labels[barcode]
+        item = items.get(label) if label else None
+        
+        try:
+            if item:
+                result = get_scale_scan_result(label, item, barcode, rates.get(item["item_code"]))
+                if ctx:
+                    from erpnext.stock.utils import _update_item_info
+                    _update_item_info(result, ctx)
+            else:
+                # Fall back to the Barcode Lookup table and the standard lookup for standard barcodes
+                result = scan_standard_barcode(barcode, ctx) or {}
+        except Exception as e:
+            result = {"error": str(e)}
         
-        # Clear after use
-        frappe.local.dynamic_barcode_qty = None
+        if not result.get("item_code"):
+            result = {
+                "barcode": barcode,
+                "error": result.get("error") or _("No item found for barcode {0}").format(barcode),
+            }
+        
+        results.append(result)
+    
+    # Rates of the items found with standard barcodes, in one more query
+    if missing := {result["item_code"] for result in results if "error" not in result} - rates.keys():
+        rates.update(get_price_label_rates(missing, price_ctx))
+    
+    for result in results:
+        if "error" not in result and not result.get("rate"):
+            result["rate"] = rates.get(result["item_code"])
+    
+    return results
+
+
+def scan_standard_barcode(search_value, ctx=None):
+    """
+    Resolve a barcode that is not a scale label.
+    
+    The Barcode Lookup table answers with one primary key query, or none for a code
+    that recently matched nothing. Codes it does not know go through erpnext's
+    scan_barcode, whose outcome is recorded for the next scan.
+    """
+    result = resolve_barcode(search_value, ctx)
+    if result is None:
+        result = original_scan_barcode(search_value, ctx)
+        record_barcode_scan(search_value, result)
     
     return result
 
 
+def get_scale_scan_result(label, item, barcode, rate=None):
+    """Build the scan result for a scale label whose item has been resolved"""
+    result = {
+        "item_code": item["item_code"],
+        "barcode": barcode,  # Keep original barcode for reference
+        "has_batch_no": item["has_batch_no"],
+        "has_serial_no": item["has_serial_no"],
+    }
+    
+    if label.is_price:
+        # Price-embedded label: derive the quantity from the item's rate, without any
+        # rate the label is sold as one unit
+        result.update({"qty": flt(label.value / rate, 3), "rate": rate} if rate else {"qty": 1, "rate": label.value})
+    else:
+        result["qty"] = label.value  # Set quantity to the scanned weight
+    
+    return result
+
+
+def get_price_label_rates(item_codes, ctx=None):
+    """
+    Get the rates used to split price-embedded labels into qty and rate.
+    
+    Rates come from the price list in `ctx` (Standard Selling by default), falling
+    back to the item's standard_rate.
+    """
+    price_list = (ctx or {}).get("price_list") or PLU_PRICE_LIST
+    rates = get_effective_prices(item_codes, price_list)
+    
+    for item_code in item_codes:
+        if not rates.get(item_code):
+            rates[item_code] = frappe.get_cached_value("Item", item_code, "standard_rate")
+    
+    return rates
+
+
+@frappe.whitelist()
+@instrument("scale_item_details")
+def get_scale_item_details(barcode: str, warehouse: str | None = None, price_list: str | None = None):
+    """
+    Resolve a scale label into everything the POS cart needs, in one response.
+    
+    Returns item_code, qty from the embedded weight (or price), rate, UOM, stock
+    availability in `warehouse` and the batch/serial flags, or None if the barcode is
+    not a scale label of a known item.
+    """
+    label = parse_scale_barcode(barcode)
+    item = get_scale_item(label) if label else None
+    if not item:
+        return None
+    
+    item_code = item["item_code"]
+    price_list = price_list or PLU_PRICE_LIST
+    price_list_rate = get_price_label_rates([item_code], {"price_list": price_list})[item_code]
+    
+    result = get_scale_scan_result(label, item, barcode, price_list_rate)
+    result.update({
+        "item_name": item.get("item_name"),
+        "item_image": item.get("image"),
+        "uom": item["stock_uom"],
+        "stock_uom": item["stock_uom"],
+        "conversion_factor": 1,
+        "price_list_rate": result.get("rate") or price_list_rate or 0,
+        "currency": frappe.get_cached_value("Price List", price_list, "currency"),
+        "batch_no": "",
+        "serial_no": "",
+        "is_stock_item": item.get("is_stock_item"),
+        "actual_qty": 0,
+    })
+    
+    if warehouse:
+        from erpnext.accounts.doctype.pos_invoice.pos_invoice import get_stock_availability
+        result["actual_qty"], result["is_stock_item"] = get_stock_availability(item_code, warehouse)[:2]
+    
+    return result
+
+
+@instrument("search")
+def custom_search_by_term(search_term, warehouse, price_list):
+    """Wrapper that answers scale labels with cart-ready item details, including the scanned qty"""
+    details = get_scale_item_details(search_term, warehouse, price_list)
+    if details:
+        return {"items": [details]}
+    
+    # Call the ORIGINAL saved function (not the patched one - avoids recursion)
+    return _original_search_by_term(search_term, warehouse, price_list)
+
+
 def patch_scan_barcode_imports():
     """
     Monkey patch scan_barcode at the module level to intercept internal Python calls.
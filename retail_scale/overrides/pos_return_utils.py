@@ -2,13 +2,15 @@ import frappe
 from frappe import _
 from frappe.utils import flt
 
-from erpnext.controllers.sales_and_purchase_return import get_returned_qty_map_for_row
+from retail_scale.metrics import instrument
+from retail_scale.return_ledger import get_ledger_returned_qty_map
 
 # frappe.utils.logger.set_log_level("DEBUG")
 # logger = frappe.logger("retail_scale.overrides.pos_return_utils", allow_site=True, file_count=50)
 
 
 @frappe.whitelist()
+@instrument("return_lookup")
 def get_return_against_items(return_against, exclude_return_invoice=None):
 	"""
 	Get items from original POS Invoice with barcode and quantity information.
@@ -24,145 +26,43 @@ def get_return_against_items(return_against, exclude_return_invoice=None):
 	if not return_against:
 		frappe.throw(_("Return Against invoice is required"))
 	
-	# Get original invoice
-	original_invoice = frappe.get_doc("POS Invoice", return_against)
+	# Get customer of the original invoice for returned qty calculation
+	customer = frappe.db.get_value("POS Invoice", return_against, "customer")
+	if customer is None and not frappe.db.exists("POS Invoice", return_against):
+		frappe.throw(_("POS Invoice {0} not found").format(return_against), frappe.DoesNotExistError)
 	
-	# Get customer for returned qty calculation
-	customer = original_invoice.customer
-	
-	# First, get all return invoices against this original invoice
-	return_invoices = frappe.get_all(
-		"POS Invoice",
-		fields=["name", "docstatus", "is_return", "customer"],
-		filters={
-			"return_against": return_against,
-			"is_return": 1,
-			"customer": customer,
-		},
-		order_by="creation desc"
+	# Get all items from original invoice, only the fields the return screen needs
+	original_items = frappe.get_all(
+		"POS Invoice Item",
+		fields=[
+			"name",
+			"item_code",
+			"barcode",
+			"qty",
+			"stock_qty",
+			"batch_no",
+			"serial_no",
+			"rate",
+			"uom",
+			"stock_uom",
+			"conversion_factor",
+		],
+		filters={"parent": return_against, "parenttype": "POS Invoice", "parentfield": "items"},
+		order_by="idx asc",
 	)
 	
-	# logger.debug(f"🔍 Found {len(return_invoices)} return invoice(s) against {return_against}:")
-	for ret_inv in return_invoices:
-		excluded_note = " (EXCLUDED)" if exclude_return_invoice and ret_inv.name == exclude_return_invoice else ""
-		# logger.debug(f"  - {ret_inv.name} (docstatus: {ret_inv.docstatus}, customer: {ret_inv.customer}){excluded_note}")
+	# Already returned quantities for all rows, from the POS Return Ledger
+	returned_qty_map = get_ledger_returned_qty_map(return_against, exclude_return_invoice)
 	
 	items = []
-	
-	# Get all items from original invoice
-	for item in original_invoice.items:
-		# Get already returned quantities for this item row
-		# If exclude_return_invoice is provided, manually calculate excluding that invoice
-		if exclude_return_invoice:
-			# Manually calculate returned quantities excluding the specified return invoice
-			from frappe.query_builder import functions as fn
-			from frappe.query_builder import DocType
-			
-			pos_invoice = DocType("POS Invoice")
-			pos_invoice_item = DocType("POS Invoice Item")
-			
-			# First, get detailed breakdown of return invoices for this item
-			detail_query = (
-				frappe.qb.from_(pos_invoice)
-				.join(pos_invoice_item).on(pos_invoice.name == pos_invoice_item.parent)
-				.select(
-					pos_invoice.name.as_("return_invoice"),
-					pos_invoice.docstatus,
-					fn.Abs(pos_invoice_item.qty).as_("qty"),
-					fn.Abs(pos_invoice_item.stock_qty).as_("stock_qty")
-				)
-				.where(
-					(pos_invoice.return_against == return_against)
-					& (pos_invoice.customer == customer)
-					& (pos_invoice.docstatus == 1)
-					& (pos_invoice.is_return == 1)
-					& (pos_invoice_item.pos_invoice_item == item.name)
-					& (pos_invoice.name != exclude_return_invoice)
-				)
-			)
-			
-			detail_results = detail_query.run(as_dict=True)
-			# logger.debug(f"  📦 Item {item.item_code} (row: {item.name}):")
-			# logger.debug(f"    Found {len(detail_results)} return invoice(s) with this item:")
-			total_qty = 0
-			total_stock_qty = 0
-			for detail in detail_results:
-				# logger.debug(f"      - {detail.return_invoice}: qty={detail.qty}, stock_qty={detail.stock_qty} (docstatus: {detail.docstatus})")
-				total_qty += detail.qty
-				total_stock_qty += detail.stock_qty
-			# logger.debug(f"    Total returned: qty={total_qty}, stock_qty={total_stock_qty}")
-			
-			# Now get aggregated totals
-			query = (
-				frappe.qb.from_(pos_invoice)
-				.join(pos_invoice_item).on(pos_invoice.name == pos_invoice_item.parent)
-				.select(
-					fn.Sum(fn.Abs(pos_invoice_item.qty)).as_("qty"),
-					fn.Sum(fn.Abs(pos_invoice_item.stock_qty)).as_("stock_qty")
-				)
-				.where(
-					(pos_invoice.return_against == return_against)
-					& (pos_invoice.customer == customer)
-					& (pos_invoice.docstatus == 1)
-					& (pos_invoice.is_return == 1)
-					& (pos_invoice_item.pos_invoice_item == item.name)
-					& (pos_invoice.name != exclude_return_invoice)
-				)
-			)
-			
-			result = query.run(as_dict=True)
-			returned_qty_map = result[0] if result else {}
-		else:
-			# Use standard function, but also log details
-			from frappe.query_builder import functions as fn
-			from frappe.query_builder import DocType
-			
-			pos_invoice = DocType("POS Invoice")
-			pos_invoice_item = DocType("POS Invoice Item")
-			
-			# Get detailed breakdown
-			detail_query = (
-				frappe.qb.from_(pos_invoice)
-				.join(pos_invoice_item).on(pos_invoice.name == pos_invoice_item.parent)
-				.select(
-					pos_invoice.name.as_("return_invoice"),
-					pos_invoice.docstatus,
-					fn.Abs(pos_invoice_item.qty).as_("qty"),
-					fn.Abs(pos_invoice_item.stock_qty).as_("stock_qty")
-				)
-				.where(
-					(pos_invoice.return_against == return_against)
-					& (pos_invoice.customer == customer)
-					& (pos_invoice.docstatus == 1)
-					& (pos_invoice.is_return == 1)
-					& (pos_invoice_item.pos_invoice_item == item.name)
-				)
-			)
-			
-			detail_results = detail_query.run(as_dict=True)
-			# logger.debug(f"  📦 Item {item.item_code} (row: {item.name}):")
-			# logger.debug(f"    Found {len(detail_results)} return invoice(s) with this item:")
-			total_qty = 0
-			total_stock_qty = 0
-			for detail in detail_results:
-				# logger.debug(f"      - {detail.return_invoice}: qty={detail.qty}, stock_qty={detail.stock_qty} (docstatus: {detail.docstatus})")
-				total_qty += detail.qty
-				total_stock_qty += detail.stock_qty
-			# logger.debug(f"    Total returned: qty={total_qty}, stock_qty={total_stock_qty}")
-			
-			# Use standard function for aggregated result
-			returned_qty_map = get_returned_qty_map_for_row(
-				return_against,
-				customer,
-				item.name,
-				"POS Invoice"
-			) or {}
+	for item in original_items:
+		returned = returned_qty_map.get(item.name) or {}
 		
 		# Calculate available quantities
 		original_qty = flt(item.qty)
 		original_stock_qty = flt(item.stock_qty)
-		returned_qty = flt(returned_qty_map.get("qty") or 0)
-		returned_stock_qty = flt(returned_qty_map.get("stock_qty") or 0)
+		returned_qty = flt(returned.get("qty") or 0)
+		returned_stock_qty = flt(returned.get("stock_qty") or 0)
 		
 		available_qty = original_qty - returned_qty
 		available_stock_qty = original_stock_qty - returned_stock_qty
@@ -0,0 +1,36 @@
+import frappe
+
+# (doctype, columns, index name) for the PLU export, price and return lookups
+INDEXES = (
+	# Export and PLU code lookups: disabled = 0, ordered and paged by (custom_plu_code, name),
+	# the item group is checked from the index
+	("Item", ["disabled", "custom_plu_code", "name", "item_group"], "retail_scale_plu_code_index"),
+	# Effective price of a batch of items in one price list
+	("Item Price", ["item_code", "price_list", "selling", "valid_from"], "retail_scale_item_price_index"),
+	# Next price change: the first start or end of validity in the exported price lists
+	("Item Price", ["price_list", "selling", "valid_from"], "retail_scale_price_starts_index"),
+	("Item Price", ["price_list", "selling", "valid_upto"], "retail_scale_price_ends_index"),
+	# Submitted returns of an invoice by its customer
+	("POS Invoice", ["return_against", "customer", "is_return", "docstatus"], "retail_scale_return_index"),
+	# Returned rows of an original invoice row
+	("POS Invoice Item", ["pos_invoice_item", "parent"], "retail_scale_return_item_index"),
+)
+
+
+def execute():
+	add_indexes()
+	report_duplicate_plu_codes()
+
+
+def add_indexes():
+	"""Add the missing indexes, also run on install where patches are only marked as done"""
+	for doctype, columns, index_name in INDEXES:
+		frappe.db.add_index(doctype, columns, index_name)
+
+
+def report_duplicate_plu_codes():
+	"""PLU codes must be unique within the PLU group from now on, list the existing clashes"""
+	from retail_scale.utils import get_duplicate_plu_codes
+
+	for plu_code, item_codes in get_duplicate_plu_codes().items():
+		print(f"PLU code {plu_code} is used by more than one item: {', '.join(item_codes)}")
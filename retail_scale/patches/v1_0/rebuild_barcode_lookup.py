@@ -0,0 +1,6 @@
+from retail_scale.barcode_lookup import rebuild_barcode_lookup
+
+
+def execute():
+	# Backfill the lookup from the barcodes, serial numbers and batches created before it existed
+	rebuild_barcode_lookup()
@@ -0,0 +1,6 @@
+from retail_scale.return_ledger import rebuild_return_ledger
+
+
+def execute():
+	# Backfill the ledger from the returns submitted before it existed
+	rebuild_return_ledger()
@@ -0,0 +1,125 @@
+import frappe
+from frappe.utils import cint, flt
+
+from retail_scale.scale_barcode import get_scale_barcode_rules
+from retail_scale.utils import PLU_PRICE_LIST, get_effective_prices, get_plu_item_groups, iter_plu_items
+
+# Catalog versioning: every committed change to PLU items bumps the version and records
+# the changed item codes in a sorted set scored by version, so a till sends its last
+# version and only gets the items changed since. A full change (PLU group tree) or
+# trimming the change log moves the reset version, tills behind it get the full catalog.
+PLU_CATALOG_EPOCH_KEY = "retail_scale:plu_catalog_epoch"
+PLU_CATALOG_VERSION_KEY = "retail_scale:plu_catalog_version"
+PLU_CATALOG_CHANGES_KEY = "retail_scale:plu_catalog_changes"
+PLU_CATALOG_RESET_KEY = "retail_scale:plu_catalog_reset"
+# Changed item codes kept for deltas, older changes fall back to a full catalog
+PLU_CATALOG_MAX_CHANGES = 50000
+PLU_CATALOG_FIELDS = ("code", "item_code", "name", "rate", "uom")
+
+# KEYS: version, changes, reset; ARGV: max changes, changed item codes (none for a full change)
+RECORD_CHANGES_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+if #ARGV == 1 then
+	redis.call('SET', KEYS[3], version)
+	redis.call('DEL', KEYS[2])
+	return version
+end
+for i = 2, #ARGV do
+	redis.call('ZADD', KEYS[2], version, ARGV[i])
+end
+local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[1])
+if excess > 0 then
+	local cut = redis.call('ZRANGE', KEYS[2], excess - 1, excess - 1, 'WITHSCORES')[2]
+	redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', cut)
+	redis.call('SET', KEYS[3], cut)
+end
+return version
+"""
+
+
+def record_plu_catalog_change(item_codes=None):
+	"""Bump the catalog version for the changed item codes, or for the whole catalog"""
+	frappe.cache.eval(
+		RECORD_CHANGES_SCRIPT,
+		3,
+		frappe.cache.make_key(PLU_CATALOG_VERSION_KEY),
+		frappe.cache.make_key(PLU_CATALOG_CHANGES_KEY),
+		frappe.cache.make_key(PLU_CATALOG_RESET_KEY),
+		PLU_CATALOG_MAX_CHANGES,
+		*(item_codes or ()),
+	)
+
+
+def get_plu_catalog_epoch():
+	"""
+	Get the id of the current version sequence.
+
+	It is lost together with the version counter when Redis is flushed, so tokens of
+	an earlier sequence are recognised and answered with a full catalog.
+	"""
+	key = frappe.cache.make_key(PLU_CATALOG_EPOCH_KEY)
+	frappe.cache.set(key, frappe.generate_hash(length=8), nx=True)
+	return frappe.safe_decode(frappe.cache.get(key))
+
+
+def parse_plu_catalog_token(token):
+	epoch, _, version = (token or "").partition("-")
+	return epoch, cint(version)
+
+
+def get_plu_catalog(since=None):
+	"""
+	Get the PLU catalog for the POS, or the changes since a version token.
+
+	Returns a dict with `version` (token for the next call), `full` (the rows replace
+	the catalog), `fields`, `rows` as lists of PLU_CATALOG_FIELDS, `removed` item codes,
+	the price list of the rates and the scale barcode rules.
+	"""
+	epoch = get_plu_catalog_epoch()
+	since_epoch, since_version = parse_plu_catalog_token(since)
+
+	pipeline = frappe.cache.pipeline()
+	pipeline.get(frappe.cache.make_key(PLU_CATALOG_VERSION_KEY))
+	pipeline.get(frappe.cache.make_key(PLU_CATALOG_RESET_KEY))
+	pipeline.zrangebyscore(frappe.cache.make_key(PLU_CATALOG_CHANGES_KEY), f"({since_version}", "+inf")
+	version, reset, changed = pipeline.execute()
+	version, reset = cint(version), cint(reset)
+
+	full = not since or since_epoch != epoch or since_version < reset or since_version > version
+	item_codes = None if full else {frappe.safe_decode(item_code) for item_code in changed}
+
+	rows = []
+	if item_codes is None or item_codes:
+		rows = get_plu_catalog_rows(item_codes)
+
+	return {
+		"version": f"{epoch}-{version}",
+		"full": full,
+		"fields": PLU_CATALOG_FIELDS,
+		"rows": rows,
+		"removed": sorted(item_codes - {row[1] for row in rows}) if item_codes else [],
+		"price_list": PLU_PRICE_LIST,
+		"rules": [rule._asdict() for rule in get_scale_barcode_rules()[1].values()],
+	}
+
+
+def get_plu_catalog_rows(item_codes=None):
+	plu_item_groups = get_plu_item_groups()
+	if not plu_item_groups:
+		return []
+
+	rows = []
+	for items in iter_plu_items(plu_item_groups, item_codes):
+		prices = get_effective_prices([item.item_code for item in items])
+		rows.extend(
+			(
+				cint(item.custom_plu_code),
+				item.item_code,
+				item.item_name,
+				flt(prices.get(item.item_code) or item.standard_rate),
+				item.stock_uom,
+			)
+			for item in items
+		)
+
+	return rows
@@ -14,6 +14,400 @@
 	}
 })();
 
+// Split a search value holding several scanned barcodes (separated by spaces, commas or
+// new lines) into its barcodes. Returns an empty list for anything else.
+function split_barcode_basket(search_term) {
+	const barcodes = (search_term || "").split(/[\s,;]+/).filter(Boolean);
+	if (barcodes.length > 1 && barcodes.every(barcode => /^\d{8,}$/.test(barcode))) {
+		return barcodes;
+	}
+	return [];
+}
+
+// Validate the GTIN (EAN-8, UPC-A, EAN-13) check digit in the last position
+function has_valid_check_digit(barcode) {
+	const digits = barcode.split("").map(Number);
+	const check_digit = digits.pop();
+	const total = digits.reverse().reduce((sum, digit, i) => sum + digit * (i % 2 === 0 ? 3 : 1), 0);
+	return (10 - total % 10) % 10 === check_digit;
+}
+
+// Local copy of the PLU catalog and scale barcode rules, so weighed and priced labels of
+// PLU items are resolved in the browser without a server call. The copy is kept in
+// localStorage and refreshed with the changes since its version; when the server cannot
+// be reached the till keeps scanning with the copy it has.
+const retail_scale_plu_catalog = {
+	refresh_interval: 60 * 1000,
+	version: null,
+	price_list: null,
+	rules: [],
+	rule_map: new Map(),
+	prefix_lengths: [],
+	by_code: new Map(),
+	by_item_code: new Map(),
+	refreshing: null,
+	timer: null,
+	
+	get storage_key() {
+		return `retail_scale:plu_catalog:${frappe.boot.sitename}`;
+	},
+	
+	start() {
+		if (this.timer) {
+			return;
+		}
+		this.load_stored();
+		this.refresh();
+		this.timer = setInterval(() => {
+			if (frappe.get_route()[0] === 'point-of-sale') {
+				this.refresh();
+			}
+		}, this.refresh_interval);
+	},
+	
+	load_stored() {
+		try {
+			const stored = JSON.parse(localStorage.getItem(this.storage_key) || "null");
+			if (stored) {
+				this.apply(stored);
+			}
+		} catch (e) {
+			console.error("PLU catalog: Could not read the stored catalog", e);
+		}
+	},
+	
+	save() {
+		try {
+			localStorage.setItem(this.storage_key, JSON.stringify({
+				version: this.version,
+				full: true,
+				fields: ["code", "item_code", "name", "rate", "uom"],
+				rows: [...this.by_item_code.values()].map(entry => [entry.code, entry.item_code, entry.name, entry.rate, entry.uom]),
+				removed: [],
+				price_list: this.price_list,
+				rules: this.rules,
+			}));
+		} catch (e) {
+			console.error("PLU catalog: Could not store the catalog", e);
+		}
+	},
+	
+	refresh() {
+		if (!this.refreshing) {
+			this.refreshing = frappe.xcall("retail_scale.api.get_plu_catalog", { since: this.version })
+				.then(catalog => {
+					this.apply(catalog);
+					this.save();
+				})
+				.catch(e => console.warn("PLU catalog: Refresh failed, scanning with the local copy", e))
+				.finally(() => {
+					this.refreshing = null;
+				});
+		}
+		return this.refreshing;
+	},
+	
+	apply(catalog) {
+		if (catalog.full) {
+			this.by_code.clear();
+			this.by_item_code.clear();
+		}
+		
+		for (const item_code of catalog.removed) {
+			this.remove(item_code);
+		}
+		
+		for (const row of catalog.rows) {
+			const entry = {};
+			catalog.fields.forEach((field, i) => {
+				entry[field] = row[i];
+			});
+			this.remove(entry.item_code);
+			this.by_code.set(entry.code, entry);
+			this.by_item_code.set(entry.item_code, entry);
+		}
+		
+		this.version = catalog.version;
+		this.price_list = catalog.price_list;
+		this.set_rules(catalog.rules);
+	},
+	
+	set_rules(rules) {
+		this.rules = rules;
+		this.rule_map = new Map(rules.map(rule => [`${rule.barcode_length}:${rule.prefix}`, rule]));
+		this.prefix_lengths = [...new Set(rules.map(rule => rule.prefix.length))].sort((a, b) => b - a);
+	},
+	
+	remove(item_code) {
+		const entry = this.by_item_code.get(item_code);
+		if (entry) {
+			this.by_item_code.delete(item_code);
+			if (this.by_code.get(entry.code) === entry) {
+				this.by_code.delete(entry.code);
+			}
+		}
+	},
+	
+	// Same matching as retail_scale.scale_barcode.parse_scale_barcode
+	parse(barcode) {
+		if (!barcode || !/^\d+$/.test(barcode)) {
+			return null;
+		}
+		
+		for (const prefix_length of this.prefix_lengths) {
+			const rule = this.rule_map.get(`${barcode.length}:${barcode.substring(0, prefix_length)}`);
+			if (!rule) {
+				continue;
+			}
+			
+			if (rule.has_check_digit && !has_valid_check_digit(barcode)) {
+				return null;
+			}
+			
+			const code = barcode.substring(rule.item_code_offset, rule.item_code_offset + rule.item_code_length);
+			const value = barcode.substring(rule.value_offset, rule.value_offset + rule.value_length);
+			if (!code || !value) {
+				return null;
+			}
+			
+			return { rule: rule, code: code, value: parseInt(value, 10) / rule.divisor };
+		}
+		
+		return null;
+	},
+	
+	// Resolve a scale label into the item the cart needs, or null to ask the server
+	resolve(barcode, price_list) {
+		const label = this.parse(barcode);
+		if (!label) {
+			return null;
+		}
+		
+		const entry = label.rule.item_code_source === "PLU Code"
+			? this.by_code.get(parseInt(label.code, 10))
+			: this.by_item_code.get(label.code);
+		if (!entry) {
+			return null;
+		}
+		
+		// Catalog rates are only valid for the catalog's price list, the cart needs a rate
+		if (price_list !== this.price_list || !entry.rate) {
+			return null;
+		}
+		
+		return {
+			item_code: entry.item_code,
+			item_name: entry.name,
+			barcode: barcode,
+			uom: entry.uom,
+			stock_uom: entry.uom,
+			price_list_rate: entry.rate,
+			// The quantity of a price label derives from the rate
+			qty: label.rule.label_type === "Price" ? flt(label.value / entry.rate, 3) : label.value,
+		};
+	},
+	
+	// Weight embedded in a weighed scale label, or null for any other barcode
+	get_label_weight(barcode) {
+		const label = this.parse(barcode);
+		return label && label.rule.label_type === "Weight" ? label.value : null;
+	},
+};
+
+// Same as DEFAULT_RULES in retail_scale.scale_barcode, until the catalog has been loaded
+retail_scale_plu_catalog.set_rules([{
+	prefix: "21",
+	barcode_length: 12,
+	label_type: "Weight",
+	item_code_source: "Item Code",
+	item_code_offset: 2,
+	item_code_length: 5,
+	value_offset: 7,
+	value_length: 5,
+	divisor: 1000,
+	has_check_digit: false,
+}]);
+
+// Original invoice rows of a return, indexed once so every scan is matched and validated
+// with Map lookups. Remaining quantities are kept up to date as cart rows are linked to
+// original rows, instead of being recomputed from the cart.
+class RetailScaleReturnSession {
+	constructor(return_against, items) {
+		this.return_against = return_against;
+		this.items = items;
+		this.by_pos_invoice_item = new Map();
+		this.by_barcode = new Map();
+		this.by_item_code = new Map();
+		this.by_item_qty = new Map();
+		this.by_item_batch_serial = new Map();
+		this.remaining = new Map();
+		// Cart row name -> { pos_invoice_item, qty } and original row -> cart row name
+		this.cart_rows = new Map();
+		this.cart_row_by_pos_invoice_item = new Map();
+		
+		for (const item of items) {
+			this.by_pos_invoice_item.set(item.pos_invoice_item, item);
+			this.remaining.set(item.pos_invoice_item, flt(item.available_qty));
+			
+			if (item.barcode && item.barcode.trim()) {
+				this.add_to_index(this.by_barcode, item.barcode, item);
+			}
+			this.add_to_index(this.by_item_code, item.item_code, item);
+			this.add_to_index(this.by_item_qty, this.qty_key(item.item_code, item.qty), item);
+			
+			// A row with several serial numbers is found by each of them
+			const serials = (item.serial_no || "").split("\n").map(serial => serial.trim()).filter(Boolean);
+			for (const serial_no of serials.length ? serials : [""]) {
+				this.add_to_index(this.by_item_batch_serial, this.batch_serial_key(item.item_code, item.batch_no, serial_no), item);
+			}
+		}
+	}
+	
+	get size() {
+		return this.items.length;
+	}
+	
+	add_to_index(index, key, item) {
+		const rows = index.get(key);
+		if (rows) {
+			rows.push(item);
+		} else {
+			index.set(key, [item]);
+		}
+	}
+	
+	qty_key(item_code, qty) {
+		return `${item_code}::${flt(Math.abs(qty), 6)}`;
+	}
+	
+	batch_serial_key(item_code, batch_no, serial_no) {
+		return `${item_code}::${batch_no || ""}::${serial_no || ""}`;
+	}
+	
+	get_remaining(pos_invoice_item) {
+		return this.remaining.get(pos_invoice_item) || 0;
+	}
+	
+	// Several original rows can share a key, prefer one with quantity left to return
+	pick(rows) {
+		return rows.find(row => this.get_remaining(row.pos_invoice_item) > 0) || rows[0];
+	}
+	
+	validate(item, scanned_barcode, scanned_qty) {
+		const item_code = item.item_code;
+		const weight = retail_scale_plu_catalog.get_label_weight(scanned_barcode);
+		let matched_item = null;
+		
+		if (!this.by_item_code.has(item_code) && !(scanned_barcode && this.by_barcode.has(scanned_barcode))) {
+			return {
+				valid: false,
+				error: __("Item {0} was not in the original invoice {1}", [
+					item_code.bold(),
+					this.return_against.bold()
+				])
+			};
+		}
+		
+		if (scanned_barcode && this.by_barcode.has(scanned_barcode)) {
+			matched_item = this.pick(this.by_barcode.get(scanned_barcode));
+			if (weight !== null && this.qty_key(item_code, weight) !== this.qty_key(matched_item.item_code, matched_item.qty)) {
+				matched_item = null;
+			}
+		}
+		
+		if (!matched_item && weight !== null) {
+			// Weighed labels match the original row by exact quantity
+			const rows = this.by_item_qty.get(this.qty_key(item_code, weight));
+			if (!rows) {
+				return {
+					valid: false,
+					error: __("Item {0} with quantity {1} was not found in the original invoice", [
+						item_code.bold(),
+						weight.toFixed(3).bold()
+					])
+				};
+			}
+			matched_item = this.pick(rows);
+		}
+		
+		if (!matched_item && (item.batch_no || item.serial_no)) {
+			const rows = this.by_item_batch_serial.get(this.batch_serial_key(item_code, item.batch_no, item.serial_no));
+			if (!rows) {
+				return {
+					valid: false,
+					error: item.serial_no
+						? __("Serial number does not match the original invoice item")
+						: __("Batch number does not match the original invoice item")
+				};
+			}
+			matched_item = this.pick(rows);
+		}
+		
+		if (!matched_item) {
+			matched_item = this.pick(this.by_item_code.get(item_code));
+		}
+		
+		// Check available quantity limits
+		const return_qty = scanned_qty || weight || item.qty || 0;
+		const available_qty = this.get_remaining(matched_item.pos_invoice_item);
+		
+		if (available_qty <= 0) {
+			return {
+				valid: false,
+				error: __("This item has already been fully returned")
+			};
+		}
+		
+		if (return_qty > available_qty) {
+			return {
+				valid: false,
+				error: __("Quantity {0} exceeds available return quantity {1}", [
+					return_qty.toFixed(3).bold(),
+					available_qty.toFixed(3).bold()
+				])
+			};
+		}
+		
+		return {
+			valid: true,
+			matched_item: matched_item
+		};
+	}
+	
+	// Cart row already holding the returned quantity of an original row
+	get_cart_row(doc, matched_item) {
+		const row_name = matched_item && this.cart_row_by_pos_invoice_item.get(matched_item.pos_invoice_item);
+		const row = row_name && locals[doc.doctype + " Item"] && locals[doc.doctype + " Item"][row_name];
+		return row && row.parent === doc.name ? row : null;
+	}
+	
+	// Link a cart row to an original row with the quantity it returns
+	assign(row_name, pos_invoice_item, qty) {
+		this.release(row_name);
+		if (!this.by_pos_invoice_item.has(pos_invoice_item)) {
+			return;
+		}
+		
+		qty = Math.abs(qty || 0);
+		this.cart_rows.set(row_name, { pos_invoice_item: pos_invoice_item, qty: qty });
+		this.cart_row_by_pos_invoice_item.set(pos_invoice_item, row_name);
+		this.remaining.set(pos_invoice_item, this.get_remaining(pos_invoice_item) - qty);
+	}
+	
+	release(row_name) {
+		const assigned = this.cart_rows.get(row_name);
+		if (!assigned) {
+			return;
+		}
+		
+		this.cart_rows.delete(row_name);
+		if (this.cart_row_by_pos_invoice_item.get(assigned.pos_invoice_item) === row_name) {
+			this.cart_row_by_pos_invoice_item.delete(assigned.pos_invoice_item);
+		}
+		this.remaining.set(assigned.pos_invoice_item, this.get_remaining(assigned.pos_invoice_item) + assigned.qty);
+	}
+}
+
 function patch_item_selector() {
 	if (!erpnext.PointOfSale || !erpnext.PointOfSale.ItemSelector) {
 		// console.log("⏳ Waiting for POS ItemSelector to load...");
@@ -26,6 +420,8 @@ function patch_item_selector() {
 		return;
 	}
 	
+	retail_scale_plu_catalog.start();
+	
 	const original_add_filtered = erpnext.PointOfSale.ItemSelector.prototype.add_filtered_item_to_cart;
 	
 	erpnext.PointOfSale.ItemSelector.prototype.add_filtered_item_to_cart = function() {
@@ -37,56 +433,51 @@ function patch_item_selector() {
 			const item = this.items[0];
 			let scanned_qty = item.qty;
 			const scanned_barcode = item.barcode || "";
+			const session = is_return && window.cur_pos && window.cur_pos.return_session;
 			
 			// For return invoices, make quantity negative
 			if (is_return && scanned_qty > 0) {
 				scanned_qty = -Math.abs(scanned_qty);
 			}
 			
-			// Check if item already exists in cart
-			const existing_item = frm.doc.items.find(row => 
-				row.item_code === item.item_code && 
-				(!item.batch_no || row.batch_no === item.batch_no) &&
-				(!item.serial_no || row.serial_no === item.serial_no)
-			);
+			// For return invoices, match the scan to its original invoice row and validate
+			// the scanned quantity against what is left to return on that row
+			let matched_item = null;
+			if (session && session.size) {
+				const validation = session.validate(item, scanned_barcode, Math.abs(scanned_qty));
+				
+				if (!validation.valid) {
+					frappe.show_alert({
+						message: validation.error,
+						indicator: "red",
+					});
+					frappe.utils.play_sound("error");
+					this.set_search_value("");
+					return;
+				}
+				matched_item = validation.matched_item;
+			}
+			
+			// Check if item already exists in cart: on returns the row linked to the matched
+			// original row, otherwise a row of the same item
+			const existing_item = matched_item
+				? session.get_cart_row(frm.doc, matched_item)
+				: frm.doc.items.find(row => 
+					row.item_code === item.item_code && 
+					(!item.batch_no || row.batch_no === item.batch_no) &&
+					(!item.serial_no || row.serial_no === item.serial_no)
+				);
 			
 			if (existing_item) {
-				// Item exists - validate before updating quantity
 				const current_qty = existing_item.qty || 0;
 				const new_qty = current_qty + scanned_qty;
 				
-				// For return invoices, validate against available quantity
-				if (is_return && window.cur_pos && window.cur_pos.validate_return_item) {
-					const scanned_barcode_for_validation = scanned_barcode || "";
-					const scanned_qty_for_validation = Math.abs(scanned_qty); // Use absolute value for validation
-					
-					// Create a temporary item object for validation
-					const temp_item = {
-						item_code: item.item_code,
-						batch_no: item.batch_no || existing_item.batch_no,
-						serial_no: item.serial_no || existing_item.serial_no
-					};
-					
-					// Validate the new total quantity
-					const validation = window.cur_pos.validate_return_item(
-						temp_item,
-						scanned_barcode_for_validation,
-						Math.abs(new_qty) // Total quantity to return (absolute value)
-					);
-					
-					if (!validation.valid) {
-						frappe.show_alert({
-							message: validation.error,
-							indicator: "red",
-						});
-						frappe.utils.play_sound("error");
-						this.set_search_value("");
-						return;
-					}
-				}
-				
 				// console.log(`Dynamic barcode: Adding qty=${scanned_qty} (current: ${current_qty}, new total: ${new_qty})`);
 				
+				if (matched_item) {
+					session.assign(existing_item.name, matched_item.pos_invoice_item, new_qty);
+				}
+				
 				// Directly update the quantity using frappe.model.set_value
 				frappe.model.set_value(existing_item.doctype, existing_item.name, "qty", new_qty)
 					.then(() => {
@@ -96,6 +487,12 @@ function patch_item_selector() {
 						}
 					});
 				
+				this.set_search_value("");
+			} else if (!is_return && item.price_list_rate && retail_scale_plu_catalog.parse(scanned_barcode)
+				&& window.cur_pos && window.cur_pos.add_scale_item) {
+				// Scale labels, resolved from the catalog or with their cart-ready details from
+				// the server, are shown in the cart at once and their server checks are queued
+				window.cur_pos.add_scale_item(item, scanned_qty);
 				this.set_search_value("");
 			} else {
 				// Item doesn't exist - add new item with scanned quantity
@@ -110,33 +507,23 @@ function patch_item_selector() {
 					stock_uom: item.stock_uom
 				};
 				
+				if (item.conversion_factor) {
+					item_obj.conversion_factor = item.conversion_factor;
+				}
+				
+				// Scale labels come back with stock availability, so the cart does not need to ask again
+				if (item.actual_qty !== undefined && window.cur_pos && window.cur_pos.prime_scanned_stock) {
+					window.cur_pos.prime_scanned_stock(item.item_code, frm.doc.set_warehouse, item.actual_qty, item.is_stock_item);
+				}
+				
 				// Include barcode if available
 				if (scanned_barcode) {
 					item_obj.barcode = scanned_barcode;
 				}
 				
-				// For return invoices, try to get pos_invoice_item from validation cache
-				if (is_return && window.cur_pos && window.cur_pos.return_against_items) {
-					// Find matching item in original invoice
-					// For weight-embedded barcodes, match by exact quantity
-					if (scanned_barcode && scanned_barcode.startsWith("21") && scanned_barcode.length === 12) {
-						const extracted_weight = Math.abs(scanned_qty);
-						const matching_item = window.cur_pos.return_against_items.find(orig_item => 
-							orig_item.item_code === item.item_code && orig_item.qty === extracted_weight
-						);
-						if (matching_item && matching_item.pos_invoice_item) {
-							item_obj.pos_invoice_item = matching_item.pos_invoice_item;
-						}
-					} else {
-						// For regular items, match by item_code and barcode
-						const matching_item = window.cur_pos.return_against_items.find(orig_item => 
-							orig_item.item_code === item.item_code &&
-							(!scanned_barcode || orig_item.barcode === scanned_barcode)
-						);
-						if (matching_item && matching_item.pos_invoice_item) {
-							item_obj.pos_invoice_item = matching_item.pos_invoice_item;
-						}
-					}
+				// Link the return row to the original invoice row, on_cart_update then skips matching again
+				if (matched_item) {
+					item_obj.pos_invoice_item = matched_item.pos_invoice_item;
 				}
 				
 				this.events.item_selected({
@@ -152,6 +539,57 @@ function patch_item_selector() {
 		}
 	};
 	
+	const original_filter_items = erpnext.PointOfSale.ItemSelector.prototype.filter_items;
+	
+	// Patch filter_items to scan a basket of barcodes (several labels in the search field) in one request
+	erpnext.PointOfSale.ItemSelector.prototype.filter_items = function({ search_term = "" } = {}) {
+		const barcodes = split_barcode_basket(search_term);
+		const frm = this.events.get_frm();
+		
+		// Return invoices validate every label against the original invoice, one at a time
+		if (barcodes.length > 1 && !(frm && frm.doc && frm.doc.is_return)) {
+			return this.add_barcode_basket(barcodes);
+		}
+		
+		// Scale labels of catalog items go straight to the cart without a server call
+		const local_item = retail_scale_plu_catalog.resolve(search_term.trim(), frm && frm.doc && frm.doc.selling_price_list);
+		if (local_item) {
+			this.items = [local_item];
+			return this.add_filtered_item_to_cart();
+		}
+		
+		return original_filter_items.call(this, { search_term });
+	};
+	
+	erpnext.PointOfSale.ItemSelector.prototype.add_barcode_basket = async function(barcodes) {
+		const frm = this.events.get_frm();
+		const result = await frappe.call({
+			method: "retail_scale.overrides.barcode_utils.custom_scan_barcodes",
+			// Price labels are split into qty and rate with the profile's selling prices
+			args: { barcodes: barcodes, price_list: frm && frm.doc && frm.doc.selling_price_list },
+			freeze: true,
+		});
+		
+		const scanned = result.message || [];
+		const found = scanned.filter(item => !item.error);
+		const failed = scanned.filter(item => item.error);
+		
+		if (found.length && window.cur_pos && window.cur_pos.add_scanned_items) {
+			failed.push(...await window.cur_pos.add_scanned_items(found));
+		}
+		
+		// One message listing every label that did not go to the cart
+		if (failed.length) {
+			frappe.show_alert({
+				message: failed.map(item => item.item_code ? `${item.item_code.bold()}: ${item.error}` : item.error).join("<br>"),
+				indicator: "red",
+			});
+			frappe.utils.play_sound("error");
+		}
+		
+		this.set_search_value("");
+	};
+	
 	// Mark as patched
 	erpnext.PointOfSale.ItemSelector.prototype._patched_for_dynamic_barcode = true;
 	
@@ -195,6 +633,7 @@ function patch_pos_controller() {
 		frappe.dom.freeze();
 		this.frm = this.get_new_frm(this.frm);
 		this.frm.doc.items = [];
+		this.return_session = null;
 		
 		const result = await frappe.call({
 			method: "erpnext.accounts.doctype.pos_invoice.pos_invoice.make_sales_return",
@@ -223,32 +662,9 @@ function patch_pos_controller() {
 					});
 					
 					if (items_result.message) {
-						// Store original invoice items in cache
-						this.return_against_items = items_result.message;
-						
-						// Create lookup maps for quick validation
-						// Map by item_code (can have multiple items with same item_code)
-						this.return_against_items_by_code = {};
-						// Map by barcode (only if barcode exists)
-						this.return_against_items_by_barcode = {};
-						
-						items_result.message.forEach((item) => {
-							// Map by item_code
-							if (!this.return_against_items_by_code[item.item_code]) {
-								this.return_against_items_by_code[item.item_code] = [];
-							}
-							this.return_against_items_by_code[item.item_code].push(item);
-							
-							// Map by barcode if present
-							if (item.barcode && item.barcode.trim()) {
-								this.return_against_items_by_barcode[item.barcode] = item;
-							}
-						});
-						
-						// console.log("✅ Original invoice items cached for validation", this.return_against_items.length);
-						// console.log("📋 Original invoice items details:", JSON.stringify(this.return_against_items, null, 2));
-						// console.log("📋 Items by code:", Object.keys(this.return_against_items_by_code));
-						// console.log("📋 Items by barcode:", Object.keys(this.return_against_items_by_barcode));
+						// Index original invoice items once for validation of every scan
+						this.return_session = new RetailScaleReturnSession(this.frm.doc.return_against, items_result.message);
+						// console.log("✅ Original invoice items indexed for validation", this.return_session.size);
 					}
 				} catch (error) {
 					console.error("Error fetching original invoice items:", error);
@@ -274,166 +690,338 @@ function patch_pos_controller() {
 	
 	// Add validation method to Controller prototype
 	erpnext.PointOfSale.Controller.prototype.validate_return_item = function(item, scanned_barcode, scanned_qty) {
-		// If not a return invoice or no cache, skip validation
-		if (!this.frm.doc.is_return || !this.return_against_items || !this.return_against_items.length) {
+		// If not a return invoice or no original items, skip validation
+		if (!this.frm.doc.is_return || !this.return_session || !this.return_session.size) {
 			return { valid: true };
 		}
 		
-		const item_code = item.item_code;
-		
-		// console.log("🔍 Validation started:");
-		// console.log("  - Scanned item_code:", item_code);
-		// console.log("  - Scanned barcode:", scanned_barcode);
-		// console.log("  - Scanned qty:", scanned_qty);
-		// console.log("  - Original invoice:", this.frm.doc.return_against);
-		// console.log("  - Available original items:", this.return_against_items.length);
-		
-		// Check if barcode is weight-embedded (retail_scale format: 21-XXXXX-XXXXX)
-		let is_weight_barcode = false;
-		let extracted_weight = null;
+		return this.return_session.validate(item, scanned_barcode, scanned_qty);
+	};
+	
+	const original_get_available_stock = erpnext.PointOfSale.Controller.prototype.get_available_stock;
+	
+	// Remember the stock availability returned with a scale label scan for the next stock check
+	erpnext.PointOfSale.Controller.prototype.prime_scanned_stock = function(item_code, warehouse, actual_qty, is_stock_item) {
+		this.scanned_stock = this.scanned_stock || {};
+		this.scanned_stock[`${item_code}::${warehouse}`] = [actual_qty, is_stock_item];
+	};
+	
+	// Patch get_available_stock to answer from the scan response instead of another server call
+	erpnext.PointOfSale.Controller.prototype.get_available_stock = function(item_code, warehouse) {
+		const key = `${item_code}::${warehouse}`;
+		const stock = this.scanned_stock && this.scanned_stock[key];
 		
-		if (scanned_barcode && scanned_barcode.startsWith("21") && scanned_barcode.length === 12) {
-			is_weight_barcode = true;
-			try {
-				const weight_str = scanned_barcode.substring(7, 12); // Last 5 digits
-				extracted_weight = parseFloat(weight_str) / 1000; // Convert grams to kg
-				// console.log("  - Weight-embedded barcode detected");
-				// console.log("  - Extracted weight (kg):", extracted_weight);
-			} catch (e) {
-				console.error("Error extracting weight from barcode:", e);
+		if (stock) {
+			// Use once, later checks must see fresh stock
+			delete this.scanned_stock[key];
+			this.item_stock_map = this.item_stock_map || {};
+			if (!this.item_stock_map[item_code]) {
+				this.item_stock_map[item_code] = {};
 			}
+			this.item_stock_map[item_code][warehouse] = stock;
+			return Promise.resolve({ message: stock });
 		}
 		
-		// Find matching items: by barcode first (if provided), then by item_code
-		let matching_items = [];
+		return original_get_available_stock.call(this, item_code, warehouse);
+	};
+	
+	// Add several scanned items in one cart update. Every item is first checked the way
+	// on_cart_update checks an item added from the selector (price, stock, batch/serial no),
+	// then the items that passed are added together. Returns the items that failed, each
+	// with its error.
+	erpnext.PointOfSale.Controller.prototype.add_scanned_items = async function(items) {
+		if (!this.frm.doc.customer) {
+			this.raise_customer_selection_alert();
+			return [];
+		}
 		
-		if (scanned_barcode && scanned_barcode.trim() && this.return_against_items_by_barcode[scanned_barcode]) {
-			// Found by barcode
-			matching_items = [this.return_against_items_by_barcode[scanned_barcode]];
-			// console.log("  - Found item by barcode:", scanned_barcode);
-		} else if (this.return_against_items_by_code[item_code]) {
-			// Found by item_code
-			matching_items = this.return_against_items_by_code[item_code];
-			// console.log("  - Found items by item_code:", item_code, "Count:", matching_items.length);
+		if (this.frm.doc.set_warehouse != this.settings.warehouse) {
+			this.frm.doc.set_warehouse = this.settings.warehouse;
 		}
+		const warehouse = this.frm.doc.set_warehouse;
 		
-		// console.log("  - Matching items by item_code:", matching_items.length);
-		// matching_items.forEach((orig_item, idx) => {
-		// 	console.log(`    [${idx}] Item: ${orig_item.item_code}, Barcode: "${orig_item.barcode}", Qty: ${orig_item.qty}, Batch: "${orig_item.batch_no}", Serial: "${orig_item.serial_no}", Available: ${orig_item.available_qty}`);
-		// });
+		// Scans of the same item, batch and serial no go to one cart row
+		const lines = new Map();
+		for (const item of items) {
+			const key = `${item.item_code}::${item.batch_no || ""}::${item.serial_no || ""}`;
+			const line = lines.get(key);
+			if (line) {
+				line.qty += flt(item.qty || 1);
+				continue;
+			}
+			
+			lines.set(key, {
+				item: item,
+				qty: flt(item.qty || 1),
+				row: this.frm.doc.items.find(row =>
+					row.item_code === item.item_code &&
+					(!item.batch_no || row.batch_no === item.batch_no) &&
+					(!item.serial_no || row.serial_no === item.serial_no)
+				),
+			});
+		}
 		
-		if (matching_items.length === 0) {
-			return {
-				valid: false,
-				error: __("Item {0} was not in the original invoice {1}", [
-					item_code.bold(),
-					this.frm.doc.return_against.bold()
-				])
-			};
+		const { stock, reserved_serial_nos } = await this.get_scanned_items_availability([...lines.values()], warehouse);
+		
+		const failed = [];
+		const passed = [];
+		for (const line of lines.values()) {
+			const error = this.check_scanned_item(line, warehouse, stock, reserved_serial_nos);
+			if (error) {
+				failed.push({ item_code: line.item.item_code, barcode: line.item.barcode, error: error });
+			} else {
+				passed.push(line);
+			}
 		}
 		
-		// Find exact match
-		let matched_item = null;
+		if (!passed.length) {
+			return failed;
+		}
 		
-		// For weight-embedded barcodes: Match by exact quantity
-		// For regular items: Match by item_code or barcode (already found above)
-		if (is_weight_barcode && extracted_weight !== null) {
-			// console.log("  🔍 Weight-embedded barcode: Matching by exact quantity");
-			
-			for (const orig_item of matching_items) {
-				// For weight-embedded barcodes, match by exact quantity
-				const qty_match = extracted_weight === orig_item.qty; // Exact match, no tolerance
-				
-				// console.log(`  Checking match for item ${orig_item.item_code}:`);
-				// console.log(`    - Original qty: ${orig_item.qty}`);
-				// console.log(`    - Extracted weight: ${extracted_weight}`);
-				// console.log(`    - Qty exact match: ${qty_match}`);
+		frappe.dom.freeze();
+		let results;
+		try {
+			const updates = passed.map(line => {
+				const { item } = line;
+				if (line.row) {
+					return frappe.model.set_value(line.row.doctype, line.row.name, "qty", flt(line.row.qty) + line.qty);
+				}
 				
-				if (qty_match) {
-					matched_item = orig_item;
-					// console.log("  ✅ Exact match found for weight-embedded barcode!");
-					break;
+				line.is_new = true;
+				line.row = this.frm.add_child("items", {
+					item_code: item.item_code,
+					batch_no: item.batch_no,
+					serial_no: item.serial_no,
+					uom: item.uom,
+					rate: item.rate,
+					qty: line.qty,
+					use_serial_batch_fields: 1,
+				});
+				// Set without triggers, the barcode trigger would scan the label again
+				if (item.barcode) {
+					line.row.barcode = item.barcode;
 				}
+				return this.trigger_new_item_events(line.row);
+			});
+			
+			// The triggers of all rows run together, their item details and pricing rules
+			// are fetched in parallel requests instead of one row after the other
+			results = await Promise.allSettled(updates);
+			
+			// A new row whose details could not be fetched is taken out again
+			const removed = passed.filter((line, i) => results[i].status === "rejected" && line.is_new);
+			for (const line of removed) {
+				frappe.model.clear_doc(line.row.doctype, line.row.name);
 			}
-		} else {
-			// Regular item: Already found by item_code or barcode, use first match
-			if (matching_items.length > 0) {
-				matched_item = matching_items[0];
-				// console.log("  ✅ Match found by item_code or barcode!");
+			if (removed.length) {
+				await this.frm.cscript.calculate_taxes_and_totals();
 			}
+		} finally {
+			frappe.dom.unfreeze();
 		}
 		
-		if (!matched_item) {
-			if (is_weight_barcode) {
-				// console.log("  ❌ No match found for weight-embedded barcode");
-				return {
-					valid: false,
-					error: __("Item {0} with quantity {1} was not found in the original invoice", [
-						item_code.bold(),
-						extracted_weight.toFixed(3).bold()
-					])
-				};
-			} else {
-				console.log("  ❌ No match found");
-				return {
-					valid: false,
-					error: __("Barcode {0} does not match the original invoice item", [
-						(scanned_barcode || item_code).bold()
-					])
-				};
+		passed.forEach((line, i) => {
+			if (results[i].status === "rejected") {
+				failed.push({
+					item_code: line.item.item_code,
+					barcode: line.item.barcode,
+					error: __("Could not be added to the cart"),
+				});
+				console.error("Basket scan: Could not update the cart", results[i].reason);
+			}
+			if (results[i].status === "fulfilled" || !line.is_new) {
+				this.update_cart_html(line.row);
 			}
+		});
+		
+		return failed;
+	};
+	
+	// Stock of every scanned item and reserved serial nos of the serialized ones, fetched
+	// at the same time. What could not be fetched is false, its items are not added.
+	erpnext.PointOfSale.Controller.prototype.get_scanned_items_availability = async function(lines, warehouse) {
+		const stock = new Map();
+		const reserved_serial_nos = new Map();
+		const item_codes = [...new Set(lines.map(line => line.item.item_code))];
+		const serial_item_codes = [...new Set(lines.filter(line => line.item.serial_no).map(line => line.item.item_code))];
+		
+		await Promise.all([
+			...(this.allow_negative_stock ? [] : item_codes.map(item_code =>
+				this.get_available_stock(item_code, warehouse)
+					.then(r => stock.set(item_code, r.message), () => stock.set(item_code, false))
+			)),
+			...serial_item_codes.map(item_code =>
+				frappe.call({
+					method: "erpnext.stock.doctype.serial_no.serial_no.get_pos_reserved_serial_nos",
+					args: { filters: { item_code: item_code, warehouse: warehouse } },
+				}).then(r => reserved_serial_nos.set(item_code, r.message || []), () => reserved_serial_nos.set(item_code, false))
+			),
+		]);
+		
+		return { stock, reserved_serial_nos };
+	};
+	
+	// Error of a scanned item that cannot go to the cart, same checks as on_cart_update
+	erpnext.PointOfSale.Controller.prototype.check_scanned_item = function(line, warehouse, stock, reserved_serial_nos) {
+		const { item } = line;
+		
+		if (!line.row && !flt(item.rate)) {
+			return __("Price is not set for the item.");
 		}
 		
-		// Check available quantity limits
-		const return_qty = scanned_qty || (is_weight_barcode && extracted_weight) || item.qty || 0;
-		const available_qty = matched_item.available_qty || 0;
+		// Only one batch/serial selection can be open, such items are scanned on their own
+		if (!line.row && ((item.has_batch_no && !item.batch_no) || (item.has_serial_no && !item.serial_no))) {
+			return __("Scan {0} on its own to select its batch or serial no", [item.item_code.bold()]);
+		}
 		
-		if (return_qty > available_qty) {
-			return {
-				valid: false,
-				error: __("Quantity {0} exceeds available return quantity {1}", [
-					return_qty.toFixed(3).bold(),
-					available_qty.toFixed(3).bold()
-				])
-			};
+		if (stock.get(item.item_code) === false || reserved_serial_nos.get(item.item_code) === false) {
+			return __("Could not check the availability of {0}", [item.item_code.bold()]);
 		}
 		
-		if (available_qty <= 0) {
-			return {
-				valid: false,
-				error: __("This item has already been fully returned")
-			};
+		if (item.serial_no && reserved_serial_nos.get(item.item_code).includes(item.serial_no)) {
+			return __("Serial No: {0} has already been transacted into another POS Invoice.", [item.serial_no.bold()]);
 		}
 		
-		// Check batch/serial match if original had them
-		if (matched_item.batch_no && batch_no !== matched_item.batch_no) {
-			return {
-				valid: false,
-				error: __("Batch number does not match the original invoice item")
-			};
+		const qty_needed = (flt(line.row && line.row.qty) + line.qty) * flt((line.row && line.row.conversion_factor) || 1);
+		return this.get_stock_error(item.item_code, qty_needed, warehouse, stock.get(item.item_code));
+	};
+	
+	// Error when `qty_needed` of an item is not in stock, from a get_available_stock response
+	erpnext.PointOfSale.Controller.prototype.get_stock_error = function(item_code, qty_needed, warehouse, stock) {
+		const [available_qty, is_stock_item] = stock || [];
+		if (!is_stock_item) {
+			return null;
 		}
 		
-		if (matched_item.serial_no && serial_no) {
-			const orig_serials = matched_item.serial_no.split('\n').filter(s => s.trim());
-			if (!orig_serials.includes(serial_no)) {
-				return {
-					valid: false,
-					error: __("Serial number does not match the original invoice item")
-				};
+		if (!(available_qty > 0)) {
+			return __("Item Code: {0} is not available under warehouse {1}.", [item_code.bold(), warehouse.bold()]);
+		}
+		if (available_qty < qty_needed) {
+			return __("Stock quantity not enough for Item Code: {0} under warehouse {1}. Available quantity {2}.", [
+				item_code.bold(),
+				warehouse.bold(),
+				available_qty.toString().bold(),
+			]);
+		}
+		
+		return null;
+	};
+	
+	// Add a scale label without waiting on the server. The row gets the label's rate and UOM
+	// and is shown at once; its item details are queued and run in the background, with the
+	// stock check unless the scan came back with the stock.
+	erpnext.PointOfSale.Controller.prototype.add_scale_item = function(item, qty) {
+		if (!this.frm.doc.customer) {
+			return this.raise_customer_selection_alert();
+		}
+		
+		if (this.frm.doc.set_warehouse != this.settings.warehouse) {
+			this.frm.doc.set_warehouse = this.settings.warehouse;
+		}
+		
+		// Server scans come with the stock of the profile's warehouse, checked before adding
+		const stock = item.actual_qty !== undefined && !this.allow_negative_stock
+			? [item.actual_qty, item.is_stock_item]
+			: null;
+		const error = stock && this.get_stock_error(item.item_code, qty, this.frm.doc.set_warehouse, stock);
+		if (error) {
+			frappe.show_alert({ message: error, indicator: "red" });
+			frappe.utils.play_sound("error");
+			return;
+		}
+		
+		const row = this.frm.add_child("items", {
+			item_code: item.item_code,
+			item_name: item.item_name,
+			barcode: item.barcode,
+			uom: item.uom,
+			stock_uom: item.stock_uom,
+			conversion_factor: 1,
+			qty: qty,
+			stock_qty: qty,
+			price_list_rate: item.price_list_rate,
+			rate: item.price_list_rate,
+			use_serial_batch_fields: 1,
+		});
+		
+		// Totals are computed in the browser
+		this.frm.cscript.calculate_taxes_and_totals();
+		this.update_cart_html(row);
+		
+		this.queue_cart_update(() => this.complete_scale_item(row, Boolean(stock)));
+		return row;
+	};
+	
+	// Run the item triggers of a row added by add_scale_item, and its stock check unless
+	// `stock_checked`
+	erpnext.PointOfSale.Controller.prototype.complete_scale_item = async function(row, stock_checked) {
+		const is_in_cart = () => locals[row.doctype] && locals[row.doctype][row.name] && row.parent === this.frm.doc.name;
+		if (!is_in_cart()) {
+			return;
+		}
+		
+		const warehouse = this.frm.doc.set_warehouse;
+		const [stock] = await Promise.all([
+			this.allow_negative_stock || stock_checked
+				? null
+				: this.get_available_stock(row.item_code, warehouse).then(r => r.message),
+			this.trigger_new_item_events(row),
+		]);
+		if (!is_in_cart()) {
+			return;
+		}
+		
+		const error = this.get_stock_error(row.item_code, flt(row.qty) * flt(row.conversion_factor || 1), warehouse, stock);
+		if (error) {
+			frappe.show_alert({ message: error, indicator: "red" });
+			frappe.utils.play_sound("error");
+			
+			// Like on_cart_update, an item that is not in stock at all is taken out
+			if (!(stock[0] > 0)) {
+				await frappe.model.set_value(row.doctype, row.name, "qty", 0);
+				frappe.model.clear_doc(row.doctype, row.name);
+				this.update_cart_html(row, true);
+				return;
 			}
 		}
 		
-		return {
-			valid: true,
-			matched_item: matched_item
-		};
+		this.update_cart_html(row);
+		if (this.check_serial_batch_selection_needed(row) && !this.item_details.$component.is(":visible")) {
+			this.edit_item_details_of(row);
+		}
+	};
+	
+	// Run server work for the cart in the background, one update after the other
+	erpnext.PointOfSale.Controller.prototype.queue_cart_update = function(update) {
+		this.queued_cart_updates = (this.queued_cart_updates || Promise.resolve())
+			.then(update)
+			.catch(error => console.error("POS: Queued cart update failed", error));
+		return this.queued_cart_updates;
+	};
+	
+	const original_save_and_checkout = erpnext.PointOfSale.Controller.prototype.save_and_checkout;
+	
+	// Patch save_and_checkout to finish the queued cart updates before the invoice is saved
+	erpnext.PointOfSale.Controller.prototype.save_and_checkout = async function() {
+		if (this.queued_cart_updates) {
+			frappe.dom.freeze();
+			try {
+				await this.queued_cart_updates;
+			} finally {
+				frappe.dom.unfreeze();
+			}
+		}
+		
+		return original_save_and_checkout.apply(this, arguments);
 	};
 	
 	// Patch on_cart_update to validate items before adding
 	erpnext.PointOfSale.Controller.prototype.on_cart_update = async function(args) {
-		let scanned_barcode = ""; // Store for use after original method call
-		let extracted_weight = null; // Store for use after original method call
-		let is_weight_barcode = false; // Store for use after original method call
+		let scanned_barcode = "";
+		let extracted_weight = null;
+		let is_weight_barcode = false;
+		// Values of a new return row, applied before its item triggers run
+		let return_row_values = null;
 		
 		// If this is a return invoice, intercept and fix the +1 increment logic
 		if (this.frm.doc.is_return && !$.isEmptyObject(args)) {
@@ -443,18 +1031,12 @@ function patch_pos_controller() {
 			// If value is "+1" and we have a weight-embedded barcode, replace it with extracted weight
 			if (field === "qty" && value === "+1" && item && item.item_code) {
 				// Check if this is a weight-embedded barcode
-				const item_barcode = item.barcode || "";
-				if (item_barcode.startsWith("21") && item_barcode.length === 12) {
-					try {
-						const weight_str = item_barcode.substring(7, 12);
-						const weight = parseFloat(weight_str) / 1000;
-						args.value = -Math.abs(weight); // Set to negative extracted weight
-						args.item = args.item || item;
-						args.item.qty = -Math.abs(weight);
-						// console.log(`  🔧 Intercepted +1 increment, using extracted weight: ${-Math.abs(weight)}`);
-					} catch (e) {
-						console.error("Error extracting weight:", e);
-					}
+				const weight = retail_scale_plu_catalog.get_label_weight(item.barcode || "");
+				if (weight !== null) {
+					args.value = -Math.abs(weight); // Set to negative extracted weight
+					args.item = args.item || item;
+					args.item.qty = -Math.abs(weight);
+					// console.log(`  🔧 Intercepted +1 increment, using extracted weight: ${-Math.abs(weight)}`);
 				} else {
 					// For regular items, set to -1 instead of +1
 					args.value = -1;
@@ -467,6 +1049,11 @@ function patch_pos_controller() {
 			const item_row = this.get_item_from_frm(item);
 			const item_row_exists = !$.isEmptyObject(item_row);
 			
+			// Quantities entered on an existing return row are returned quantities
+			if (item_row_exists && field === "qty" && flt(args.value) > 0) {
+				args.value = -Math.abs(flt(args.value));
+			}
+			
 			// Only validate when adding new items (not updating existing ones)
 			if (!item_row_exists && item && item.item_code) {
 				// Get barcode from multiple possible sources
@@ -484,27 +1071,24 @@ function patch_pos_controller() {
 				if (!scanned_barcode && this.item_selector && this.item_selector.search_field) {
 					const search_value = this.item_selector.search_field.get_value();
 					// If search value matches barcode pattern (especially weight-embedded), use it
-					if (search_value && (search_value.length >= 8 || search_value.startsWith("21"))) {
+					if (search_value && (search_value.length >= 8 || retail_scale_plu_catalog.parse(search_value))) {
 						scanned_barcode = search_value;
 					}
 				}
 				
 				// Check if this is a weight-embedded barcode and extract quantity
-				if (scanned_barcode && scanned_barcode.startsWith("21") && scanned_barcode.length === 12) {
-					is_weight_barcode = true;
-					try {
-						const weight_str = scanned_barcode.substring(7, 12); // Last 5 digits
-						extracted_weight = parseFloat(weight_str) / 1000; // Convert grams to kg
-					} catch (e) {
-						console.error("Error extracting weight from barcode:", e);
-					}
-				}
+				extracted_weight = retail_scale_plu_catalog.get_label_weight(scanned_barcode);
+				is_weight_barcode = extracted_weight !== null;
 				
 				// Use extracted weight for dynamic barcodes, otherwise use scanned_qty
 				let scanned_qty = (is_weight_barcode && extracted_weight !== null) ? extracted_weight : (item.qty || (field === "qty" ? value : 0));
 				
-				// Validate the item
-				const validation = this.validate_return_item(item, scanned_barcode, scanned_qty);
+				// Validate the item, unless the item selector already matched it to an original row
+				const matched_item = item.pos_invoice_item && this.return_session
+					&& this.return_session.by_pos_invoice_item.get(item.pos_invoice_item);
+				const validation = matched_item
+					? { valid: true, matched_item: matched_item }
+					: this.validate_return_item(item, scanned_barcode, Math.abs(flt(scanned_qty)));
 				
 				if (!validation.valid) {
 					frappe.dom.unfreeze();
@@ -531,20 +1115,12 @@ function patch_pos_controller() {
 				// If validation passed and we have barcode, ensure it's stored in the item
 				if (scanned_barcode && validation.matched_item) {
 					item.barcode = scanned_barcode;
-					// Also store in args so it gets passed through
-					args.item = args.item || item;
-					args.item.barcode = scanned_barcode;
-					// Store scanned barcode for later use
-					args._scanned_barcode = scanned_barcode;
 				}
 				
 				// CRITICAL: Set pos_invoice_item to link back to original invoice item row
 				// This is required for server-side validation and returned quantity calculation
 				if (validation.matched_item && validation.matched_item.pos_invoice_item) {
 					item.pos_invoice_item = validation.matched_item.pos_invoice_item;
-					args.item = args.item || item;
-					args.item.pos_invoice_item = validation.matched_item.pos_invoice_item;
-					args._pos_invoice_item = validation.matched_item.pos_invoice_item;
 					// console.log(`  🔗 Linked to original invoice item: ${validation.matched_item.pos_invoice_item}`);
 				}
 				
@@ -555,109 +1131,69 @@ function patch_pos_controller() {
 				// CRITICAL: Override value to prevent +1 increment logic in original method
 				if (field === "qty") {
 					args.value = return_qty; // Set to negative quantity, not "+1"
-					// Mark that we've set a specific quantity to prevent increment logic
-					args._return_qty_set = true;
 				}
-				// Store extracted weight for post-processing
-				args._extracted_weight = extracted_weight;
-				args._is_weight_barcode = is_weight_barcode;
+				
+				// The original method only copies some fields to the new row, the others are
+				// set on the row before its item triggers run (see trigger_new_item_events)
+				return_row_values = { qty: return_qty };
+				if (item.barcode) {
+					return_row_values.barcode = item.barcode;
+				}
+				if (item.pos_invoice_item) {
+					return_row_values.pos_invoice_item = item.pos_invoice_item;
+				}
 				// console.log(`  📦 Setting quantity for return: ${return_qty} (extracted_weight: ${extracted_weight}, scanned_qty: ${scanned_qty})`);
 			}
 		}
 		
 		// Call original method
-		const result = await original_on_cart_update.call(this, args);
-		
-		// After item is added, ensure quantity is negative and barcode is stored
-		if (this.frm.doc.is_return && result) {
-			const { item, field } = args;
-			if (item && item.item_code && result) {
-				// result should be the item_row that was added
-				const added_item_row = result;
-				
-				// Get stored values from args
-				const stored_extracted_weight = args._extracted_weight;
-				const stored_is_weight_barcode = args._is_weight_barcode;
-				
-				// Function to set the correct quantity (only called after script triggers to avoid flickering)
-				const set_correct_quantity = async () => {
-					// For weight-embedded barcodes, ensure exact extracted weight is used (negative)
-					if (stored_is_weight_barcode && stored_extracted_weight !== null && added_item_row) {
-						const expected_qty = -Math.abs(stored_extracted_weight);
-						const current_qty = added_item_row.qty || 0;
-						// Only update if quantity doesn't match (accounting for sign)
-						if (Math.abs(Math.abs(current_qty) - stored_extracted_weight) > 0.001) {
-							try {
-								await frappe.model.set_value(added_item_row.doctype, added_item_row.name, "qty", expected_qty);
-								added_item_row.qty = expected_qty;
-								// console.log(`  📦 Set exact extracted weight quantity: ${expected_qty} (was ${current_qty})`);
-								return true; // Indicates we made a change
-							} catch (e) {
-								console.error("Error setting extracted weight quantity:", e);
-							}
-						}
-					} else if (added_item_row) {
-						// For regular items, ensure quantity is negative
-						const current_qty = added_item_row.qty || 0;
-						if (current_qty > 0 || (current_qty === 0 && field === "qty")) {
-							// Use the return_qty we set earlier, or make current qty negative
-							const qty_to_set = args._return_qty_set ? (args.item?.qty || -1) : -Math.abs(current_qty || 1);
-							try {
-								await frappe.model.set_value(added_item_row.doctype, added_item_row.name, "qty", qty_to_set);
-								added_item_row.qty = qty_to_set;
-								// console.log(`  📦 Corrected quantity to negative: ${added_item_row.qty}`);
-								return true; // Indicates we made a change
-							} catch (e) {
-								console.error("Error setting negative quantity:", e);
-							}
-						}
-					}
-					return false; // No change needed
-				};
-				
-				// Skip immediate setting to avoid flickering - wait for script triggers first
-				// Wait for trigger_new_item_events to complete (it triggers qty script)
-				await new Promise(resolve => setTimeout(resolve, 200));
-				
-				// Set quantity after script triggers (this is the one that will persist)
-				await set_correct_quantity();
-				
-				// Set quantity one more time after a longer delay to catch any late updates
-				setTimeout(async () => {
-					await set_correct_quantity();
-					// Update cart to reflect changes
-					if (this.update_cart_html && added_item_row) {
-						this.update_cart_html(added_item_row);
-					}
-				}, 300);
-				
-				// Ensure barcode is stored
-				const barcode_to_store = scanned_barcode || (args._scanned_barcode || "");
-				if (barcode_to_store && !added_item_row.barcode) {
-					try {
-						// Set barcode field in the form row
-						await frappe.model.set_value(added_item_row.doctype, added_item_row.name, "barcode", barcode_to_store);
-						// Also update the local object
-						added_item_row.barcode = barcode_to_store;
-					} catch (e) {
-						console.error("Error setting barcode:", e);
-					}
-				}
-				
-				// CRITICAL: Ensure pos_invoice_item is set for server-side validation
-				const pos_invoice_item_to_store = args._pos_invoice_item;
-				if (pos_invoice_item_to_store && !added_item_row.pos_invoice_item) {
-					try {
-						// Set pos_invoice_item field in the form row
-						await frappe.model.set_value(added_item_row.doctype, added_item_row.name, "pos_invoice_item", pos_invoice_item_to_store);
-						// Also update the local object
-						added_item_row.pos_invoice_item = pos_invoice_item_to_store;
-						// console.log(`  🔗 Set pos_invoice_item: ${pos_invoice_item_to_store}`);
-					} catch (e) {
-						console.error("Error setting pos_invoice_item:", e);
-					}
-				}
-			}
+		this.pending_return_row_values = return_row_values;
+		let result;
+		try {
+			result = await original_on_cart_update.call(this, args);
+		} finally {
+			this.pending_return_row_values = null;
+		}
+		
+		// Keep the remaining quantity of the original row up to date
+		if (this.frm.doc.is_return && result && this.return_session && result.pos_invoice_item) {
+			this.return_session.assign(result.name, result.pos_invoice_item, result.qty);
+		}
+		
+		return result;
+	};
+	
+	const original_trigger_new_item_events = erpnext.PointOfSale.Controller.prototype.trigger_new_item_events;
+	
+	// Patch trigger_new_item_events to apply the values of a new return row with its triggers
+	erpnext.PointOfSale.Controller.prototype.trigger_new_item_events = async function(item_row) {
+		const values = this.pending_return_row_values;
+		if (!values) {
+			return original_trigger_new_item_events.call(this, item_row);
+		}
+		
+		// Set before the item_code trigger, so item details are fetched for the return
+		// quantity with the barcode and original row already on the row
+		this.pending_return_row_values = null;
+		Object.assign(item_row, values);
+		
+		await original_trigger_new_item_events.call(this, item_row);
+		
+		// The trigger chain has finished: restore the return quantity if item details changed it
+		if (flt(item_row.qty) !== flt(values.qty)) {
+			await frappe.model.set_value(item_row.doctype, item_row.name, "qty", values.qty);
+		}
+	};
+	
+	const original_remove_item_from_cart = erpnext.PointOfSale.Controller.prototype.remove_item_from_cart;
+	
+	// Patch remove_item_from_cart to give the quantity of a removed return row back to its original row
+	erpnext.PointOfSale.Controller.prototype.remove_item_from_cart = async function() {
+		const { doctype, name } = this.item_details || {};
+		const result = await original_remove_item_from_cart.apply(this, arguments);
+		
+		if (this.return_session && name && !(locals[doctype] && locals[doctype][name])) {
+			this.return_session.release(name);
 		}
 		
 		return result;
@@ -827,12 +1363,13 @@ function patch_pos_remove_password() {
 	const original_remove_item = erpnext.PointOfSale.Controller.prototype.remove_item_from_cart;
 	
 	// Function to validate password via secure API
-	async function validate_removal_password(entered_password) {
+	async function validate_removal_password(entered_password, pos_profile) {
 		try {
 			const result = await frappe.call({
 				method: "retail_scale.api.validate_pos_removal_password",
 				args: {
-					entered_password: entered_password
+					entered_password: entered_password,
+					pos_profile: pos_profile
 				},
 				async: false,
 			});
@@ -855,7 +1392,7 @@ function patch_pos_remove_password() {
 	}
 	
 	// Function to show password prompt dialog
-	function show_password_prompt() {
+	function show_password_prompt(pos_profile) {
 		return new Promise((resolve) => {
 			let password_input = "";
 			let dialog = new frappe.ui.Dialog({
@@ -894,7 +1431,7 @@ function patch_pos_remove_password() {
 					}
 					
 					// Validate password via secure API
-					const validation = await validate_removal_password(password_input);
+					const validation = await validate_removal_password(password_input, pos_profile);
 					
 					if (validation.valid) {
 						dialog.hide();
@@ -949,7 +1486,7 @@ function patch_pos_remove_password() {
 	// Patch remove_item_from_cart to require password
 	erpnext.PointOfSale.Controller.prototype.remove_item_from_cart = async function() {
 		// Show password prompt
-		const password_correct = await show_password_prompt();
+		const password_correct = await show_password_prompt(this.pos_profile);
 		
 		if (!password_correct) {
 			// Password incorrect or cancelled, don't remove item
@@ -0,0 +1,99 @@
+import hashlib
+import hmac
+import os
+
+import frappe
+from frappe.utils.password import get_decrypted_password
+
+from retail_scale.cache import WorkerCache
+
+# Salted hashes of the enabled POS Keys and the Retail Settings key, invalidated on save
+removal_key_cache = WorkerCache("retail_scale:pos_removal_keys")
+REMOVAL_KEY_HASH_ITERATIONS = 10000
+
+# Failed attempts allowed per terminal before it is locked out for the window
+REMOVAL_MAX_ATTEMPTS = 5
+REMOVAL_ATTEMPT_WINDOW = 300
+REMOVAL_ATTEMPTS_KEY = "retail_scale:pos_removal_attempts"
+
+
+def get_removal_key_hashes():
+	"""
+	Get the salt and the hashes of all valid removal keys.
+
+	Returns a tuple of (salt, digests); digests is empty if no key is configured.
+	"""
+	return removal_key_cache.get("hashes", load_removal_key_hashes)
+
+
+def load_removal_key_hashes():
+	keys = frappe.get_all("POS Key", filters={"disabled": 0}, pluck="password")
+	keys.append(
+		get_decrypted_password(
+			doctype="Retail Settings",
+			name="Retail Settings",
+			fieldname="pos_key",
+			raise_exception=False,
+		)
+	)
+
+	# One salt per load so the entered key is hashed once for all stored keys
+	salt = os.urandom(16)
+	return salt, tuple(hash_removal_key(key, salt) for key in set(keys) if key)
+
+
+def hash_removal_key(key, salt):
+	return hashlib.pbkdf2_hmac("sha256", key.encode(), salt, REMOVAL_KEY_HASH_ITERATIONS)
+
+
+def clear_removal_key_cache(doc=None, method=None, *args, **kwargs):
+	removal_key_cache.clear()
+	# A request that loaded the old keys before this commit may cache them again
+	frappe.db.after_commit.add(removal_key_cache.clear)
+
+
+def is_valid_removal_key(entered_key):
+	"""Check a key against every valid removal key in constant time"""
+	salt, digests = get_removal_key_hashes()
+	entered = hash_removal_key(entered_key, salt)
+
+	matched = False
+	for digest in digests:
+		# No early exit, every stored key is compared
+		matched |= hmac.compare_digest(entered, digest)
+
+	return matched
+
+
+def has_removal_key():
+	return bool(get_removal_key_hashes()[1])
+
+
+def is_assigned_pos_profile(pos_profile):
+	"""Whether the POS Profile exists and the session user is one of its users"""
+	return bool(
+		frappe.db.exists(
+			"POS Profile User",
+			{"parent": pos_profile, "parenttype": "POS Profile", "user": frappe.session.user},
+		)
+	)
+
+
+def get_removal_attempts_key(terminal):
+	return frappe.cache.make_key(f"{REMOVAL_ATTEMPTS_KEY}:{frappe.session.user}:{terminal}")
+
+
+def is_removal_throttled(terminal):
+	attempts = frappe.cache.get(get_removal_attempts_key(terminal))
+	return int(attempts or 0) >= REMOVAL_MAX_ATTEMPTS
+
+
+def record_failed_removal_attempt(terminal):
+	"""Count a failed attempt; the window starts with the first failure"""
+	key = get_removal_attempts_key(terminal)
+	if frappe.cache.incr(key) == 1:
+		frappe.cache.expire(key, REMOVAL_ATTEMPT_WINDOW)
+
+
+def reset_removal_attempts(terminal):
+	frappe.cache.delete(get_removal_attempts_key(terminal))
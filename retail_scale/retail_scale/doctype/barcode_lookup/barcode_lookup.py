@@ -0,0 +1,25 @@
+# Copyright (c) 2024, Retail Scale and contributors
+# For license information, please see license.txt
+
+# import frappe
+from frappe.model.document import Document
+
+
+class BarcodeLookup(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		barcode: DF.Data
+		batch_no: DF.Link | None
+		item_code: DF.Link
+		kind: DF.Literal["Item Barcode", "Serial No", "Batch"]
+		serial_no: DF.Link | None
+		uom: DF.Link | None
+	# end: auto-generated types
+
+	pass
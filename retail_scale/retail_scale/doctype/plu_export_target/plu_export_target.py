@@ -0,0 +1,27 @@
+# Copyright (c) 2024, Retail Scale and contributors
+# For license information, please see license.txt
+
+# import frappe
+from frappe.model.document import Document
+
+
+class PLUExportTarget(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		enabled: DF.Check
+		output_folder: DF.Data
+		parent: DF.Data
+		parentfield: DF.Data
+		parenttype: DF.Data
+		pos_profile: DF.Link | None
+		price_list: DF.Link | None
+		warehouse: DF.Link | None
+	# end: auto-generated types
+
+	pass
@@ -0,0 +1,25 @@
+# Copyright (c) 2024, Retail Scale and contributors
+# For license information, please see license.txt
+
+# import frappe
+from frappe.model.document import Document
+
+
+class POSReturnLedger(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		customer: DF.Link | None
+		item_code: DF.Link | None
+		pos_invoice_item: DF.Data
+		return_against: DF.Link
+		returned_qty: DF.Float
+		returned_stock_qty: DF.Float
+	# end: auto-generated types
+
+	pass
@@ -0,0 +1,33 @@
+# Copyright (c) 2024, Retail Scale and contributors
+# For license information, please see license.txt
+
+# import frappe
+from frappe.model.document import Document
+
+
+class ScaleBarcodeRule(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		barcode_length: DF.Int
+		divisor: DF.Float
+		enabled: DF.Check
+		has_check_digit: DF.Check
+		item_code_length: DF.Int
+		item_code_offset: DF.Int
+		item_code_source: DF.Literal["Item Code", "PLU Code"]
+		label_type: DF.Literal["Weight", "Price"]
+		parent: DF.Data
+		parentfield: DF.Data
+		parenttype: DF.Data
+		prefix: DF.Data
+		value_length: DF.Int
+		value_offset: DF.Int
+	# end: auto-generated types
+
+	pass
@@ -0,0 +1,29 @@
+# Copyright (c) 2024, Retail Scale and contributors
+# For license information, please see license.txt
+
+# import frappe
+from frappe.model.document import Document
+
+
+class ScaleDevice(Document):
+	# begin: auto-generated types
+	# This code is auto-generated. Do not modify anything in this block.
+
+	from typing import TYPE_CHECKING
+
+	if TYPE_CHECKING:
+		from frappe.types import DF
+
+		enabled: DF.Check
+		full_only: DF.Check
+		host: DF.Data
+		output_folder: DF.Data | None
+		parent: DF.Data
+		parentfield: DF.Data
+		parenttype: DF.Data
+		port: DF.Int
+		scale_format: DF.Literal["JHMA", "DIGI", "CAS"]
+		scale_name: DF.Data
+	# end: auto-generated types
+
+	pass
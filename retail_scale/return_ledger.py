@@ -0,0 +1,237 @@
+import frappe
+from frappe.query_builder import DocType
+from frappe.query_builder import functions as fn
+from frappe.utils import flt, now
+
+
+def update_return_ledger(doc, method=None):
+	"""Refresh the ledger rows touched by a return POS Invoice on submit and cancel"""
+	if not doc.is_return or not doc.return_against:
+		return
+
+	pos_invoice_items = {item.pos_invoice_item for item in doc.items if item.pos_invoice_item}
+	if pos_invoice_items:
+		refresh_return_ledger(doc.return_against, pos_invoice_items)
+
+
+def refresh_return_ledger(return_against, pos_invoice_items=None):
+	"""
+	Recompute the ledger rows of an original POS Invoice from its submitted returns.
+
+	Args:
+		return_against: Name of the original POS Invoice
+		pos_invoice_items: Optional set of original row names to refresh, all rows if not given
+	"""
+	# Returns against the same invoice submitted at the same time refresh its rows one
+	# after the other. The reads below lock too, so they see the rows and returns the
+	# other transaction committed while this one waited.
+	customer = frappe.db.get_value("POS Invoice", return_against, "customer", for_update=True)
+	totals = get_returned_qty_map(
+		return_against, customer, pos_invoice_items=pos_invoice_items, for_update=True
+	)
+
+	filters = {"return_against": return_against}
+	if pos_invoice_items:
+		filters["name"] = ["in", list(pos_invoice_items)]
+	existing = set(frappe.get_all("POS Return Ledger", filters=filters, pluck="name", for_update=True))
+
+	# Rows whose returns were all cancelled
+	if stale := existing - totals.keys():
+		frappe.db.delete("POS Return Ledger", {"name": ["in", list(stale)]})
+
+	for row_name, total in totals.items():
+		values = {"returned_qty": flt(total.qty), "returned_stock_qty": flt(total.stock_qty)}
+		if row_name in existing:
+			frappe.db.set_value("POS Return Ledger", row_name, values)
+		else:
+			frappe.get_doc(
+				{
+					"doctype": "POS Return Ledger",
+					"pos_invoice_item": row_name,
+					"return_against": return_against,
+					"customer": customer,
+					"item_code": total.item_code,
+					**values,
+				}
+			).insert(ignore_permissions=True)
+
+
+def rebuild_return_ledger(return_against=None):
+	"""
+	Rebuild the ledger from all submitted return POS Invoices, for backfill or repair.
+
+	Args:
+		return_against: Optional name of an original POS Invoice to rebuild alone
+
+	Returns:
+		Number of ledger rows written
+	"""
+	frappe.db.delete("POS Return Ledger", {"return_against": return_against} if return_against else {})
+
+	original_invoice = DocType("POS Invoice").as_("original_invoice")
+	pos_invoice = DocType("POS Invoice")
+	pos_invoice_item = DocType("POS Invoice Item")
+
+	query = (
+		frappe.qb.from_(pos_invoice)
+		.join(pos_invoice_item)
+		.on(pos_invoice.name == pos_invoice_item.parent)
+		.join(original_invoice)
+		.on(original_invoice.name == pos_invoice.return_against)
+		.select(
+			pos_invoice_item.pos_invoice_item,
+			pos_invoice.return_against,
+			original_invoice.customer,
+			fn.Max(pos_invoice_item.item_code).as_("item_code"),
+			fn.Sum(fn.Abs(pos_invoice_item.qty)).as_("qty"),
+			fn.Sum(fn.Abs(pos_invoice_item.stock_qty)).as_("stock_qty"),
+		)
+		.where(
+			(pos_invoice.docstatus == 1)
+			& (pos_invoice.is_return == 1)
+			# Same condition as erpnext: only returns made by the original customer count
+			& (pos_invoice.customer == original_invoice.customer)
+			& (fn.IfNull(pos_invoice_item.pos_invoice_item, "") != "")
+		)
+		.groupby(pos_invoice_item.pos_invoice_item, pos_invoice.return_against, original_invoice.customer)
+	)
+	if return_against:
+		query = query.where(pos_invoice.return_against == return_against)
+
+	timestamp = now()
+	user = frappe.session.user
+	values = [
+		(
+			row.pos_invoice_item,
+			row.pos_invoice_item,
+			row.return_against,
+			row.customer,
+			row.item_code,
+			flt(row.qty),
+			flt(row.stock_qty),
+			timestamp,
+			timestamp,
+			user,
+			user,
+		)
+		for row in query.run(as_dict=True)
+	]
+
+	frappe.db.bulk_insert(
+		"POS Return Ledger",
+		fields=[
+			"name",
+			"pos_invoice_item",
+			"return_against",
+			"customer",
+			"item_code",
+			"returned_qty",
+			"returned_stock_qty",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+		],
+		values=values,
+	)
+
+	return len(values)
+
+
+def get_ledger_returned_qty_map(return_against, exclude_return_invoice=None):
+	"""
+	Read the quantities already returned against each row of a POS Invoice from the ledger.
+
+	Args:
+		return_against: Name of the original POS Invoice
+		exclude_return_invoice: Optional name of return invoice to leave out
+
+	Returns:
+		Dict of original POS Invoice Item name -> {"qty": ..., "stock_qty": ...}
+	"""
+	returned = {
+		row.name: frappe._dict(qty=row.returned_qty, stock_qty=row.returned_stock_qty, customer=row.customer)
+		for row in frappe.get_all(
+			"POS Return Ledger",
+			fields=["name", "customer", "returned_qty", "returned_stock_qty"],
+			filters={"return_against": return_against},
+		)
+	}
+
+	if exclude_return_invoice and returned:
+		# Only a submitted return of the original customer is counted in the ledger
+		excluded = frappe.db.get_value(
+			"POS Invoice",
+			{
+				"name": exclude_return_invoice,
+				"return_against": return_against,
+				"is_return": 1,
+				"docstatus": 1,
+			},
+			"customer",
+		)
+		if excluded is not None:
+			for row in frappe.get_all(
+				"POS Invoice Item",
+				fields=["pos_invoice_item", "qty", "stock_qty"],
+				filters={"parent": exclude_return_invoice, "parenttype": "POS Invoice"},
+			):
+				total = returned.get(row.pos_invoice_item)
+				if total and total.customer == excluded:
+					total.qty -= abs(flt(row.qty))
+					total.stock_qty -= abs(flt(row.stock_qty))
+
+	return returned
+
+
+def get_returned_qty_map(
+	return_against, customer, exclude_return_invoice=None, pos_invoice_items=None, for_update=False
+):
+	"""
+	Get the quantities already returned against each row of a POS Invoice.
+
+	Same conditions as erpnext's get_returned_qty_map_for_row (submitted returns of
+	the same customer), but aggregated for all rows in one GROUP BY query.
+
+	Args:
+		return_against: Name of the original POS Invoice
+		customer: Customer of the original POS Invoice
+		exclude_return_invoice: Optional name of return invoice to leave out
+		pos_invoice_items: Optional set of original row names to aggregate
+		for_update: Lock the rows read, to see the latest committed returns
+
+	Returns:
+		Dict of original POS Invoice Item name -> {"qty": ..., "stock_qty": ..., "item_code": ...}
+	"""
+	pos_invoice = DocType("POS Invoice")
+	pos_invoice_item = DocType("POS Invoice Item")
+
+	query = (
+		frappe.qb.from_(pos_invoice)
+		.join(pos_invoice_item)
+		.on(pos_invoice.name == pos_invoice_item.parent)
+		.select(
+			pos_invoice_item.pos_invoice_item,
+			fn.Max(pos_invoice_item.item_code).as_("item_code"),
+			fn.Sum(fn.Abs(pos_invoice_item.qty)).as_("qty"),
+			fn.Sum(fn.Abs(pos_invoice_item.stock_qty)).as_("stock_qty"),
+		)
+		.where(
+			(pos_invoice.return_against == return_against)
+			& (pos_invoice.customer == customer)
+			& (pos_invoice.docstatus == 1)
+			& (pos_invoice.is_return == 1)
+		)
+		.groupby(pos_invoice_item.pos_invoice_item)
+	)
+
+	if exclude_return_invoice:
+		query = query.where(pos_invoice.name != exclude_return_invoice)
+
+	if pos_invoice_items:
+		query = query.where(pos_invoice_item.pos_invoice_item.isin(list(pos_invoice_items)))
+
+	if for_update:
+		query = query.for_update()
+
+	return {row.pos_invoice_item: row for row in query.run(as_dict=True) if row.pos_invoice_item}
@@ -0,0 +1,335 @@
+from typing import NamedTuple
+
+import frappe
+from frappe.utils import cint, flt
+
+from retail_scale.cache import WorkerCache
+from retail_scale.utils import PLU_EXPORT_CHUNK_SIZE, get_plu_item_groups
+
+
+class ScaleBarcodeRule(NamedTuple):
+	prefix: str
+	barcode_length: int
+	label_type: str
+	item_code_source: str
+	item_code_offset: int
+	item_code_length: int
+	value_offset: int
+	value_length: int
+	divisor: float
+	has_check_digit: bool
+
+
+class ScaleLabel(NamedTuple):
+	rule: ScaleBarcodeRule
+	code: str
+	value: float
+
+	@property
+	def is_price(self):
+		return self.rule.label_type == "Price"
+
+	@property
+	def is_plu_code(self):
+		return self.rule.item_code_source == "PLU Code"
+
+
+# Used when no rule is configured in Retail Settings: 21-12345-00500 (prefix=21, item_code=12345, weight=500g)
+DEFAULT_RULES = (
+	ScaleBarcodeRule(
+		prefix="21",
+		barcode_length=12,
+		label_type="Weight",
+		item_code_source="Item Code",
+		item_code_offset=2,
+		item_code_length=5,
+		value_offset=7,
+		value_length=5,
+		divisor=1000,
+		has_check_digit=False,
+	),
+)
+
+# Compiled rules, invalidated when Retail Settings is saved
+rule_cache = WorkerCache("retail_scale:scale_barcode_rules")
+
+# Embedded code -> item info for scale labels, invalidated by Item hooks
+SCALE_ITEM_CACHE_SIZE = 20000
+scale_item_cache = WorkerCache("retail_scale:scale_items", maxsize=SCALE_ITEM_CACHE_SIZE)
+SCALE_ITEM_FIELDS = [
+	"name",
+	"item_name",
+	"image",
+	"custom_plu_code",
+	"has_batch_no",
+	"has_serial_no",
+	"is_stock_item",
+	"stock_uom",
+]
+
+
+def get_scale_barcode_rules():
+	"""
+	Get the compiled scale barcode rules.
+
+	Returns a tuple of (prefix_lengths, rules) where `rules` maps
+	(barcode_length, prefix) to its rule, so matching a barcode costs one dict lookup
+	per distinct prefix length.
+	"""
+	return rule_cache.get("compiled", compile_scale_barcode_rules)
+
+
+def compile_scale_barcode_rules():
+	rules = [
+		ScaleBarcodeRule(
+			prefix=row.prefix,
+			barcode_length=cint(row.barcode_length),
+			label_type=row.label_type,
+			item_code_source=row.item_code_source,
+			item_code_offset=cint(row.item_code_offset),
+			item_code_length=cint(row.item_code_length),
+			value_offset=cint(row.value_offset),
+			value_length=cint(row.value_length),
+			divisor=flt(row.divisor) or 1,
+			has_check_digit=bool(row.has_check_digit),
+		)
+		for row in frappe.get_all(
+			"Scale Barcode Rule",
+			fields=[
+				"prefix",
+				"barcode_length",
+				"label_type",
+				"item_code_source",
+				"item_code_offset",
+				"item_code_length",
+				"value_offset",
+				"value_length",
+				"divisor",
+				"has_check_digit",
+			],
+			filters={"parenttype": "Retail Settings", "enabled": 1},
+			order_by="idx asc",
+		)
+		if row.prefix
+	] or DEFAULT_RULES
+
+	by_key = {}
+	for rule in rules:
+		# The first matching row wins, like in the settings table
+		by_key.setdefault((rule.barcode_length, rule.prefix), rule)
+
+	prefix_lengths = tuple(sorted({len(rule.prefix) for rule in rules}, reverse=True))
+	return prefix_lengths, by_key
+
+
+def clear_scale_barcode_rules(doc=None, method=None):
+	rule_cache.clear()
+
+
+def parse_scale_barcode(barcode):
+	"""
+	Match a barcode against the scale barcode rules.
+
+	Returns a ScaleLabel with the embedded item code and the weight or price already
+	divided, or None if the barcode is not a scale label.
+	"""
+	if not barcode or not barcode.isdigit():
+		return None
+
+	prefix_lengths, rules = get_scale_barcode_rules()
+	length = len(barcode)
+	for prefix_length in prefix_lengths:
+		rule = rules.get((length, barcode[:prefix_length]))
+		if rule:
+			break
+	else:
+		return None
+
+	if rule.has_check_digit and not has_valid_check_digit(barcode):
+		return None
+
+	code = barcode[rule.item_code_offset : rule.item_code_offset + rule.item_code_length]
+	value = barcode[rule.value_offset : rule.value_offset + rule.value_length]
+	if not code or not value:
+		# Offsets outside the barcode, the rule is misconfigured
+		return None
+
+	return ScaleLabel(rule, code, int(value) / rule.divisor)
+
+
+def has_valid_check_digit(barcode):
+	"""Validate the GTIN (EAN-8, UPC-A, EAN-13) check digit in the last position"""
+	digits = [int(d) for d in barcode]
+	total = sum(d * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits[:-1])))
+	return (10 - total % 10) % 10 == digits[-1]
+
+
+def get_scale_item(label):
+	"""
+	Get the item for the code embedded in a scale label.
+
+	Returns a dict with item_code, item_name, image, the batch/serial and stock item
+	flags and stock_uom, or None
+	if there is no such item. Results, including misses, are cached per worker in front
+	of Redis, so a scan does not query the database in the steady state.
+	"""
+	if label.is_plu_code:
+		plu_code = cint(label.code)
+		item = scale_item_cache.get(
+			get_scale_item_key(label),
+			lambda: load_scale_item(
+				{
+					"custom_plu_code": plu_code,
+					"item_group": ["in", list(get_plu_item_groups())],
+					"disabled": 0,
+				}
+			),
+		)
+	else:
+		item = scale_item_cache.get(get_scale_item_key(label), lambda: load_scale_item({"name": label.code}))
+
+	return item or None
+
+
+def get_scale_items(labels):
+	"""
+	Resolve the items of many scale labels at once.
+
+	Returns a dict of label -> item info for the labels whose item exists. Codes that
+	are not cached are loaded with one `IN` query per item code source and cached,
+	misses included.
+	"""
+	keys = {label: get_scale_item_key(label) for label in labels}
+	cached = scale_item_cache.get_many(list(set(keys.values())))
+
+	missing_codes = {key for key in keys.values() if key not in cached and key.startswith("item:")}
+	missing_plu_codes = {key for key in keys.values() if key not in cached and key.startswith("plu:")}
+
+	loaded = {}
+	if missing_codes:
+		loaded.update({key: {} for key in missing_codes})
+		for item in frappe.get_all(
+			"Item",
+			fields=SCALE_ITEM_FIELDS,
+			filters={"name": ["in", [key.split(":", 1)[1] for key in missing_codes]]},
+		):
+			loaded[f"item:{item.name}"] = get_scale_item_info(item)
+
+	if missing_plu_codes:
+		loaded.update({key: {} for key in missing_plu_codes})
+		for item in frappe.get_all(
+			"Item",
+			fields=SCALE_ITEM_FIELDS,
+			filters={
+				"custom_plu_code": ["in", [cint(key.split(":", 1)[1]) for key in missing_plu_codes]],
+				"item_group": ["in", list(get_plu_item_groups())],
+				"disabled": 0,
+			},
+		):
+			loaded[f"plu:{item.custom_plu_code}"] = get_scale_item_info(item)
+
+	scale_item_cache.set_many(loaded)
+	cached.update(loaded)
+
+	return {label: cached[key] for label, key in keys.items() if cached.get(key)}
+
+
+def get_scale_item_key(label):
+	return f"plu:{cint(label.code)}" if label.is_plu_code else f"item:{label.code}"
+
+
+def load_scale_item(filters):
+	item = frappe.db.get_value("Item", filters, SCALE_ITEM_FIELDS, as_dict=True)
+	# A miss is cached as an empty dict so unknown codes do not query the database again
+	return get_scale_item_info(item) if item else {}
+
+
+def get_scale_item_info(item):
+	return {
+		"item_code": item.name,
+		"item_name": item.item_name,
+		"image": item.image,
+		"has_batch_no": item.has_batch_no,
+		"has_serial_no": item.has_serial_no,
+		"is_stock_item": item.is_stock_item,
+		"stock_uom": item.stock_uom,
+	}
+
+
+def warm_scale_item_cache(item_codes=None):
+	"""
+	Load the items of the PLU groups into the scale item cache, PLU_EXPORT_CHUNK_SIZE
+	at a time. Pass `item_codes` to load only those items, e.g. the ones an
+	incremental export wrote.
+	"""
+	plu_item_groups = get_plu_item_groups()
+	if not plu_item_groups:
+		return
+
+	for chunk in iter_scale_item_chunks(plu_item_groups, item_codes):
+		items = {}
+		for item in chunk:
+			info = get_scale_item_info(item)
+			items[f"item:{item.name}"] = info
+			if item.custom_plu_code:
+				items[f"plu:{item.custom_plu_code}"] = info
+
+		scale_item_cache.set_many(items)
+
+
+def iter_scale_item_chunks(plu_item_groups, item_codes=None):
+	filters = {"item_group": ["in", list(plu_item_groups)], "disabled": 0}
+
+	if item_codes is not None:
+		item_codes = sorted(item_codes)
+		for start in range(0, len(item_codes), PLU_EXPORT_CHUNK_SIZE):
+			yield frappe.get_all(
+				"Item",
+				fields=SCALE_ITEM_FIELDS,
+				filters={**filters, "name": ["in", item_codes[start : start + PLU_EXPORT_CHUNK_SIZE]]},
+			)
+		return
+
+	last = None
+	while True:
+		chunk = frappe.get_all(
+			"Item",
+			fields=SCALE_ITEM_FIELDS,
+			filters={**filters, "name": [">", last]} if last else filters,
+			order_by="name asc",
+			limit=PLU_EXPORT_CHUNK_SIZE,
+		)
+		yield chunk
+		if len(chunk) < PLU_EXPORT_CHUNK_SIZE:
+			return
+		last = chunk[-1].name
+
+
+def invalidate_scale_item(doc, method=None, *args, **kwargs):
+	"""
+	Drop the cached scale item entries of an Item on update, rename or delete.
+
+	PLU code keys are only cached for items of the PLU groups. Other items can still
+	be cached by name for labels carrying the item code, only that key is dropped and
+	only workers that cached it are told.
+	"""
+	keys = {f"item:{doc.name}"}
+	if method == "after_rename" and args:
+		keys.add(f"item:{args[0]}")
+
+	plu_item_groups = get_plu_item_groups()
+	previous = doc.get_doc_before_save()
+	for item in (doc, previous):
+		if item and item.item_group in plu_item_groups and cint(item.custom_plu_code):
+			keys.add(f"plu:{cint(item.custom_plu_code)}")
+
+	scale_item_cache.delete(*keys)
+
+
+def clear_scale_item_cache(doc=None, method=None, *args, **kwargs):
+	"""Drop all cached scale items, PLU code lookups depend on the PLU group tree"""
+	scale_item_cache.clear()
+
+
+def get_scale_item_cache_stats():
+	return scale_item_cache.get_stats()
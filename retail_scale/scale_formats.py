@@ -0,0 +1,152 @@
+from typing import NamedTuple
+
+import frappe
+
+
+class PLUEntry(NamedTuple):
+	"""One exported item: the snapshot every scale format renders from"""
+
+	plu_code: int
+	item_code: str
+	item_name: str
+	price: float
+	stock_uom: str
+	is_weighed: bool
+
+
+class ScaleFormat:
+	"""
+	A scale export format, rendering one line per PLU entry.
+
+	The export resolves the item and price snapshot once and renders every enabled
+	format in the same pass, each to its own file in the site's public folder. Apps add
+	formats by listing dotted paths to ScaleFormat subclasses in the
+	`retail_scale_scale_formats` hook and adding their name to the Scale Export Format
+	options.
+	"""
+
+	name = None
+	default_file_name = None
+	line_separator = "\n"
+	# Whether scales of this format can apply pushed changes without the full table
+	supports_delta = True
+	# Highest PLU code the format can hold, None for no limit
+	max_plu_code = None
+
+	def __init__(self, file_name=None):
+		self.file_name = file_name or self.default_file_name
+
+	def render(self, entry):
+		raise NotImplementedError
+
+
+class JHMAFormat(ScaleFormat):
+	"""
+	JHMA scales.
+
+	FORMAT: PLU,itemcode,name,price,unit
+	Result: 1,00001,Banana,45.0,0
+	"""
+
+	name = "JHMA"
+	default_file_name = "PLU.txt"
+
+	def render(self, entry):
+		return f"{entry.plu_code},{entry.item_code},{entry.item_name[:20]},{entry.price},0"
+
+
+class DIGIFormat(ScaleFormat):
+	"""
+	DIGI scales, fixed width records with CRLF line endings.
+
+	FORMAT: PLU (6, zero padded), unit flag (1, 0 = weighed, 1 = counted),
+	price in minor units (8, zero padded), item code (16), name (24)
+	Result: 00000100000450000001           Banana
+	"""
+
+	name = "DIGI"
+	default_file_name = "PLU_DIGI.txt"
+	line_separator = "\r\n"
+	max_plu_code = 999999
+
+	def render(self, entry):
+		if not 0 < entry.plu_code <= self.max_plu_code:
+			# A wider code would shift every field after it
+			raise ValueError(
+				f"DIGI: PLU code {entry.plu_code} of item {entry.item_code} does not fit 6 digits"
+			)
+		return (
+			f"{entry.plu_code:06d}"
+			f"{0 if entry.is_weighed else 1}"
+			f"{round(entry.price * 100):08d}"
+			f"{entry.item_code[:16]:<16}"
+			f"{entry.item_name[:24]:<24}"
+		)
+
+
+class CASFormat(ScaleFormat):
+	"""
+	CAS scales, CSV with a quoted name and a weighed/counted unit type.
+
+	FORMAT: PLU,itemcode,"name",price in minor units,unit type (W = weighed, N = counted)
+	Result: 1,00001,"Banana",4500,W
+	"""
+
+	name = "CAS"
+	default_file_name = "PLU_CAS.csv"
+	line_separator = "\r\n"
+
+	def render(self, entry):
+		return ",".join(
+			[
+				str(entry.plu_code),
+				quote_csv_field(entry.item_code),
+				quote_csv_field(entry.item_name[:28], always=True),
+				str(round(entry.price * 100)),
+				"W" if entry.is_weighed else "N",
+			]
+		)
+
+
+def quote_csv_field(value, always=False):
+	"""Quote a CSV field, doubling its quotes, when it needs it or `always`"""
+	if always or any(char in value for char in ',"\r\n'):
+		return '"{}"'.format(value.replace('"', '""'))
+	return value
+
+
+BUILTIN_SCALE_FORMATS = (JHMAFormat, DIGIFormat, CASFormat)
+
+
+def get_scale_format_classes():
+	"""Get the built-in and hooked scale formats as a dict of name -> class"""
+	classes = list(BUILTIN_SCALE_FORMATS)
+	classes += [frappe.get_attr(path) for path in frappe.get_hooks("retail_scale_scale_formats")]
+	return {cls.name: cls for cls in classes}
+
+
+def get_enabled_scale_formats():
+	"""
+	Get an instance of every format enabled in Retail Settings.
+
+	Without any Scale Export Format row only JHMA is exported, to PLU.txt.
+	"""
+	rows = frappe.get_all(
+		"Scale Export Format",
+		fields=["scale_format", "file_name"],
+		filters={"parenttype": "Retail Settings", "enabled": 1},
+		order_by="idx asc",
+	)
+	if not rows:
+		return [JHMAFormat()]
+
+	classes = get_scale_format_classes()
+	formats = []
+	for row in rows:
+		cls = classes.get(row.scale_format)
+		if not cls:
+			frappe.logger().error(f"PLU Export: Unknown scale format '{row.scale_format}'")
+			continue
+		formats.append(cls(row.file_name))
+
+	return formats
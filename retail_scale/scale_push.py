@@ -0,0 +1,402 @@
+"""
+Push the exported PLU table to the scales over TCP.
+
+Each scale listens on host:port and takes one session per connection, one record
+per line:
+
+	BEGIN FULL|DELTA <records>
+	U <plu_code> <line rendered in the scale's format>
+	D <plu_code>
+	COMMIT
+
+and answers `OK <records>` once the records are applied, or `ERR <reason>`. A FULL
+session replaces the scale's table, a DELTA session only upserts and deletes the
+given PLU codes. Run `python -m retail_scale.fake_scale` for local scales to push to.
+
+Every push snapshots the index of each export target. A scale that acknowledged a
+snapshot that is still on disk gets the difference to the current one, others get
+the full table.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import time
+from contextlib import suppress
+from typing import NamedTuple
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, now_datetime
+
+from retail_scale.metrics import log_sampled, set_gauge
+from retail_scale.scale_formats import get_scale_format_classes
+from retail_scale.utils import (
+	atomic_write,
+	get_plu_export_targets,
+	get_plu_index_path,
+	is_current_plu_index,
+	read_plu_index,
+)
+
+SCALE_PUSH_JOB_ID = "retail_scale:scale_push"
+SCALE_PUSH_DIRTY_KEY = "retail_scale:scale_push_dirty"
+# Set when a scale could not be updated, the scheduler pushes again
+SCALE_PUSH_RETRY_KEY = "retail_scale:scale_push_retry"
+# Per scale: the snapshot it acknowledged, when and the last error
+SCALE_PUSH_STATE_KEY = "retail_scale:scale_push_state"
+# Seconds before the first retry of a failed scale, doubled on every further retry
+SCALE_PUSH_BACKOFF = 0.5
+SCALE_PUSH_TIMEOUT = 600  # seconds, for the whole job
+
+
+class ScaleDevice(NamedTuple):
+	scale_name: str
+	host: str
+	port: int
+	output_folder: str
+	scale_format: str
+	full_only: bool
+
+	@property
+	def key(self):
+		return f"{self.host}:{self.port}"
+
+
+class ScalePushResult(NamedTuple):
+	device: ScaleDevice
+	success: bool
+	attempts: int
+	records: int
+	error: str | None = None
+
+
+class ScalePushError(Exception):
+	pass
+
+
+def queue_scale_push():
+	"""Mark the scales out of date and make sure one push job is queued"""
+	if not frappe.get_cached_doc("Retail Settings").enable_scale_push:
+		return
+
+	frappe.cache.set_value(SCALE_PUSH_DIRTY_KEY, time.time())
+	enqueue_scale_push_job()
+
+
+def enqueue_scale_push_job():
+	# Deduplicated on job_id: a running job sees the dirty flag and pushes again
+	frappe.enqueue(
+		"retail_scale.scale_push.process_queued_scale_push",
+		queue="long",
+		timeout=SCALE_PUSH_TIMEOUT,
+		job_id=SCALE_PUSH_JOB_ID,
+		deduplicate=True,
+	)
+
+
+def enqueue_dirty_scale_push():
+	"""Scheduler safety net: push again if a change or a failed scale is pending"""
+	if not frappe.get_cached_doc("Retail Settings").enable_scale_push:
+		return
+
+	if frappe.cache.get_value(SCALE_PUSH_RETRY_KEY, expires=True):
+		frappe.cache.delete_value(SCALE_PUSH_RETRY_KEY)
+		frappe.cache.set_value(SCALE_PUSH_DIRTY_KEY, time.time())
+
+	if frappe.cache.get_value(SCALE_PUSH_DIRTY_KEY, expires=True):
+		enqueue_scale_push_job()
+
+
+def process_queued_scale_push():
+	"""Background job: push until no export happened during the last push"""
+	while frappe.cache.get_value(SCALE_PUSH_DIRTY_KEY, expires=True):
+		frappe.cache.delete_value(SCALE_PUSH_DIRTY_KEY)
+		results = push_plu_to_scales()
+		# A target that has not been exported yet is pushed by its first export
+		if any(not result.success and result.attempts for result in results):
+			frappe.cache.set_value(SCALE_PUSH_RETRY_KEY, 1)
+
+
+def validate_scale_devices(doc, method=None):
+	"""Retail Settings validate: every enabled scale must have an export target and a known format"""
+	folders = {
+		(row.output_folder or "").strip("/") for row in doc.get("plu_export_targets") or [] if row.enabled
+	} or {""}
+	format_classes = get_scale_format_classes()
+	for row in doc.get("scale_devices") or []:
+		if not row.enabled:
+			continue
+		if (row.output_folder or "").strip("/") not in folders:
+			frappe.throw(
+				_("Row #{0}: Scale {1} has no enabled PLU Export Target with Output Folder {2}").format(
+					row.idx, row.scale_name, row.output_folder or _("(site)")
+				)
+			)
+		if (row.scale_format or "JHMA") not in format_classes:
+			frappe.throw(
+				_("Row #{0}: Unknown scale format {1} for scale {2}").format(
+					row.idx, row.scale_format, row.scale_name
+				)
+			)
+		if not 0 < cint(row.port) < 65536:
+			frappe.throw(
+				_("Row #{0}: Port of scale {1} must be between 1 and 65535").format(row.idx, row.scale_name)
+			)
+
+
+def get_scale_devices():
+	settings = frappe.get_cached_doc("Retail Settings")
+	return [
+		ScaleDevice(
+			row.scale_name,
+			row.host,
+			cint(row.port),
+			(row.output_folder or "").strip("/"),
+			row.scale_format or "JHMA",
+			bool(row.full_only),
+		)
+		for row in settings.get("scale_devices") or []
+		if row.enabled
+	]
+
+
+def push_plu_to_scales(full=False):
+	"""
+	Push the current PLU table of its export target to every enabled scale.
+
+	Scales are updated concurrently, at most `scale_push_concurrency` at a time, each
+	session bounded by `scale_push_timeout` seconds and retried `scale_push_retries`
+	times. Pass `full` to send every scale its full table.
+
+	Returns a list of ScalePushResult.
+	"""
+	settings = frappe.get_cached_doc("Retail Settings")
+	devices = get_scale_devices()
+	if not devices:
+		return []
+
+	started = time.monotonic()
+	format_classes = get_scale_format_classes()
+	targets = {target.output_folder for target in get_plu_export_targets()}
+	states = frappe.cache.hgetall(SCALE_PUSH_STATE_KEY) or {}
+	snapshots = {}
+	payloads = {}
+	jobs = []
+	results = []
+
+	for device in devices:
+		scale_format_class = format_classes.get(device.scale_format)
+		if device.output_folder not in targets or not scale_format_class:
+			# Rejected when Retail Settings are saved, left by a removed target or format
+			# hook. Retrying would not help, so it is not counted as a failed push.
+			frappe.logger().warning(
+				f"Scale Push: Skipped {device.scale_name}, unknown export target or scale format"
+			)
+			continue
+
+		if device.output_folder not in snapshots:
+			snapshots[device.output_folder] = take_plu_snapshot(device.output_folder)
+		snapshot = snapshots[device.output_folder]
+		if snapshot is None:
+			results.append(
+				ScalePushResult(device, False, 0, 0, "The export target has not been exported yet")
+			)
+			continue
+
+		digest, entries = snapshot
+		previous = (states.get(device.key) or {}).get("snapshot")
+		if previous == digest and not full:
+			continue
+
+		# Scales that acknowledged the same snapshot share one payload
+		use_delta = (
+			not full and not device.full_only and scale_format_class.supports_delta and previous is not None
+		)
+		payload_key = (device.output_folder, device.scale_format, previous if use_delta else None)
+		if payload_key not in payloads:
+			payloads[payload_key] = build_scale_payload(
+				scale_format_class(),
+				entries,
+				read_plu_snapshot(device.output_folder, previous) if use_delta else None,
+			)
+		payload, records = payloads[payload_key]
+		if payload is None:
+			# Nothing this scale shows has changed
+			results.append(ScalePushResult(device, True, 0, 0))
+		else:
+			jobs.append((device, payload, records))
+
+	results += asyncio.run(
+		push_to_scales(
+			jobs,
+			concurrency=cint(settings.scale_push_concurrency) or 10,
+			timeout=flt(settings.scale_push_timeout) or 10,
+			retries=cint(settings.scale_push_retries),
+		)
+	)
+
+	save_scale_push_results(results, snapshots)
+	prune_plu_snapshots(snapshots)
+
+	failed = [result for result in results if not result.success]
+	set_gauge("scale_push_seconds", time.monotonic() - started)
+	set_gauge("scale_push_failed_scales", len(failed))
+	log_sampled("Scale Push: Updated %s of %s scales", len(results) - len(failed), len(results))
+	if failed:
+		frappe.log_error(
+			title="Scale Push Failed",
+			message="\n".join(
+				f"{result.device.scale_name} ({result.device.key}): {result.error}" for result in failed
+			),
+		)
+
+	return results
+
+
+def get_plu_snapshot_path(output_folder, digest):
+	return frappe.get_site_path(
+		"private", "scale_push", output_folder.replace("/", ".") or "site", f"{digest}.index"
+	)
+
+
+def take_plu_snapshot(output_folder):
+	"""
+	Copy the index of an export target, so later pushes can send the difference to it.
+
+	Returns (digest, entries), or None if the target has not been exported yet.
+	"""
+	index_path = get_plu_index_path(output_folder)
+	if not is_current_plu_index(index_path):
+		return None
+
+	with open(index_path, "rb") as index_file:
+		data = index_file.read()
+
+	digest = hashlib.sha256(data).hexdigest()
+	snapshot_path = get_plu_snapshot_path(output_folder, digest)
+	if not os.path.exists(snapshot_path):
+		with atomic_write(snapshot_path) as snapshot_file:
+			snapshot_file.write(data.decode())
+
+	return digest, list(read_plu_index(io.StringIO(data.decode()), ()))
+
+
+def read_plu_snapshot(output_folder, digest):
+	"""Get the entries of a snapshot, or None if it has been pruned"""
+	snapshot_path = get_plu_snapshot_path(output_folder, digest)
+	if not os.path.exists(snapshot_path):
+		return None
+
+	with open(snapshot_path) as snapshot_file:
+		return list(read_plu_index(snapshot_file, ()))
+
+
+def prune_plu_snapshots(snapshots):
+	"""Delete the snapshots no scale needs as the base of a delta anymore"""
+	states = frappe.cache.hgetall(SCALE_PUSH_STATE_KEY) or {}
+	for output_folder, snapshot in snapshots.items():
+		if snapshot is None:
+			continue
+
+		keep = {snapshot[0]} | {
+			state.get("snapshot") for state in states.values() if state.get("output_folder") == output_folder
+		}
+		folder = os.path.dirname(get_plu_snapshot_path(output_folder, snapshot[0]))
+		for file_name in os.listdir(folder):
+			if file_name.removesuffix(".index") not in keep:
+				with suppress(FileNotFoundError):
+					os.remove(os.path.join(folder, file_name))
+
+
+def build_scale_payload(scale_format, entries, previous_entries=None):
+	"""
+	Build the session sent to a scale, as (payload, records).
+
+	With `previous_entries` only the PLU codes whose rendered line changed are sent, in
+	a DELTA session; the payload is None if there is no such code. Otherwise a FULL
+	session with every entry is built.
+	"""
+	lines = {entry.plu_code: scale_format.render(entry) for entry in entries}
+
+	if previous_entries is None:
+		records = [f"U {plu_code} {line}" for plu_code, line in sorted(lines.items())]
+		kind = "FULL"
+	else:
+		previous_lines = {entry.plu_code: scale_format.render(entry) for entry in previous_entries}
+		# Deletes first, so a PLU code moved to another item ends up with the new line
+		records = [f"D {plu_code}" for plu_code in sorted(previous_lines.keys() - lines.keys())]
+		records += [
+			f"U {plu_code} {line}"
+			for plu_code, line in sorted(lines.items())
+			if previous_lines.get(plu_code) != line
+		]
+		if not records:
+			return None, 0
+		kind = "DELTA"
+
+	payload = "\n".join([f"BEGIN {kind} {len(records)}", *records, "COMMIT", ""])
+	return payload.encode(), len(records)
+
+
+async def push_to_scales(jobs, concurrency, timeout, retries):
+	"""Send each (device, payload, records) job, at most `concurrency` at a time"""
+	semaphore = asyncio.Semaphore(concurrency)
+
+	async def push(device, payload, records):
+		async with semaphore:
+			return await push_to_scale(device, payload, records, timeout, retries)
+
+	return await asyncio.gather(*(push(*job) for job in jobs))
+
+
+async def push_to_scale(device, payload, records, timeout, retries):
+	"""Send a session to one scale, retrying with exponential backoff"""
+	error = None
+	for attempt in range(retries + 1):
+		if attempt:
+			await asyncio.sleep(SCALE_PUSH_BACKOFF * 2 ** (attempt - 1))
+		try:
+			await asyncio.wait_for(send_scale_session(device.host, device.port, payload, records), timeout)
+			return ScalePushResult(device, True, attempt + 1, records)
+		except asyncio.TimeoutError:
+			error = f"No answer within {timeout} seconds"
+		except (OSError, ScalePushError) as e:
+			error = str(e) or e.__class__.__name__
+
+	return ScalePushResult(device, False, retries + 1, records, error)
+
+
+async def send_scale_session(host, port, payload, records):
+	reader, writer = await asyncio.open_connection(host, port)
+	try:
+		writer.write(payload)
+		await writer.drain()
+		reply = (await reader.readline()).decode().strip()
+	finally:
+		writer.close()
+		with suppress(OSError):
+			await writer.wait_closed()
+
+	if reply != f"OK {records}":
+		raise ScalePushError(reply or "Connection closed without an answer")
+
+
+def save_scale_push_results(results, snapshots):
+	"""Record the snapshot every updated scale acknowledged, and the error of the others"""
+	states = {}
+	for result in results:
+		state = frappe.cache.hget(SCALE_PUSH_STATE_KEY, result.device.key) or {}
+		if result.success:
+			state = {
+				"snapshot": snapshots[result.device.output_folder][0],
+				"output_folder": result.device.output_folder,
+				"pushed_on": now_datetime(),
+			}
+		else:
+			state = {**state, "error": result.error, "failed_on": now_datetime()}
+		states[result.device.key] = state
+
+	for key, state in states.items():
+		frappe.cache.hset(SCALE_PUSH_STATE_KEY, key, state)
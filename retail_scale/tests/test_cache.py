@@ -0,0 +1,65 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from retail_scale.cache import WorkerCache
+
+CACHE_NAME = "retail_scale:test_worker_cache"
+
+
+def next_request():
+	"""Start a new request, the way frappe.init does for every request and job"""
+	frappe.local.cache = {}
+
+
+class TestWorkerCache(FrappeTestCase):
+	def setUp(self):
+		# Two instances with the same name stand for the same cache on two workers
+		self.worker, self.other_worker = WorkerCache(CACHE_NAME), WorkerCache(CACHE_NAME)
+		self.worker.clear()
+		next_request()
+
+	def tearDown(self):
+		self.worker.clear()
+
+	def test_get_many_counts_hits_and_misses(self):
+		self.worker.set("a", 1)
+		self.worker.set("b", 2)
+
+		self.assertEqual(self.other_worker.get_many(["a", "b", "c"]), {"a": 1, "b": 2})
+		self.assertEqual(self.other_worker.get_many(["a"]), {"a": 1})
+
+		stats = self.other_worker.get_stats()["worker"]
+		self.assertEqual((stats["local_hits"], stats["redis_hits"], stats["misses"]), (1, 2, 1))
+
+	def test_delete_only_drops_the_deleted_keys_on_other_workers(self):
+		self.worker.set("a", 1)
+		self.worker.set("b", 2)
+		self.other_worker.get_many(["a", "b"])
+
+		self.worker.delete("a")
+		next_request()
+
+		self.assertEqual(self.other_worker._get_local(), {"b": 2})
+		self.assertIsNone(self.other_worker.get("a"))
+
+	def test_deleting_uncached_keys_is_not_broadcast(self):
+		self.worker.set("a", 1)
+		self.other_worker.get("a")
+
+		self.worker.delete("not-cached")
+		next_request()
+
+		pipeline = frappe.cache.pipeline()
+		pipeline.llen(frappe.cache.make_key(self.worker.deleted_key))
+		self.assertEqual(pipeline.execute(), [0])
+		self.assertEqual(self.other_worker._get_local(), {"a": 1})
+
+	def test_clear_drops_every_key_on_other_workers(self):
+		self.worker.set("a", 1)
+		self.other_worker.get("a")
+
+		self.worker.clear()
+		next_request()
+
+		self.assertEqual(self.other_worker._get_local(), {})
+		self.assertIsNone(self.other_worker.get("a"))
@@ -0,0 +1,60 @@
+import math
+from unittest.mock import patch
+
+from retail_scale import utils
+from retail_scale.metrics import count_queries
+from retail_scale.tests.utils import PLUFixtureTestCase
+
+# More items than one price batch and one item chunk hold, so batching is exercised
+CATALOG_SIZE = 2 * max(utils.PLU_PRICE_BATCH_SIZE, utils.PLU_EXPORT_CHUNK_SIZE) + 500
+
+
+class TestPLUExportQueries(PLUFixtureTestCase):
+	"""The PLU export must cost a number of queries that grows with the batches, not the items"""
+
+	catalog_size = CATALOG_SIZE
+
+	def count_export_queries(self, item_codes):
+		with count_queries() as counter:
+			self.assertTrue(utils.export_loose_items_to_plu(item_codes))
+		return counter.count
+
+	def test_effective_prices_are_batched(self):
+		counts = {}
+		for size in (10, utils.PLU_PRICE_BATCH_SIZE, CATALOG_SIZE):
+			with count_queries() as counter:
+				prices = utils.get_effective_prices(self.fixture.item_codes[:size])
+			self.assertEqual(len(prices), size)
+			counts[size] = counter.count
+
+		# One query per batch of PLU_PRICE_BATCH_SIZE item codes
+		self.assertEqual(counts[10], 1)
+		self.assertEqual(counts[utils.PLU_PRICE_BATCH_SIZE], 1)
+		self.assertEqual(counts[CATALOG_SIZE], math.ceil(CATALOG_SIZE / utils.PLU_PRICE_BATCH_SIZE))
+
+	def test_export_queries_grow_with_the_batches_only(self):
+		# The first export writes the index, the next ones splice the changed items in
+		utils.export_loose_items_to_plu()
+
+		few = self.count_export_queries(self.fixture.item_codes[:10])
+		many = self.count_export_queries(self.fixture.item_codes)
+
+		# Every further item chunk and price batch costs one query, nothing costs one per item
+		extra_batches = (math.ceil(CATALOG_SIZE / utils.PLU_EXPORT_CHUNK_SIZE) - 1) + (
+			math.ceil(CATALOG_SIZE / utils.PLU_PRICE_BATCH_SIZE) - 1
+		)
+		self.assertEqual(many, few + extra_batches)
+
+	def test_smaller_batches_cost_more_queries(self):
+		utils.export_loose_items_to_plu()
+		item_codes = self.fixture.item_codes[:450]
+
+		default = self.count_export_queries(item_codes)
+		with (
+			patch.object(utils, "PLU_PRICE_BATCH_SIZE", 100),
+			patch.object(utils, "PLU_EXPORT_CHUNK_SIZE", 100),
+		):
+			smaller = self.count_export_queries(item_codes)
+
+		# Five item chunks and five price batches instead of one each
+		self.assertEqual(smaller, default + 2 * 4)
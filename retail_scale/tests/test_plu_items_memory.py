@@ -0,0 +1,51 @@
+import os
+import tracemalloc
+
+from retail_scale import utils
+from retail_scale.tests.utils import PLUFixtureTestCase
+
+# The catalog size the streaming export was built for. The fixture is bulk inserted
+# without running controllers, so it stays affordable at this size.
+CATALOG_SIZE = 200000
+# A few chunks of items and entries per writer thread, plus the write buffers. Holding
+# the whole catalog in memory takes well over 100 MiB at this size.
+PEAK_MEMORY_CEILING = 16 * 1024 * 1024
+
+
+def measure_peak_memory(func):
+	tracemalloc.start()
+	try:
+		func()
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+
+class TestPLUExportMemory(PLUFixtureTestCase):
+	"""The full PLU export must stream the catalog with a memory use that does not grow with it"""
+
+	catalog_size = CATALOG_SIZE
+	prices_per_item = 1
+
+	def test_streaming_items_peak_memory_is_bounded(self):
+		plu_item_groups = utils.get_plu_item_groups()
+		count = 0
+
+		def stream():
+			nonlocal count
+			for chunk in utils.iter_plu_items(plu_item_groups):
+				count += len(chunk)
+
+		self.assertLess(measure_peak_memory(stream), PEAK_MEMORY_CEILING)
+		self.assertEqual(count, CATALOG_SIZE)
+
+	def test_full_export_peak_memory_is_bounded(self):
+		# Reads, prices, renders and writes every format, like the export job does
+		peak = measure_peak_memory(lambda: self.assertTrue(utils.export_loose_items_to_plu()))
+		self.assertLess(peak, PEAK_MEMORY_CEILING)
+
+		manifest = utils.read_plu_manifest(utils.get_plu_manifest_path())
+		self.assertEqual(manifest["rows"], CATALOG_SIZE)
+		with open(utils.get_plu_export_path()) as plu_file:
+			self.assertEqual(sum(1 for _line in plu_file), CATALOG_SIZE)
+		self.assertTrue(os.path.exists(utils.get_plu_index_path()))
@@ -0,0 +1,95 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from retail_scale import utils
+from retail_scale.benchmarks.fixture import make_fixture
+from retail_scale.benchmarks.query_plans import capture_queries, find_full_scans, get_query_plan_cases
+from retail_scale.benchmarks.runner import clear_caches
+from retail_scale.patches.v1_0.add_plu_and_return_indexes import add_indexes
+from retail_scale.return_ledger import get_ledger_returned_qty_map, get_returned_qty_map
+
+
+class TestQueryPlans(FrappeTestCase):
+	"""The hot queries must use the indexes added by the add_plu_and_return_indexes patch"""
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		if frappe.db.db_type != "mariadb":
+			return
+
+		# DDL commits, so the indexes are added before anything is inserted
+		add_indexes()
+		# The default size is large enough for the optimizer to prefer the indexes
+		cls.fixture = make_fixture()
+		clear_caches()
+
+	@classmethod
+	def tearDownClass(cls):
+		super().tearDownClass()
+		clear_caches()
+
+	def setUp(self):
+		if frappe.db.db_type != "mariadb":
+			self.skipTest("Query plans are only checked on MariaDB")
+
+	def get_plans(self, func):
+		"""EXPLAIN the SELECT queries `func` runs, as a list of plan rows"""
+		with capture_queries() as queries:
+			func()
+
+		self.assertTrue(queries)
+		return [
+			row
+			for query, values in queries
+			for row in frappe.db.sql(f"EXPLAIN {query}", values, as_dict=True)
+		]
+
+	def assertUsesIndex(self, func, table, index_names):
+		keys = {row.key for row in self.get_plans(func) if row.table == table}
+		self.assertTrue(keys, f"{table} is not read")
+		self.assertLessEqual(keys, set(index_names), f"{table} is read with {keys}, not {index_names}")
+
+	def test_plu_export_uses_the_plu_code_index(self):
+		plu_item_groups = utils.get_plu_item_groups()
+		self.assertUsesIndex(
+			lambda: list(utils.iter_plu_items(plu_item_groups)), "tabItem", ["retail_scale_plu_code_index"]
+		)
+
+	def test_effective_prices_use_the_item_price_index(self):
+		self.assertUsesIndex(
+			lambda: utils.get_effective_prices(self.fixture.item_codes[:100]),
+			"tabItem Price",
+			["retail_scale_item_price_index"],
+		)
+
+	def test_next_price_change_uses_the_validity_indexes(self):
+		self.assertUsesIndex(
+			utils.get_next_price_change,
+			"tabItem Price",
+			["retail_scale_price_starts_index", "retail_scale_price_ends_index"],
+		)
+
+	def test_returned_quantities_use_the_return_index(self):
+		invoice = self.fixture.invoices[0]
+		customer = frappe.db.get_value("POS Invoice", invoice, "customer")
+		self.assertUsesIndex(
+			lambda: get_returned_qty_map(invoice, customer), "tabPOS Invoice", ["retail_scale_return_index"]
+		)
+
+	def test_return_ledger_uses_the_return_against_index(self):
+		self.assertUsesIndex(
+			lambda: get_ledger_returned_qty_map(self.fixture.invoices[0]),
+			"tabPOS Return Ledger",
+			["return_against"],
+		)
+
+	def test_no_hot_query_scans_a_watched_table(self):
+		for name, (func, setup) in get_query_plan_cases(self.fixture).items():
+			if setup:
+				setup()
+			with capture_queries() as queries:
+				func()
+
+			for query, values in queries:
+				self.assertEqual(find_full_scans(query, values), [], f"{name}: {' '.join(query.split())}")
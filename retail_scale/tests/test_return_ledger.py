@@ -0,0 +1,148 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt, nowdate
+
+from retail_scale.benchmarks.fixture import make_fixture
+from retail_scale.benchmarks.runner import clear_caches
+from retail_scale.return_ledger import (
+	get_ledger_returned_qty_map,
+	get_returned_qty_map,
+	rebuild_return_ledger,
+	update_return_ledger,
+)
+
+
+class TestReturnLedger(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		# Two invoices of three rows, each with one return taking a third of every row
+		cls.fixture = make_fixture(items=20, invoices=2, rows_per_invoice=3, returns_per_invoice=1)
+		clear_caches()
+
+	@classmethod
+	def tearDownClass(cls):
+		super().tearDownClass()
+		clear_caches()
+
+	def setUp(self):
+		self.invoice = self.fixture.invoices[0]
+		self.customer = frappe.db.get_value("POS Invoice", self.invoice, "customer")
+		self.rows = frappe.get_all(
+			"POS Invoice Item",
+			fields=["name", "item_code", "qty"],
+			filters={"parent": self.invoice},
+			order_by="idx asc",
+		)
+
+	def make_return(self, qty_by_row, customer=None):
+		"""
+		Insert a submitted return against the invoice, of `qty_by_row` a dict of original
+		row -> returned qty, and update the ledger like its on_submit hook does.
+		"""
+		item_codes = {row.name: row.item_code for row in self.rows}
+		return_invoice = frappe.generate_hash(length=10)
+		frappe.db.bulk_insert(
+			"POS Invoice",
+			fields=["name", "customer", "posting_date", "docstatus", "is_return", "return_against"],
+			values=[(return_invoice, customer or self.customer, nowdate(), 1, 1, self.invoice)],
+		)
+		frappe.db.bulk_insert(
+			"POS Invoice Item",
+			fields=[
+				"name",
+				"parent",
+				"parenttype",
+				"parentfield",
+				"idx",
+				"docstatus",
+				"item_code",
+				"qty",
+				"stock_qty",
+				"pos_invoice_item",
+			],
+			values=[
+				(
+					frappe.generate_hash(length=10),
+					return_invoice,
+					"POS Invoice",
+					"items",
+					idx,
+					1,
+					item_codes[row_name],
+					-qty,
+					-qty,
+					row_name,
+				)
+				for idx, (row_name, qty) in enumerate(qty_by_row.items(), 1)
+			],
+		)
+
+		doc = frappe.get_doc("POS Invoice", return_invoice)
+		update_return_ledger(doc, "on_submit")
+		return doc
+
+	def cancel_return(self, doc):
+		frappe.db.set_value("POS Invoice", doc.name, "docstatus", 2)
+		doc.reload()
+		update_return_ledger(doc, "on_cancel")
+
+	def get_ledger_qty(self, row_name):
+		return flt(get_ledger_returned_qty_map(self.invoice).get(row_name, frappe._dict(qty=0)).qty, 3)
+
+	def assertLedgerMatchesReturns(self):
+		ledger = get_ledger_returned_qty_map(self.invoice)
+		returns = get_returned_qty_map(self.invoice, self.customer)
+		self.assertEqual(
+			{row: flt(total.qty, 3) for row, total in ledger.items()},
+			{row: flt(total.qty, 3) for row, total in returns.items()},
+		)
+
+	def test_partial_returns_add_up(self):
+		first, second = self.rows[0].name, self.rows[1].name
+		returned_before = self.get_ledger_qty(first)
+		self.assertTrue(returned_before)
+
+		self.make_return({first: 0.1})
+		self.make_return({first: 0.2, second: 0.05})
+
+		self.assertEqual(self.get_ledger_qty(first), flt(returned_before + 0.3, 3))
+		self.assertLedgerMatchesReturns()
+
+	def test_cancelled_return_is_taken_out(self):
+		row_name = self.rows[0].name
+		returned_before = self.get_ledger_qty(row_name)
+
+		doc = self.make_return({row_name: 0.1})
+		self.assertEqual(self.get_ledger_qty(row_name), flt(returned_before + 0.1, 3))
+
+		self.cancel_return(doc)
+		self.assertEqual(self.get_ledger_qty(row_name), returned_before)
+		self.assertLedgerMatchesReturns()
+
+	def test_row_without_returns_left_is_removed(self):
+		# The other invoice only has the return of the fixture
+		invoice = self.fixture.invoices[1]
+		self.assertTrue(get_ledger_returned_qty_map(invoice))
+
+		self.cancel_return(
+			frappe.get_doc("POS Invoice", {"return_against": invoice, "is_return": 1, "docstatus": 1})
+		)
+		self.assertEqual(get_ledger_returned_qty_map(invoice), {})
+
+	def test_returns_of_another_customer_do_not_count(self):
+		row_name = self.rows[0].name
+		returned_before = self.get_ledger_qty(row_name)
+
+		self.make_return({row_name: 0.1}, customer="_Test Customer")
+		self.assertEqual(self.get_ledger_qty(row_name), returned_before)
+
+	def test_rebuild_matches_the_maintained_ledger(self):
+		row_name = self.rows[2].name
+		doc = self.make_return({row_name: 0.1})
+		self.make_return({row_name: 0.05})
+		self.cancel_return(doc)
+		maintained = get_ledger_returned_qty_map(self.invoice)
+
+		rebuild_return_ledger(self.invoice)
+		self.assertEqual(get_ledger_returned_qty_map(self.invoice), maintained)
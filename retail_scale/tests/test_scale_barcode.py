@@ -0,0 +1,104 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from retail_scale import scale_barcode
+from retail_scale.scale_barcode import (
+	DEFAULT_RULES,
+	compile_scale_barcode_rules,
+	has_valid_check_digit,
+	parse_scale_barcode,
+)
+
+
+def make_rule_row(prefix, barcode_length=13, label_type="Weight", **kwargs):
+	return frappe._dict(
+		{
+			"prefix": prefix,
+			"barcode_length": barcode_length,
+			"label_type": label_type,
+			"item_code_source": "Item Code",
+			"item_code_offset": 2,
+			"item_code_length": 5,
+			"value_offset": 7,
+			"value_length": 5,
+			"divisor": 1000 if label_type == "Weight" else 100,
+			"has_check_digit": 1,
+			**kwargs,
+		}
+	)
+
+
+RULE_ROWS = [
+	make_rule_row("21"),
+	make_rule_row("22", label_type="Price"),
+	# Same prefix, other length: 12 digit labels without a check digit
+	make_rule_row("21", barcode_length=12, has_check_digit=0, item_code_source="PLU Code"),
+	# A shorter prefix that the two digit ones take precedence over
+	make_rule_row("2", item_code_offset=1, item_code_length=6),
+	# Shadowed by the first row with the same length and prefix
+	make_rule_row("21", divisor=1),
+]
+
+
+class TestScaleBarcodeRules(FrappeTestCase):
+	def setUp(self):
+		with patch.object(scale_barcode.frappe, "get_all", return_value=RULE_ROWS):
+			self.compiled = compile_scale_barcode_rules()
+
+		rules_patch = patch.object(scale_barcode, "get_scale_barcode_rules", return_value=self.compiled)
+		rules_patch.start()
+		self.addCleanup(rules_patch.stop)
+
+	def test_rules_are_keyed_on_length_and_prefix(self):
+		prefix_lengths, rules = self.compiled
+		self.assertEqual(prefix_lengths, (2, 1))
+		self.assertEqual(set(rules), {(13, "21"), (13, "22"), (12, "21"), (13, "2")})
+		# The first row wins
+		self.assertEqual(rules[(13, "21")].divisor, 1000)
+
+	def test_weight_label(self):
+		label = parse_scale_barcode("2112345005003")
+		self.assertEqual(
+			(label.code, label.value, label.is_price, label.is_plu_code), ("12345", 0.5, False, False)
+		)
+
+	def test_price_label(self):
+		label = parse_scale_barcode("2200042012995")
+		self.assertEqual((label.code, label.value, label.is_price), ("00042", 12.99, True))
+
+	def test_length_selects_the_rule(self):
+		label = parse_scale_barcode("211234500500")
+		self.assertTrue(label.is_plu_code)
+		self.assertEqual((label.code, label.value), ("12345", 0.5))
+
+	def test_longest_prefix_wins(self):
+		self.assertEqual(parse_scale_barcode("2112345005003").rule.prefix, "21")
+
+		label = parse_scale_barcode("2900007001230")
+		self.assertEqual(label.rule.prefix, "2")
+		self.assertEqual(label.code, "900007")
+
+	def test_bad_check_digit_is_rejected(self):
+		self.assertIsNone(parse_scale_barcode("2112345005004"))
+		self.assertIsNone(parse_scale_barcode("2200042012990"))
+
+	def test_other_barcodes_are_not_scale_labels(self):
+		for barcode in ("", "4006381333931", "21123450050", "21A2345005003"):
+			self.assertIsNone(parse_scale_barcode(barcode), barcode)
+
+	def test_default_rule_without_configured_rules(self):
+		with patch.object(scale_barcode.frappe, "get_all", return_value=[]):
+			self.assertEqual(compile_scale_barcode_rules(), ((2,), {(12, "21"): DEFAULT_RULES[0]}))
+
+
+class TestCheckDigit(FrappeTestCase):
+	def test_valid_check_digits(self):
+		# EAN-13, UPC-A and EAN-8
+		for barcode in ("4006381333931", "036000291452", "96385074", "2112345005003"):
+			self.assertTrue(has_valid_check_digit(barcode), barcode)
+
+	def test_invalid_check_digits(self):
+		for barcode in ("4006381333932", "036000291450", "96385070"):
+			self.assertFalse(has_valid_check_digit(barcode), barcode)
@@ -0,0 +1,21 @@
+from frappe.tests.utils import FrappeTestCase
+
+from retail_scale.scale_formats import CASFormat, DIGIFormat, JHMAFormat, PLUEntry
+
+BANANA = PLUEntry(1, "00001", "Banana", 45.0, "Kg", True)
+
+
+class TestScaleFormats(FrappeTestCase):
+	def test_documented_layouts(self):
+		self.assertEqual(JHMAFormat().render(BANANA), "1,00001,Banana,45.0,0")
+		self.assertEqual(DIGIFormat().render(BANANA), "0000010" "00004500" f"{'00001':<16}{'Banana':<24}")
+		self.assertEqual(CASFormat().render(BANANA), '1,00001,"Banana",4500,W')
+
+	def test_cas_escapes_quotes_and_commas(self):
+		entry = BANANA._replace(item_code="A,1", item_name='Banana "Bio"', is_weighed=False)
+		self.assertEqual(CASFormat().render(entry), '1,"A,1","Banana ""Bio""",4500,N')
+
+	def test_digi_rejects_codes_wider_than_its_field(self):
+		self.assertEqual(len(DIGIFormat().render(BANANA._replace(plu_code=999999))), 6 + 1 + 8 + 16 + 24)
+		with self.assertRaises(ValueError):
+			DIGIFormat().render(BANANA._replace(plu_code=1000000))
@@ -0,0 +1,128 @@
+import asyncio
+import socket
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from retail_scale import scale_push
+from retail_scale.fake_scale import FakeScale
+from retail_scale.scale_formats import JHMAFormat, PLUEntry
+from retail_scale.scale_push import ScaleDevice, build_scale_payload, push_to_scales
+
+ENTRIES = [
+	PLUEntry(1, "00001", "Banana", 45.0, "Kg", True),
+	PLUEntry(2, "00002", "Apple", 30.0, "Kg", True),
+	PLUEntry(3, "00003", "Melon", 12.5, "Nos", False),
+]
+
+
+def get_free_port():
+	"""A port nothing listens on"""
+	with socket.socket() as sock:
+		sock.bind(("127.0.0.1", 0))
+		return sock.getsockname()[1]
+
+
+def push(fake_scale, payload, records, unreachable_port=None):
+	"""Serve `fake_scale` on a free port and push the payload to it, and to `unreachable_port`"""
+
+	async def run():
+		server = await asyncio.start_server(fake_scale.handle, "127.0.0.1", 0)
+		async with server:
+			port = server.sockets[0].getsockname()[1]
+			jobs = [(ScaleDevice("Scale 1", "127.0.0.1", port, "", "JHMA", False), payload, records)]
+			if unreachable_port:
+				jobs.append(
+					(
+						ScaleDevice("Scale 2", "127.0.0.1", unreachable_port, "", "JHMA", False),
+						payload,
+						records,
+					)
+				)
+			return await push_to_scales(jobs, concurrency=2, timeout=5, retries=2)
+
+	return asyncio.run(run())
+
+
+@patch.object(scale_push, "SCALE_PUSH_BACKOFF", 0)
+class TestScalePush(FrappeTestCase):
+	def test_full_and_delta_sessions(self):
+		fake_scale = FakeScale(0)
+		scale_format = JHMAFormat()
+
+		payload, records = build_scale_payload(scale_format, ENTRIES)
+		(result,) = push(fake_scale, payload, records)
+
+		self.assertTrue(result.success)
+		self.assertEqual(result.records, 3)
+		self.assertEqual(
+			fake_scale.plu_table, {entry.plu_code: scale_format.render(entry) for entry in ENTRIES}
+		)
+
+		# Apple gets a new price and Melon is no longer exported
+		current = [ENTRIES[0], ENTRIES[1]._replace(price=32.0)]
+		payload, records = build_scale_payload(scale_format, current, ENTRIES)
+		self.assertEqual(payload.decode().splitlines()[0], "BEGIN DELTA 2")
+		(result,) = push(fake_scale, payload, records)
+
+		self.assertTrue(result.success)
+		self.assertEqual(
+			fake_scale.plu_table, {entry.plu_code: scale_format.render(entry) for entry in current}
+		)
+		self.assertEqual((fake_scale.stats["full"], fake_scale.stats["delta"]), (1, 1))
+
+	def test_unchanged_lines_are_not_pushed(self):
+		self.assertEqual(build_scale_payload(JHMAFormat(), ENTRIES, ENTRIES), (None, 0))
+
+	def test_unreachable_scale_fails_after_retries(self):
+		fake_scale = FakeScale(0)
+		payload, records = build_scale_payload(JHMAFormat(), ENTRIES)
+		reachable, unreachable = push(fake_scale, payload, records, unreachable_port=get_free_port())
+
+		# One unreachable scale does not hold back the others
+		self.assertTrue(reachable.success)
+		self.assertEqual(len(fake_scale.plu_table), 3)
+
+		self.assertFalse(unreachable.success)
+		self.assertEqual(unreachable.attempts, 3)
+		self.assertTrue(unreachable.error)
+
+	def test_failed_session_is_not_applied(self):
+		fake_scale = FakeScale(0, failure_rate=1)
+		payload, records = build_scale_payload(JHMAFormat(), ENTRIES)
+		with patch.object(FakeScale, "fail", lambda self: asyncio.sleep(0, "ERR busy")):
+			(result,) = push(fake_scale, payload, records)
+
+		self.assertFalse(result.success)
+		self.assertEqual(result.error, "ERR busy")
+		self.assertEqual(fake_scale.plu_table, {})
+
+	def test_malformed_header_is_answered(self):
+		fake_scale = FakeScale(0)
+		(result,) = push(fake_scale, b"BEGIN FULL many\nCOMMIT\n", 0)
+
+		self.assertFalse(result.success)
+		self.assertEqual(result.error, "ERR invalid header")
+
+	def test_misconfigured_scale_is_rejected(self):
+		settings = frappe._dict(
+			plu_export_targets=[frappe._dict(enabled=1, output_folder="stores/a")],
+			scale_devices=[
+				frappe._dict(
+					idx=1,
+					enabled=1,
+					scale_name="Scale 1",
+					port=9100,
+					output_folder="stores/b",
+					scale_format="JHMA",
+				)
+			],
+		)
+		self.assertRaises(frappe.ValidationError, scale_push.validate_scale_devices, settings)
+
+		settings.scale_devices[0].output_folder = "stores/a/"
+		scale_push.validate_scale_devices(settings)
+
+		settings.scale_devices[0].scale_format = "Unknown"
+		self.assertRaises(frappe.ValidationError, scale_push.validate_scale_devices, settings)
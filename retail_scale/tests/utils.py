@@ -0,0 +1,55 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from frappe.tests.utils import FrappeTestCase
+
+from retail_scale import utils
+from retail_scale.benchmarks.fixture import make_fixture
+from retail_scale.benchmarks.runner import clear_caches
+
+
+class PLUFixtureTestCase(FrappeTestCase):
+	"""
+	Insert the synthetic catalog of the benchmarks once per class, `catalog_size` items
+	with `prices_per_item` prices each, and write the PLU exports of the tests to a
+	temporary directory. The catalog is rolled back with the test transaction.
+	"""
+
+	catalog_size = 1000
+	prices_per_item = 3
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.fixture = make_fixture(items=cls.catalog_size, prices_per_item=cls.prices_per_item, invoices=0)
+		clear_caches()
+
+		cls.output_dir = tempfile.TemporaryDirectory()
+		cls.path_patches = [
+			patch.object(
+				utils,
+				"get_scale_export_path",
+				lambda file_name, output_folder=None: os.path.join(
+					cls.output_dir.name, output_folder or "", file_name
+				),
+			),
+			patch.object(
+				utils,
+				"get_plu_index_path",
+				lambda output_folder=None: os.path.join(
+					cls.output_dir.name, f"PLU.{output_folder or 'site'}.index"
+				),
+			),
+		]
+		for path_patch in cls.path_patches:
+			path_patch.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		for path_patch in cls.path_patches:
+			path_patch.stop()
+		cls.output_dir.cleanup()
+		super().tearDownClass()
+		# Cached groups, rules and items of the fixture must not outlive it
+		clear_caches()
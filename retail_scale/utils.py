@@ -1,7 +1,73 @@
 import frappe
+import hashlib
+import heapq
+import itertools
+import json
 import os
+import queue
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, suppress
+from datetime import datetime, timezone
+from typing import NamedTuple
+from frappe import _
+from frappe.query_builder import Order
+from frappe.query_builder.functions import IfNull, Min
+from frappe.utils import add_days, cint, flt, getdate, now_datetime
 from frappe.utils.nestedset import get_descendants_of
 
+from retail_scale.cache import WorkerCache
+from retail_scale.metrics import instrument, log_sampled, set_gauge
+from retail_scale.scale_formats import JHMAFormat, PLUEntry, get_enabled_scale_formats
+
+PLU_PRICE_LIST = "Standard Selling"
+# Number of item codes resolved per Item Price query during an export
+PLU_PRICE_BATCH_SIZE = 1000
+
+# Background export coalescing: every change marks the export dirty and at most one
+# job per site runs the export once no new change has arrived for the quiet period.
+PLU_EXPORT_JOB_ID = "retail_scale:plu_export"
+PLU_EXPORT_DIRTY_KEY = "retail_scale:plu_export_dirty"
+PLU_EXPORT_ITEMS_KEY = "retail_scale:plu_export_items"
+PLU_EXPORT_FULL_KEY = "retail_scale:plu_export_full"
+PLU_EXPORT_LOCK_KEY = "retail_scale:plu_export_lock"
+PLU_EXPORT_QUIET_PERIOD = 5  # seconds
+PLU_EXPORT_LOCK_TIMEOUT = 600  # seconds
+# Number of items read and rendered at a time during a full export
+PLU_EXPORT_CHUNK_SIZE = 1000
+# Write buffer size for PLU.txt and its index
+PLU_EXPORT_BUFFER_SIZE = 64 * 1024
+# First line of the entry index, an index in another layout is rebuilt
+PLU_INDEX_HEADER = "# retail_scale PLU index v2\n"
+# Export targets written concurrently, each by its own thread
+PLU_EXPORT_WORKERS = 4
+# Chunks of entries buffered per target during a full export
+PLU_EXPORT_QUEUE_SIZE = 4
+# Separates the price list from the item code of a queued price change
+PLU_EXPORT_PRICE_SEPARATOR = "\x1f"
+# Written next to the export files of every target: version, row count and file digests
+PLU_MANIFEST_FILE_NAME = "PLU.manifest.json"
+# Relative folder below the site's public folder, e.g. stores/branch-a
+PLU_EXPORT_FOLDER_PATTERN = re.compile(r"^[\w-]+(/[\w-]+)*$")
+
+# Resolved PLU group tree, invalidated by Item Group and Retail Settings hooks
+plu_group_cache = WorkerCache("retail_scale:plu_item_groups")
+# Resolved export targets, invalidated by Retail Settings and POS Profile hooks
+plu_export_target_cache = WorkerCache("retail_scale:plu_export_targets")
+
+class PLUExportTarget(NamedTuple):
+    # Folder below the site's public folder, empty for the site-wide files
+    output_folder: str
+    price_list: str
+
+class PLUExportAborted(Exception):
+    pass
+
+# Put on the entry queues instead of the end marker when reading the catalog fails
+PLU_EXPORT_ABORT = object()
+
 def get_plu_group():
     """Get the PLU group from Retail Settings singleton doctype"""
     try:
@@ -12,10 +78,19 @@ def get_plu_group():
         return None
 
 def get_plu_item_groups():
-    """Get the parent group and all its descendant groups"""
+    """
+    Get the parent group and all its descendant groups as a frozenset.
+    
+    The resolved set is cached per site in Redis with a copy per worker, so checking
+    whether an item belongs to the PLU groups does not touch the database.
+    """
+    return plu_group_cache.get("groups", load_plu_item_groups)
+
+def load_plu_item_groups():
+    """Resolve the parent group and all its descendant groups from the database"""
     plu_group = get_plu_group()
     if not plu_group:
-        return []
+        return frozenset()
     
     # Get parent group and all descendants
     all_groups = [plu_group]
@@ -25,145 +100,1166 @@ def get_plu_item_groups():
     except Exception as e:
         frappe.logger().error(f"PLU Export: Error getting descendants of {plu_group}: {str(e)}")
     
-    return all_groups
+    return frozenset(all_groups)
+
+def clear_plu_group_cache(doc=None, method=None, *args, **kwargs):
+    """
+    Drop the cached PLU groups when the Item Group tree or Retail Settings change.
+    
+    Also queues a full export when the change moves items in or out of the PLU groups,
+    and rewrites the export files when the scale export formats change.
+    """
+    old_groups = get_plu_item_groups()
+    plu_group_cache.clear()
+    # Clear again after commit in case another worker cached the old tree meanwhile
+    frappe.db.after_commit.add(plu_group_cache.clear)
+    
+    if doc is None:
+        return
+    
+    if doc.doctype == "Retail Settings":
+        tree_changed = doc.has_value_changed("plu_group")
+        previous = doc.get_doc_before_save()
+        if not tree_changed and previous and (
+            get_plu_export_signature(previous) != get_plu_export_signature(doc)
+        ):
+            frappe.db.after_commit.add(queue_plu_file_rebuild)
+    elif method == "after_rename":
+        # after_rename passes the old name as the first extra argument
+        tree_changed = bool(args) and args[0] in old_groups
+    elif method == "on_update":
+        # A group moved into or out of the PLU tree
+        tree_changed = doc.has_value_changed("parent_item_group") and bool(
+            old_groups & {doc.name, doc.parent_item_group}
+        )
+    else:
+        tree_changed = False
+    
+    if tree_changed:
+        frappe.db.after_commit.add(queue_plu_export)
+
+def get_plu_export_signature(settings):
+    """The settings that decide which files the export writes"""
+    return (
+        [(row.scale_format, row.file_name, row.enabled) for row in settings.get("scale_export_formats") or []],
+        [
+            (row.enabled, row.pos_profile, row.warehouse, row.price_list, row.output_folder)
+            for row in settings.get("plu_export_targets") or []
+        ],
+    )
+
+def get_plu_export_targets():
+    """
+    Get the export targets as a tuple of PLUExportTarget.
+    
+    Without any PLU Export Target row the site-wide files are exported with the
+    "Standard Selling" price list.
+    """
+    return plu_export_target_cache.get("targets", load_plu_export_targets)
+
+def load_plu_export_targets():
+    rows = frappe.get_all(
+        "PLU Export Target",
+        fields=["pos_profile", "warehouse", "price_list", "output_folder"],
+        filters={"parenttype": "Retail Settings", "enabled": 1},
+        order_by="idx asc",
+    )
+    if not rows:
+        return (PLUExportTarget("", PLU_PRICE_LIST),)
+    
+    return tuple(
+        PLUExportTarget(
+            row.output_folder,
+            row.price_list or get_store_price_list(row.pos_profile, row.warehouse) or PLU_PRICE_LIST,
+        )
+        for row in rows
+    )
+
+def get_store_price_list(pos_profile=None, warehouse=None):
+    """Get the selling price list of a POS Profile, or of the enabled POS Profile of a warehouse"""
+    if pos_profile:
+        return frappe.db.get_value("POS Profile", pos_profile, "selling_price_list")
+    if warehouse:
+        return frappe.db.get_value("POS Profile", {"warehouse": warehouse, "disabled": 0}, "selling_price_list")
+
+def get_plu_export_price_lists():
+    return {target.price_list for target in get_plu_export_targets()}
+
+def clear_plu_export_targets(doc=None, method=None, *args, **kwargs):
+    """
+    Drop the resolved export targets when Retail Settings or a POS Profile change.
+    
+    Rewrites the export files when a POS Profile used to resolve a target price list
+    changes its price list or warehouse.
+    """
+    plu_export_target_cache.clear()
+    frappe.db.after_commit.add(plu_export_target_cache.clear)
+    
+    if (
+        doc is not None
+        and doc.doctype == "POS Profile"
+        and any(doc.has_value_changed(field) for field in ("selling_price_list", "warehouse", "disabled"))
+        and frappe.db.exists("PLU Export Target", {"parenttype": "Retail Settings", "enabled": 1})
+    ):
+        frappe.db.after_commit.add(queue_plu_file_rebuild)
+
+def validate_plu_export_targets(doc, method=None):
+    """Check that every export target writes to its own, relative output folder"""
+    folders = set()
+    for row in doc.get("plu_export_targets") or []:
+        row.output_folder = (row.output_folder or "").strip().strip("/")
+        if not PLU_EXPORT_FOLDER_PATTERN.match(row.output_folder):
+            frappe.throw(
+                _("Row #{0}: Output Folder must be a relative folder of letters, digits, '-' and '_', e.g. stores/branch-a").format(row.idx)
+            )
+        if row.output_folder in folders:
+            frappe.throw(_("Row #{0}: Output Folder {1} is used by another target").format(row.idx, row.output_folder))
+        folders.add(row.output_folder)
 
 def get_plu_export_path():
     """Get the PLU export file path - fixed location in site's public folder"""
-    return frappe.get_site_path("public", "PLU.txt")
+    return get_scale_export_path(JHMAFormat.default_file_name)
+
+def get_scale_export_path(file_name, output_folder=None):
+    """Get the path of a scale format's export file in the site's public folder"""
+    return frappe.get_site_path("public", output_folder or "", file_name)
 
-def export_to_jhma(doc, method=None):
+def get_plu_manifest_path(output_folder=None):
+    return get_scale_export_path(PLU_MANIFEST_FILE_NAME, output_folder)
+
+def read_plu_manifest(manifest_path):
+    """
+    Read the manifest of an export target.
+    
+    Returns a dict with 'version', 'rows', 'generated_at' and 'files', a dict of file
+    name -> 'format', 'sha256' and 'size'. Returns an empty dict before the first export.
+    """
     try:
-        # Debug logging
-        frappe.logger().info(f"PLU Export: Hook triggered for {doc.doctype} - {doc.name}")
+        with open(manifest_path) as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def get_plu_index_path(output_folder=None):
+    """
+    Get the path of the persisted PLU entry index of an export target.
+    
+    The index holds the snapshot of every exported item (PLU code, item code, name,
+    price, UOM and weighed flag), sorted like the export files, so a change to a few
+    items can be spliced in and every format re-rendered without re-reading the whole
+    catalog from the database.
+    """
+    if output_folder:
+        return frappe.get_site_path("private", f"PLU.{output_folder.replace('/', '.')}.index")
+    return frappe.get_site_path("private", "PLU.index")
+
+def validate_plu_code(doc, method=None):
+    """Scales look items up by PLU code, so a code must be unique within the PLU groups and fit every enabled format"""
+    if not doc.custom_plu_code or doc.disabled:
+        return
+    
+    plu_item_groups = get_plu_item_groups()
+    if doc.item_group not in plu_item_groups:
+        return
+    
+    for scale_format in get_enabled_scale_formats():
+        if scale_format.max_plu_code and cint(doc.custom_plu_code) > scale_format.max_plu_code:
+            frappe.throw(
+                _("PLU Code {0} is too long for {1} scales, the highest code they accept is {2}").format(
+                    doc.custom_plu_code, scale_format.name, scale_format.max_plu_code
+                )
+            )
+    
+    duplicate = frappe.db.get_value(
+        "Item",
+        {
+            "disabled": 0,
+            "custom_plu_code": doc.custom_plu_code,
+            "name": ["!=", doc.name],
+            "item_group": ["in", list(plu_item_groups)],
+        },
+        "name",
+    )
+    if duplicate:
+        frappe.throw(
+            _("PLU Code {0} is already used by Item {1}").format(doc.custom_plu_code, duplicate),
+            frappe.UniqueValidationError,
+        )
+
+def get_duplicate_plu_codes():
+    """Get the PLU codes used by more than one enabled item of the PLU groups, as a dict of code -> item codes"""
+    plu_item_groups = get_plu_item_groups()
+    if not plu_item_groups:
+        return {}
+    
+    duplicates = {}
+    for items in iter_plu_items(plu_item_groups):
+        for item in items:
+            duplicates.setdefault(item.custom_plu_code, []).append(item.item_code)
+    
+    return {plu_code: item_codes for plu_code, item_codes in duplicates.items() if len(item_codes) > 1}
+
+def export_to_jhma(doc, method=None, *args):
+    """
+    Item and Item Price hook: queue the items whose PLU line changed.
+    
+    Only the values that end up in the rendered line, or decide whether an item is
+    exported at all, are compared with the document before the change, so saving a
+    description or an image does not cost an export. Deletes, renames and moves out
+    of the PLU groups remove the item from the files.
+    """
+    try:
+        # Debug logging, for the sample of calls set in Retail Settings
+        log_sampled("PLU Export: Hook triggered for %s - %s (%s)", doc.doctype, doc.name, method)
         
         # Get the PLU group and all its descendants
         plu_item_groups = get_plu_item_groups()
         if not plu_item_groups:
-            frappe.logger().info(f"PLU Export: Skipping - no plu_group configured in Retail Settings")
+            log_sampled("PLU Export: Skipping - no plu_group configured in Retail Settings")
             return
         
+        # A deleted document is compared with nothing
+        if method == "on_trash":
+            before, after = doc, None
+        else:
+            before, after = doc.get_doc_before_save(), doc
+        
         # Check if this is an Item Price update
         if doc.doctype == "Item Price":
-            # Check if it's for "Standard Selling" price list
-            if doc.price_list != "Standard Selling":
-                frappe.logger().info(f"PLU Export: Skipping - price list '{doc.price_list}' is not 'Standard Selling'")
+            if before and after and get_plu_price_state(before) == get_plu_price_state(after):
+                log_sampled("PLU Export: Skipping - no exported field of Item Price %s changed", doc.name)
                 return
             
-            # Check if the item belongs to the PLU group or any of its descendants
-            item_group = frappe.db.get_value("Item", doc.item_code, "item_group")
-            frappe.logger().info(f"PLU Export: Item {doc.item_code} belongs to group '{item_group}'")
-            if item_group not in plu_item_groups:
-                frappe.logger().info(f"PLU Export: Skipping - item group '{item_group}' not in PLU groups")
-                return
+            # Check the price list and item before and after the change
+            price_lists = get_plu_export_price_lists()
+            today = getdate()
+            changes = {}
+            future_price = False
+            for item_price in filter(None, (before, after)):
+                if item_price.price_list not in price_lists:
+                    log_sampled("PLU Export: Skipping - price list '%s' is not exported", item_price.price_list)
+                    continue
+                
+                item = frappe.get_cached_value(
+                    "Item", item_price.item_code, ["item_group", "disabled", "custom_plu_code"], as_dict=True
+                )
+                if not item or not is_plu_item(item, plu_item_groups):
+                    log_sampled("PLU Export: Skipping - item %s is not exported", item_price.item_code)
+                    continue
+                
+                if is_price_effective(item_price, today):
+                    changes.setdefault(item_price.price_list, set()).add(item_price.item_code)
+                else:
+                    future_price = True
+            
+            # A price that does not apply today is exported by the rollover on the day it does
+            if future_price:
+                update_next_price_change()
+            
+            # Only the targets exporting these price lists are regenerated
+            for price_list, item_codes in changes.items():
+                mark_plu_items_changed(item_codes, price_list)
         
-        # For Item doctype, check if it belongs to the PLU group or any of its descendants
+        # For Item doctype, check if its line changed or it moved in or out of the PLU groups
         elif doc.doctype == "Item":
-            frappe.logger().info(f"PLU Export: Item {doc.name} belongs to group '{doc.item_group}'")
-            if doc.item_group not in plu_item_groups:
-                frappe.logger().info(f"PLU Export: Skipping - item group '{doc.item_group}' not in PLU groups")
+            item_codes = {doc.name}
+            if method == "after_rename":
+                # after_rename passes the old name as the first extra argument, it is in the files
+                item_codes.update(args[:1])
+                changed = get_plu_item_state(doc, plu_item_groups) is not None
+            else:
+                changed = (get_plu_item_state(before, plu_item_groups) if before else None) != (
+                    get_plu_item_state(after, plu_item_groups) if after else None
+                )
+            
+            if not changed:
+                log_sampled("PLU Export: Skipping - PLU line of item %s unchanged", doc.name)
                 return
+            
+            mark_plu_items_changed(item_codes)
         else:
-            frappe.logger().info(f"PLU Export: Skipping - wrong doctype: {doc.doctype}")
+            log_sampled("PLU Export: Skipping - wrong doctype: %s", doc.doctype)
             return  # Skip for other doctypes
         
-        # Export all items from the PLU group and its descendants
-        plu_group = get_plu_group()
-        frappe.logger().info(f"PLU Export: Starting export for group '{plu_group}' and its descendants")
-        export_loose_items_to_plu()
-        frappe.logger().info(f"PLU Export: Export completed successfully")
+        log_sampled("PLU Export: Export queued for %s - %s", doc.doctype, doc.name)
     except Exception as e:
         frappe.log_error(title="PLU Export Hook Error", message=frappe.get_traceback())
         frappe.logger().error(f"PLU Export Hook Error: {str(e)}")
 
-def export_loose_items_to_plu():
-    """Export all items from the PLU group and its descendants to PLU.txt file"""
+def is_plu_item(item, plu_item_groups):
+    """Whether an item is exported: enabled, in the PLU groups and with a PLU code"""
+    return item.item_group in plu_item_groups and not cint(item.disabled) and bool(cint(item.custom_plu_code))
+
+def get_plu_item_state(item, plu_item_groups):
+    """The values of an Item its PLU line is rendered from, or None if it is not exported"""
+    if not is_plu_item(item, plu_item_groups):
+        return None
+    
+    return (
+        " ".join((item.item_name or "").split()),
+        cint(item.custom_plu_code),
+        flt(item.standard_rate),
+        item.stock_uom or "",
+    )
+
+def get_plu_price_state(item_price):
+    """The values of an Item Price that decide the exported price"""
+    return (
+        item_price.item_code,
+        item_price.price_list,
+        cint(item_price.selling),
+        flt(item_price.price_list_rate),
+        getdate(item_price.valid_from) if item_price.valid_from else None,
+        getdate(item_price.valid_upto) if item_price.valid_upto else None,
+    )
+
+def is_price_effective(item_price, date):
+    """Whether an Item Price is a selling price valid on `date`, like in get_effective_prices"""
+    return (
+        bool(cint(item_price.selling))
+        and (not item_price.valid_from or getdate(item_price.valid_from) <= date)
+        and (not item_price.valid_upto or getdate(item_price.valid_upto) >= date)
+    )
+
+def mark_plu_items_changed(item_codes, price_list=None):
+    """
+    Collect changed item codes and queue an incremental export when the transaction commits.
+    
+    Pass `price_list` when only the prices of that price list changed.
+    """
+    if frappe.flags.plu_export_items is None:
+        frappe.flags.plu_export_items = {}
+        frappe.db.after_commit.add(queue_pending_plu_items)
+        frappe.db.after_rollback.add(discard_pending_plu_items)
+    
+    frappe.flags.plu_export_items.setdefault(price_list, set()).update(item_codes)
+
+def queue_pending_plu_items():
+    changes = frappe.flags.plu_export_items
+    frappe.flags.plu_export_items = None
+    for price_list, item_codes in (changes or {}).items():
+        queue_plu_export(item_codes, price_list)
+
+def discard_pending_plu_items():
+    frappe.flags.plu_export_items = None
+
+def queue_plu_export(item_codes=None, price_list=None):
+    """
+    Mark the PLU export dirty and make sure one background export job is queued.
+    
+    Pass the changed item codes for an incremental export, or nothing to request a
+    full rebuild. With `price_list` only the targets exporting that price list are
+    regenerated.
+    """
+    from retail_scale.plu_catalog import record_plu_catalog_change
+    
+    if item_codes:
+        members = item_codes
+        if price_list:
+            members = [f"{price_list}{PLU_EXPORT_PRICE_SEPARATOR}{item_code}" for item_code in item_codes]
+        frappe.cache.sadd(PLU_EXPORT_ITEMS_KEY, *members)
+    else:
+        frappe.cache.set_value(PLU_EXPORT_FULL_KEY, 1)
+    frappe.cache.set_value(PLU_EXPORT_DIRTY_KEY, time.time())
+    
+    # POS tills pull the same changes from the catalog endpoint, priced with PLU_PRICE_LIST
+    if price_list in (None, PLU_PRICE_LIST):
+        record_plu_catalog_change(item_codes)
+    
+    enqueue_plu_export_job()
+
+def queue_plu_file_rebuild():
+    """Queue a full rewrite of the export files, the POS catalog is not affected"""
+    frappe.cache.set_value(PLU_EXPORT_FULL_KEY, 1)
+    frappe.cache.set_value(PLU_EXPORT_DIRTY_KEY, time.time())
+    enqueue_plu_export_job()
+
+def enqueue_plu_export_job():
+    # Deduplicated on job_id: if a job is already queued or running it picks up the dirty flag
+    frappe.enqueue(
+        "retail_scale.utils.process_queued_plu_export",
+        queue="short",
+        timeout=PLU_EXPORT_LOCK_TIMEOUT,
+        job_id=PLU_EXPORT_JOB_ID,
+        deduplicate=True,
+    )
+
+def enqueue_dirty_plu_export():
+    """Scheduler safety net: queue an export if changes arrived after the last job finished"""
+    if not frappe.cache.get_value(PLU_EXPORT_DIRTY_KEY, expires=True):
+        return
+    
+    # The queued item codes keep the export incremental. Changes without any queued item
+    # code or full rebuild request were lost, so only then are the files rebuilt in full;
+    # the changes are already in the POS catalog
+    queued_items = frappe.cache.scard(frappe.cache.make_key(PLU_EXPORT_ITEMS_KEY))
+    if not queued_items and not frappe.cache.get_value(PLU_EXPORT_FULL_KEY, expires=True):
+        frappe.cache.set_value(PLU_EXPORT_FULL_KEY, 1)
+    
+    enqueue_plu_export_job()
+
+def acquire_plu_export_lock():
+    """Take the site-wide export lock so only one worker exports at a time"""
+    return frappe.cache.set(
+        frappe.cache.make_key(PLU_EXPORT_LOCK_KEY), frappe.local.site, nx=True, ex=PLU_EXPORT_LOCK_TIMEOUT
+    )
+
+def release_plu_export_lock():
+    frappe.cache.delete_value(PLU_EXPORT_LOCK_KEY)
+
+def process_queued_plu_export():
+    """
+    Background job: export once the dirty flag has been quiet for PLU_EXPORT_QUIET_PERIOD.
+    
+    Changes that arrive while the export runs set the flag again and are exported in
+    the next pass of the loop, so a burst of saves results in one or two exports.
+    """
+    if not acquire_plu_export_lock():
+        # Another worker is exporting and will see the dirty flag
+        return
+    
     try:
-        # Get the PLU group and all its descendants
-        plu_item_groups = get_plu_item_groups()
-        if not plu_item_groups:
-            frappe.logger().warning(f"PLU Export: No PLU group configured in Retail Settings")
+        while True:
+            dirty_since = frappe.cache.get_value(PLU_EXPORT_DIRTY_KEY, expires=True)
+            if not dirty_since:
+                break
+            
+            wait = dirty_since + PLU_EXPORT_QUIET_PERIOD - time.time()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            
+            frappe.cache.delete_value(PLU_EXPORT_DIRTY_KEY)
+            changes = pop_changed_plu_items()
+            try:
+                run_plu_export(changes)
+            except Exception:
+                # Queue the changes again, the scheduler safety net retries them
+                restore_changed_plu_items(changes)
+                raise
+    finally:
+        release_plu_export_lock()
+
+def pop_changed_plu_items():
+    """
+    Take the queued item codes for the next export.
+    
+    Returns a dict of price list -> item codes, where the None key holds the items
+    changed for every price list, or None when a full rebuild was requested.
+    """
+    members = {frappe.safe_decode(member) for member in frappe.cache.smembers(PLU_EXPORT_ITEMS_KEY)}
+    if members:
+        frappe.cache.srem(PLU_EXPORT_ITEMS_KEY, *members)
+    
+    if frappe.cache.get_value(PLU_EXPORT_FULL_KEY, expires=True):
+        frappe.cache.delete_value(PLU_EXPORT_FULL_KEY)
+        return None
+    
+    changes = {}
+    for member in members:
+        price_list, _separator, item_code = member.rpartition(PLU_EXPORT_PRICE_SEPARATOR)
+        changes.setdefault(price_list or None, set()).add(item_code)
+    
+    return changes
+
+def restore_changed_plu_items(changes):
+    """Put changes taken by pop_changed_plu_items back, after an export failed"""
+    if changes is None:
+        frappe.cache.set_value(PLU_EXPORT_FULL_KEY, 1)
+    else:
+        members = [
+            item_code if price_list is None else f"{price_list}{PLU_EXPORT_PRICE_SEPARATOR}{item_code}"
+            for price_list, item_codes in changes.items()
+            for item_code in item_codes
+        ]
+        if members:
+            frappe.cache.sadd(PLU_EXPORT_ITEMS_KEY, *members)
+    
+    frappe.cache.set_value(PLU_EXPORT_DIRTY_KEY, time.time())
+
+def flush_plu_export():
+    """
+    Run a pending or forced export immediately instead of waiting for the queued job.
+    
+    Returns False if another worker is already exporting; that export will include
+    any pending changes.
+    """
+    if not acquire_plu_export_lock():
+        frappe.cache.set_value(PLU_EXPORT_DIRTY_KEY, time.time())
+        return False
+    
+    try:
+        frappe.cache.delete_value(PLU_EXPORT_DIRTY_KEY)
+        pop_changed_plu_items()
+        try:
+            run_plu_export()
+        except Exception:
+            # The pending changes were taken, queue a full rebuild in their place
+            restore_changed_plu_items(None)
+            raise
+    finally:
+        release_plu_export_lock()
+    
+    return True
+
+def run_plu_export(item_codes=None):
+    """Export the PLU files and record the export time and duration in Retail Settings"""
+    started = time.monotonic()
+    if not export_loose_items_to_plu(item_codes):
+        return
+    
+    # Pre-load the exported items for scale label scans, only the changed ones after an
+    # incremental export
+    from retail_scale.scale_barcode import warm_scale_item_cache
+    warm_scale_item_cache(
+        None if item_codes is None else {item_code for codes in item_codes.values() for item_code in codes}
+    )
+    
+    # Send the changes to the scales that take pushed updates
+    from retail_scale.scale_push import queue_scale_push
+    queue_scale_push()
+    
+    frappe.db.set_single_value(
+        "Retail Settings",
+        {
+            "last_plu_export_on": now_datetime(),
+            "last_plu_export_duration": time.monotonic() - started,
+        },
+    )
+    # Prices saved by this export's changes may start or expire later
+    update_next_price_change()
+    frappe.db.commit()
+
+def get_price_change_conditions(item_price, item):
+    """Item Prices of the exported price lists for the items of the PLU groups"""
+    return (
+        (item_price.price_list.isin(list(get_plu_export_price_lists())))
+        & (item_price.selling == 1)
+        & (item.item_group.isin(list(get_plu_item_groups())))
+        & (item.disabled == 0)
+        & (IfNull(item.custom_plu_code, 0) != 0)
+    )
+
+def get_next_price_change(date=None):
+    """
+    Get the first date after `date` on which the effective price of an exported item
+    changes, because one of its Item Prices starts or expires.
+    
+    Returns None when no Item Price of an exported item starts or expires later.
+    """
+    if not get_plu_item_groups():
+        return None
+    
+    date = getdate(date)
+    item_price = frappe.qb.DocType("Item Price")
+    item = frappe.qb.DocType("Item")
+    conditions = get_price_change_conditions(item_price, item)
+    
+    def first(field, condition):
+        return (
+            frappe.qb.from_(item_price)
+            .join(item)
+            .on(item.name == item_price.item_code)
+            .select(Min(field))
+            .where(conditions & condition)
+        ).run()[0][0]
+    
+    starts = first(item_price.valid_from, item_price.valid_from > date)
+    # A price valid up to a date stops applying the day after
+    ends = first(item_price.valid_upto, item_price.valid_upto >= date)
+    
+    changes = [getdate(starts) if starts else None, add_days(ends, 1) if ends else None]
+    return min((change for change in changes if change), default=None)
+
+def get_price_changed_items(from_date, to_date):
+    """
+    Get the exported items whose Item Prices start or expire from `from_date` up to
+    `to_date`, as a dict of price list -> item codes.
+    """
+    item_price = frappe.qb.DocType("Item Price")
+    item = frappe.qb.DocType("Item")
+    rows = (
+        frappe.qb.from_(item_price)
+        .join(item)
+        .on(item.name == item_price.item_code)
+        .select(item_price.price_list, item_price.item_code)
+        .distinct()
+        .where(
+            get_price_change_conditions(item_price, item)
+            & (
+                item_price.valid_from[getdate(from_date) : getdate(to_date)]
+                | item_price.valid_upto[add_days(from_date, -1) : add_days(to_date, -1)]
+            )
+        )
+    ).run()
+    
+    changes = {}
+    for price_list, item_code in rows:
+        changes.setdefault(price_list, set()).add(item_code)
+    
+    return changes
+
+def update_next_price_change(force=False):
+    """
+    Store the next date an exported item's price changes in Retail Settings.
+    
+    A date that has already come is kept until roll_over_plu_prices has exported its
+    changes, unless `force` is set.
+    """
+    pending = frappe.db.get_single_value("Retail Settings", "next_price_change")
+    if pending and getdate(pending) <= getdate() and not force:
+        return
+    
+    frappe.db.set_single_value("Retail Settings", "next_price_change", get_next_price_change())
+
+def roll_over_plu_prices():
+    """
+    Scheduler: export the items whose price started or expired since the stored next
+    price change.
+    
+    Only the changed items are queued, each for the price lists whose prices changed,
+    so only the export targets of those price lists are regenerated.
+    """
+    next_change = frappe.db.get_single_value("Retail Settings", "next_price_change")
+    if not next_change or getdate(next_change) > getdate() or not get_plu_item_groups():
+        return
+    
+    changes = get_price_changed_items(next_change, getdate())
+    for price_list, item_codes in changes.items():
+        queue_plu_export(item_codes, price_list)
+    
+    log_sampled("PLU Export: Price rollover queued %s items", sum(len(item_codes) for item_codes in changes.values()))
+    update_next_price_change(force=True)
+    frappe.db.commit()
+
+def reconcile_plu_items():
+    """
+    Scheduler: compare the Items and Item Prices modified since the last run with the
+    exported files, and queue the items whose lines differ.
+    
+    Catches the changes that skip the document hooks, like frappe.db.set_value or a
+    bulk update that sets `modified`. Hooked changes that are already exported match
+    their lines and are not queued again.
+    """
+    started = now_datetime()
+    since = frappe.db.get_single_value("Retail Settings", "last_plu_reconciliation")
+    plu_item_groups = get_plu_item_groups()
+    
+    # The first run only records where to start, the files come from a full export
+    if since and plu_item_groups:
+        item_codes = get_modified_plu_item_codes(since)
+        stale = get_stale_plu_items(plu_item_groups, item_codes) if item_codes else {}
+        for price_list, stale_item_codes in stale.items():
+            queue_plu_export(stale_item_codes, price_list)
+        
+        log_sampled(
+            "PLU Export: Reconciliation queued %s of %s modified items",
+            len(set().union(*stale.values())),
+            len(item_codes),
+        )
+    
+    frappe.db.set_single_value("Retail Settings", "last_plu_reconciliation", started)
+    frappe.db.commit()
+
+def get_modified_plu_item_codes(since):
+    """Get the codes of the Items, and the items of the exported Item Prices, modified since `since`"""
+    item = frappe.qb.DocType("Item")
+    item_price = frappe.qb.DocType("Item Price")
+    
+    item_codes = set(frappe.qb.from_(item).select(item.name).where(item.modified >= since).run(pluck=True))
+    item_codes.update(
+        frappe.qb.from_(item_price)
+        .select(item_price.item_code)
+        .distinct()
+        .where(
+            (item_price.modified >= since)
+            & (item_price.price_list.isin(list(get_plu_export_price_lists())))
+        )
+        .run(pluck=True)
+    )
+    
+    return item_codes
+
+def get_stale_plu_items(plu_item_groups, item_codes):
+    """
+    Render `item_codes` as the export would and compare them with the index of every
+    export target.
+    
+    Returns a dict of price list -> codes of the items whose lines differ, including
+    items that are exported but should not be anymore and the other way round.
+    """
+    items = [item for chunk in iter_plu_items(plu_item_groups, item_codes) for item in chunk]
+    counted_uoms = get_counted_uoms()
+    prices = {}
+    stale = {}
+    
+    for target in get_plu_export_targets():
+        index_path = get_plu_index_path(target.output_folder)
+        if not is_current_plu_index(index_path):
+            # The next export rebuilds this target from the full catalog
+            continue
+        
+        if target.price_list not in prices:
+            prices[target.price_list] = get_effective_prices([item.item_code for item in items], target.price_list)
+        target_prices = prices[target.price_list]
+        
+        expected = {make_plu_entry(item, target_prices.get(item.item_code), counted_uoms) for item in items}
+        with open(index_path) as index_file:
+            exported = {entry for entry in read_plu_index(index_file, ()) if entry.item_code in item_codes}
+        
+        if changed := {entry.item_code for entry in expected ^ exported}:
+            stale.setdefault(target.price_list, set()).update(changed)
+    
+    return stale
+
+def get_effective_prices(item_codes, price_list=PLU_PRICE_LIST, date=None):
+    """
+    Resolve the effective selling rate for every item in `item_codes`.
+    
+    Item Prices are read in batches of PLU_PRICE_BATCH_SIZE item codes, so an export costs
+    a fixed number of queries instead of one per item. For each item the price with the
+    newest valid_from wins, then the most recently modified one; prices that have not
+    started yet or have already expired are ignored.
+    
+    Returns a dict of item_code -> price_list_rate for items that have a valid price.
+    """
+    date = getdate(date)
+    item_codes = list(item_codes)
+    item_price = frappe.qb.DocType("Item Price")
+    prices = {}
+    
+    for start in range(0, len(item_codes), PLU_PRICE_BATCH_SIZE):
+        batch = item_codes[start:start + PLU_PRICE_BATCH_SIZE]
+        rows = (
+            frappe.qb.from_(item_price)
+            .select(item_price.item_code, item_price.price_list_rate)
+            .where(
+                (item_price.item_code.isin(batch))
+                & (item_price.price_list == price_list)
+                & (item_price.selling == 1)
+                & (IfNull(item_price.valid_from, "0001-01-01") <= date)
+                & (IfNull(item_price.valid_upto, "9999-12-31") >= date)
+            )
+            .orderby(item_price.item_code)
+            .orderby(item_price.valid_from, order=Order.desc)
+            .orderby(item_price.modified, order=Order.desc)
+        ).run(as_dict=True)
+        
+        # Rows are sorted by precedence within each item, so the first one wins
+        for row in rows:
+            prices.setdefault(row.item_code, row.price_list_rate)
+    
+    return prices
+
+def make_plu_entry(item, item_price, counted_uoms):
+    """Build the export snapshot of an item, shared by every scale format"""
+    # Tabs and line breaks would break the index and the line based formats
+    name = " ".join((item.item_name or "").split())
+    
+    # Use Item Price if available, otherwise fallback to standard_rate
+    price = flt(item_price if item_price else item.standard_rate)
+    
+    return PLUEntry(
+        int(item.custom_plu_code),
+        item.item_code,
+        name,
+        price,
+        item.stock_uom or "",
+        item.stock_uom not in counted_uoms,
+    )
+
+def get_counted_uoms():
+    """UOMs sold by the piece; items in any other UOM are weighed"""
+    return set(frappe.get_all("UOM", filters={"must_be_whole_number": 1}, pluck="name"))
+
+class DigestWriter:
+    """Text file wrapper computing the SHA-256 of the UTF-8 content written through it"""
+    
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.sha256()
+        self.unchanged = False
+    
+    def write(self, text):
+        self.hash.update(text.encode())
+        return self.file.write(text)
+    
+    @property
+    def digest(self):
+        return self.hash.hexdigest()
+
+@contextmanager
+def atomic_write(file_path, previous_digest=None):
+    """
+    Open a temporary file next to `file_path` for writing and move it into place on success.
+    
+    os.replace is atomic on POSIX, so a scale polling the file sees either the old or
+    the new content, never a partially written file. Yields a DigestWriter: when the
+    digest of the new content equals `previous_digest` the existing file is kept, so
+    its modification time and the caches of polling clients stay valid.
+    """
+    dir_path = os.path.dirname(file_path)
+    if not os.path.exists(dir_path):
+        try:
+            os.makedirs(dir_path, exist_ok=True)
+        except Exception as e:
+            frappe.logger().error(f"PLU Export: Cannot create directory {dir_path}: {str(e)}")
+            raise
+    
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=f".{os.path.basename(file_path)}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", buffering=PLU_EXPORT_BUFFER_SIZE) as f:
+            writer = DigestWriter(f)
+            yield writer
+            writer.unchanged = writer.digest == previous_digest and os.path.exists(file_path)
+            if not writer.unchanged:
+                f.flush()
+                os.fsync(f.fileno())
+        if writer.unchanged:
+            os.unlink(tmp_path)
             return
+        # mkstemp creates the file as 0600, the web server must be able to serve it
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def iter_plu_items(plu_item_groups, item_codes=None):
+    """
+    Yield the enabled items of the PLU groups that have a PLU code, in chunks.
+    
+    Items are read PLU_EXPORT_CHUNK_SIZE at a time with keyset pagination on
+    (custom_plu_code, name), so memory use does not grow with the catalog. Pass
+    `item_codes` to read only those items.
+    """
+    item = frappe.qb.DocType("Item")
+    conditions = (
+        (item.item_group.isin(list(plu_item_groups)))
+        & (item.disabled == 0)
+        & (IfNull(item.custom_plu_code, 0) != 0)
+    )
+    if item_codes is not None:
+        conditions &= item.name.isin(list(item_codes))
+    
+    last = None
+    while True:
+        query = (
+            frappe.qb.from_(item)
+            .select(
+                item.name.as_("item_code"),
+                item.item_name,
+                item.standard_rate,
+                item.custom_plu_code,
+                item.stock_uom,
+            )
+            .where(conditions)
+            .orderby(item.custom_plu_code)
+            .orderby(item.name)
+            .limit(PLU_EXPORT_CHUNK_SIZE)
+        )
+        if last:
+            query = query.where(
+                (item.custom_plu_code > last.custom_plu_code)
+                | ((item.custom_plu_code == last.custom_plu_code) & (item.name > last.item_code))
+            )
+        
+        chunk = query.run(as_dict=True)
+        if not chunk:
+            return
+        
+        yield chunk
         
-        # Fetch all items from the PLU group and its descendants
-        items = frappe.get_all("Item", 
-            fields=["item_code", "item_name", "standard_rate", "custom_plu_code"],
-            filters={"item_group": ["in", plu_item_groups], "disabled": 0},
-            order_by="custom_plu_code asc") # Order by PLU code
+        if len(chunk) < PLU_EXPORT_CHUNK_SIZE:
+            return
+        last = chunk[-1]
+
+def is_current_plu_index(index_path):
+    """Whether the index exists and was written in the current entry layout"""
+    if not os.path.exists(index_path):
+        return False
+    
+    with open(index_path) as index_file:
+        return index_file.readline() == PLU_INDEX_HEADER
+
+def read_plu_index(index_file, skip_item_codes):
+    """Yield the PLUEntry tuples of the index, leaving out `skip_item_codes`"""
+    index_file.readline()  # header
+    for raw in index_file:
+        plu_code, item_code, name, price, stock_uom, is_weighed = raw.rstrip("\n").split("\t")
+        if item_code not in skip_item_codes:
+            yield PLUEntry(int(plu_code), item_code, name, float(price), stock_uom, is_weighed == "1")
+
+def write_plu_files(entries, index_path, outputs, manifest_path):
+    """
+    Write the index and the file of every scale format from sorted entries, in one pass.
+    
+    `outputs` is a list of (scale_format, file_path). All files are replaced atomically,
+    and the files whose content digest is unchanged are not replaced at all. The
+    manifest gets a new version only when a file changed. Returns the number of
+    entries written. Does not use the database, so it can run in a worker thread.
+    """
+    manifest = read_plu_manifest(manifest_path)
+    previous_files = manifest.get("files") or {}
+    
+    count = 0
+    with ExitStack() as stack:
+        index_file = stack.enter_context(atomic_write(index_path))
+        files = [
+            (
+                scale_format,
+                stack.enter_context(
+                    atomic_write(file_path, previous_files.get(os.path.basename(file_path), {}).get("sha256"))
+                ),
+            )
+            for scale_format, file_path in outputs
+        ]
         
+        index_file.write(PLU_INDEX_HEADER)
+        for entry in entries:
+            index_file.write(
+                f"{entry.plu_code}\t{entry.item_code}\t{entry.item_name}\t{entry.price!r}\t"
+                f"{entry.stock_uom}\t{int(entry.is_weighed)}\n"
+            )
+            for scale_format, output in files:
+                line = scale_format.render(entry)
+                # No line separator after the last line
+                output.write(f"{scale_format.line_separator}{line}" if count else line)
+            count += 1
+    
+    write_plu_manifest(manifest_path, manifest, count, outputs, [output for _scale_format, output in files])
+    return count
+
+def write_plu_manifest(manifest_path, manifest, count, outputs, writers):
+    """Write a new manifest version when the file set or any file content changed"""
+    files = {
+        os.path.basename(file_path): {
+            "format": scale_format.name,
+            "sha256": writer.digest,
+            "size": os.path.getsize(file_path),
+        }
+        for (scale_format, file_path), writer in zip(outputs, writers, strict=True)
+    }
+    if files == manifest.get("files") and count == manifest.get("rows"):
+        return
+    
+    with atomic_write(manifest_path) as manifest_file:
+        json.dump(
+            {
+                "version": (manifest.get("version") or 0) + 1,
+                "rows": count,
+                "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "files": files,
+            },
+            manifest_file,
+            indent=1,
+        )
+
+def get_plu_target_outputs(target, scale_formats):
+    """Get the (scale_format, file_path) pairs written for an export target"""
+    return [
+        (scale_format, get_scale_export_path(scale_format.file_name, target.output_folder))
+        for scale_format in scale_formats
+    ]
+
+def is_current_plu_target(target, scale_formats):
+    """Whether the index and every file of the target exist, so changes can be spliced in"""
+    return is_current_plu_index(get_plu_index_path(target.output_folder)) and all(
+        os.path.exists(file_path) for _scale_format, file_path in get_plu_target_outputs(target, scale_formats)
+    )
+
+def splice_plu_target(changed, item_codes, index_path, outputs, manifest_path):
+    """Replace the entries of `item_codes` in the files of a target by `changed`"""
+    # Both inputs are sorted, so the merge keeps the files ordered by PLU code
+    with open(index_path) as index_file:
+        return write_plu_files(
+            heapq.merge(read_plu_index(index_file, item_codes), changed), index_path, outputs, manifest_path
+        )
+
+def iter_plu_queue(entries_queue):
+    """Yield the entries put on a queue in chunks, until the end marker"""
+    while True:
+        chunk = entries_queue.get()
+        if chunk is None:
+            return
+        if chunk is PLU_EXPORT_ABORT:
+            raise PLUExportAborted
+        yield from chunk
+
+def write_plu_files_from_queue(entries_queue, index_path, outputs, manifest_path):
+    entries = iter_plu_queue(entries_queue)
+    try:
+        return write_plu_files(entries, index_path, outputs, manifest_path)
+    finally:
+        # Keep consuming after a failure, so the reading thread never blocks on a full queue
+        with suppress(PLUExportAborted):
+            for _entry in entries:
+                pass
+
+def export_changed_plu_items(plu_item_groups, changes, scale_formats):
+    """
+    Splice changed items into the files of the targets in `changes`, a dict of
+    target -> item codes.
+    
+    The items are read once for all targets and priced once per price list, then
+    the targets are written concurrently by PLU_EXPORT_WORKERS threads. Returns a
+    dict of target -> number of entries written.
+    """
+    item_codes = set().union(*changes.values())
+    items = [item for chunk in iter_plu_items(plu_item_groups, item_codes) for item in chunk]
+    prices = {
+        price_list: get_effective_prices([item.item_code for item in items], price_list)
+        for price_list in {target.price_list for target in changes}
+    }
+    counted_uoms = get_counted_uoms()
+    log_sampled("PLU Export: Re-rendered %s of %s changed items for %s targets", len(items), len(item_codes), len(changes))
+    set_gauge("plu_export_changed_items", len(item_codes))
+    
+    with ThreadPoolExecutor(max_workers=min(PLU_EXPORT_WORKERS, len(changes))) as pool:
+        futures = {}
+        for target, target_item_codes in changes.items():
+            target_prices = prices[target.price_list]
+            changed = sorted(
+                make_plu_entry(item, target_prices.get(item.item_code), counted_uoms)
+                for item in items
+                if item.item_code in target_item_codes
+            )
+            futures[target] = pool.submit(
+                splice_plu_target,
+                changed,
+                target_item_codes,
+                get_plu_index_path(target.output_folder),
+                get_plu_target_outputs(target, scale_formats),
+                get_plu_manifest_path(target.output_folder),
+            )
+    
+    return {target: future.result() for target, future in futures.items()}
+
+def export_full_plu_targets(plu_item_groups, targets, scale_formats):
+    """
+    Rebuild the files of `targets` from the full catalog, in one pass over the items.
+    
+    The items are read and priced here chunk by chunk, once per price list, and each
+    target's entries are handed to its own writer thread through a bounded queue, so
+    the targets are written concurrently while memory use stays bounded. Returns a
+    dict of target -> number of entries written, empty when the PLU groups have no
+    items.
+    """
+    chunks = iter_plu_items(plu_item_groups)
+    
+    # Peek at the first chunk so an empty group does not replace the existing files
+    first = next(chunks, None)
+    if first is None:
         plu_group = get_plu_group()
-        frappe.logger().info(f"PLU Export: Found {len(items)} items in group '{plu_group}' and its descendants")
+        frappe.logger().warning(f"PLU Export: No items found in PLU group '{plu_group}' and its descendants")
+        return {}
+    
+    counted_uoms = get_counted_uoms()
+    price_lists = {target.price_list for target in targets}
+    queues = {target: queue.Queue(maxsize=PLU_EXPORT_QUEUE_SIZE) for target in targets}
+    
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        futures = {
+            target: pool.submit(
+                write_plu_files_from_queue,
+                queues[target],
+                get_plu_index_path(target.output_folder),
+                get_plu_target_outputs(target, scale_formats),
+                get_plu_manifest_path(target.output_folder),
+            )
+            for target in targets
+        }
         
-        if not items:
-            frappe.logger().warning(f"PLU Export: No items found in PLU group '{plu_group}' and its descendants")
+        end = None
+        try:
+            for items in itertools.chain([first], chunks):
+                item_codes = [item.item_code for item in items]
+                prices = {price_list: get_effective_prices(item_codes, price_list) for price_list in price_lists}
+                for target in targets:
+                    target_prices = prices[target.price_list]
+                    queues[target].put(
+                        [make_plu_entry(item, target_prices.get(item.item_code), counted_uoms) for item in items]
+                    )
+        except BaseException:
+            # The writers discard their temporary files instead of publishing a partial export
+            end = PLU_EXPORT_ABORT
+            raise
+        finally:
+            for entries_queue in queues.values():
+                entries_queue.put(end)
+    
+    return {target: future.result() for target, future in futures.items()}
+
+@instrument("plu_export")
+def export_loose_items_to_plu(item_codes=None):
+    """
+    Export all items from the PLU group and its descendants to the files of every export target.
+    
+    `item_codes` is an iterable of changed item codes, or a dict of price list -> item
+    codes where the None key holds the items changed for every price list. Only the
+    targets whose price list is affected are regenerated: where the index and files of
+    a target exist the changed items are spliced in, otherwise the target is rebuilt
+    from the full catalog. Pass nothing to rebuild every target.
+    
+    Returns True if any file was written, None if there was nothing to write. Errors
+    are logged and raised.
+    """
+    try:
+        # Get the PLU group and all its descendants
+        plu_item_groups = get_plu_item_groups()
+        if not plu_item_groups:
+            frappe.logger().warning("PLU Export: No PLU group configured in Retail Settings")
             return
         
-        lines = []
-        current_date = frappe.utils.today()
+        scale_formats = get_enabled_scale_formats()
+        if item_codes is not None and not isinstance(item_codes, dict):
+            item_codes = {None: item_codes}
         
-        # Create the lines using custom_plu_code as PLU
-        for item in items:
-            # Skip items without a PLU code
-            if not item.custom_plu_code:
-                frappe.logger().warning(f"PLU Export: Skipping item {item.item_code} - no custom_plu_code set")
+        full_targets = []
+        changes = {}
+        for target in get_plu_export_targets():
+            if item_codes is None:
+                full_targets.append(target)
                 continue
             
-            name = item.item_name[:20] if item.item_name else ""
-            
-            # Get the latest Item Price for this item from "Standard Selling" price list
-            # Try to get the most recent active Item Price
-            # Build filters for valid Item Prices
-            price_filters = {
-                "item_code": item.item_code,
-                "price_list": "Standard Selling",
-                "selling": 1,
-                "valid_from": ["<=", current_date]
-            }
-            
-            # Get Item Prices that are either not expired or have no expiry
-            item_prices = frappe.get_all(
-                "Item Price",
-                fields=["price_list_rate", "valid_upto"],
-                filters=price_filters,
-                order_by="valid_from desc, modified desc"
-            )
-            
-            # Filter for valid prices (not expired)
-            valid_prices = [
-                ip for ip in item_prices 
-                if not ip.valid_upto or ip.valid_upto >= current_date
-            ]
-            
-            item_price = valid_prices[0].price_list_rate if valid_prices else None
-            
-            # Use Item Price if available, otherwise fallback to standard_rate
-            price = item_price if item_price else (item.standard_rate or 0)
-            
-            # FORMAT: PLU,itemcode,name,price,unit
-            # Result: 1,00001,Banana,45,0
-            line = f"{item.custom_plu_code},{item.item_code},{name},{price},0"
-            lines.append(line)
-        
-        # Get file path in site's public folder
-        file_path = get_plu_export_path()
+            target_item_codes = set(item_codes.get(None, ())) | set(item_codes.get(target.price_list, ()))
+            if not target_item_codes:
+                continue
+            if is_current_plu_target(target, scale_formats):
+                changes[target] = target_item_codes
+            else:
+                full_targets.append(target)
         
-        # Ensure directory exists
-        dir_path = os.path.dirname(file_path)
-        if not os.path.exists(dir_path):
-            try:
-                os.makedirs(dir_path, exist_ok=True)
-            except Exception as e:
-                frappe.logger().error(f"PLU Export: Cannot create directory {dir_path}: {str(e)}")
-                raise
+        if not changes and not full_targets:
+            log_sampled("PLU Export: Skipping - no export target affected")
+            return
         
-        frappe.logger().info(f"PLU Export: Writing {len(lines)} lines to {file_path}")
+        counts = {}
+        if changes:
+            counts.update(export_changed_plu_items(plu_item_groups, changes, scale_formats))
+        # Targets are rebuilt in groups of PLU_EXPORT_WORKERS, each group sharing one pass over the items
+        for start in range(0, len(full_targets), PLU_EXPORT_WORKERS):
+            counts.update(
+                export_full_plu_targets(plu_item_groups, full_targets[start : start + PLU_EXPORT_WORKERS], scale_formats)
+            )
         
-        # Write the file
-        with open(file_path, "w") as f:
-            f.write("\n".join(lines))
+        if not counts:
+            return
         
-        frappe.logger().info(f"PLU Export: Successfully wrote file to {file_path}")
+        file_paths = [
+            file_path
+            for target in counts
+            for _scale_format, file_path in get_plu_target_outputs(target, scale_formats)
+        ]
+        log_sampled("PLU Export: Successfully wrote %s lines for %s targets", sum(counts.values()), len(counts))
+        set_gauge("plu_export_lines", sum(counts.values()))
+        set_gauge("plu_export_bytes", sum(os.path.getsize(file_path) for file_path in file_paths))
+        return True
         
     except Exception as e:
         error_msg = f"PLU Export Failed: {str(e)}\n{frappe.get_traceback()}"
         frappe.log_error(title="PLU Export Failed", message=error_msg)
-        frappe.logger().error(error_msg)
\ No newline at end of file
+        frappe.logger().error(error_msg)
+        # The caller puts the changes back in the queue
+        raise